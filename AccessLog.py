@@ -0,0 +1,308 @@
+"""
+An access log that never makes a request wait for the disk.
+Usage:
+Construction- AccessLog(path, log_format=COMBINED_FORMAT), path may contain
+              {pid} so every prefork worker writes a file of its own.
+Logging- log(record) puts the record of a request in a ring buffer of
+         buffer_size records, taking a lock only for the append. When the
+         buffer is full the record is dropped and counted (see get_stats).
+Writing- start() starts a daemon thread that takes the buffered records every
+         flush_interval seconds (or sooner when the buffer fills up), formats
+         them and writes them in a single write. When the file exceeds
+         max_size it is renamed to path.1 (path.1 to path.2 and so on, up to
+         backup_count files) and a new file is started.
+         close() stops the thread and writes what is left.
+Formats- COMMON_FORMAT and COMBINED_FORMAT are those of Apache, followed by
+         the duration of the request in microseconds (Apache's %D).
+         JSON_FORMAT writes a JSON object per line.
+"""
+import json
+import os
+import sys
+import threading
+import time
+from server_constants import ACCESS_LOG_BUFFER_SIZE, ACCESS_LOG_FLUSH_INTERVAL, \
+    ACCESS_LOG_MAX_SIZE, ACCESS_LOG_BACKUP_COUNT
+
+
+COMMON_FORMAT = "common"
+COMBINED_FORMAT = "combined"
+JSON_FORMAT = "json"
+# a missing field of the Apache formats
+EMPTY_FIELD = "-"
+# not taken from the locale (strftime's %b), so the log is the same everywhere
+_MONTHS = ("Jan", "Feb", "Mar", "Apr", "May", "Jun",
+           "Jul", "Aug", "Sep", "Oct", "Nov", "Dec")
+
+
+class AccessRecord(object):
+    """
+    What is known of a request once its response was sent, it is only
+    formatted by the writer thread
+    """
+    __slots__ = ("remote_host", "timestamp", "method", "uri", "version", "status",
+                 "bytes_sent", "referer", "user_agent", "duration")
+
+    def __init__(self, remote_host, timestamp, method, uri, version, status, bytes_sent,
+                 referer, user_agent, duration):
+        """
+        :param timestamp: The time the response was sent
+        :param method: None (as well as uri and version) if the request
+                       couldn't be parsed
+        :param status: The status code (a string), None if no response was sent
+        :param bytes_sent: The size of the response
+        :param referer: The Referer header, None if there was none
+        :param user_agent: The User-Agent header, None if there was none
+        :param duration: Seconds from reading the request to sending the response
+        """
+        self.remote_host = remote_host
+        self.timestamp = timestamp
+        self.method = method
+        self.uri = uri
+        self.version = version
+        self.status = status
+        self.bytes_sent = bytes_sent
+        self.referer = referer
+        self.user_agent = user_agent
+        self.duration = duration
+
+
+class AccessLog(object):
+    def __init__(self, path, log_format=COMBINED_FORMAT, buffer_size=ACCESS_LOG_BUFFER_SIZE,
+                 flush_interval=ACCESS_LOG_FLUSH_INTERVAL, max_size=ACCESS_LOG_MAX_SIZE,
+                 backup_count=ACCESS_LOG_BACKUP_COUNT, debug=0):
+        """
+        :param path: The log file, {pid} is replaced by the id of the process
+        :param log_format: COMMON_FORMAT, COMBINED_FORMAT or JSON_FORMAT
+        :param buffer_size: The number of records kept until they're written
+        :param flush_interval: Seconds between two writes of the buffer
+        :param max_size: The size in bytes the file is rotated at, 0 never
+                         rotates it
+        :param backup_count: The number of rotated files kept
+        may raise ValueError
+        """
+        if log_format not in FORMATTERS:
+            raise ValueError("Unknown access log format {}".format(log_format))
+        if buffer_size < 1:
+            raise ValueError("buffer_size must be positive, got {}".format(buffer_size))
+        self._path_template = path
+        self._format = FORMATTERS[log_format]
+        self._flush_interval = flush_interval
+        self._max_size = max_size
+        self._backup_count = backup_count
+        self._debug = debug
+        # the ring buffer, _count records starting at _head
+        self._records = [None] * buffer_size
+        self._head = 0
+        self._count = 0
+        self._lock = threading.Lock()
+        # set to wake the writer up before flush_interval passes
+        self._wake_event = threading.Event()
+        self._stop_event = threading.Event()
+        self._writer = None
+        self._file = None
+        self._path = None
+        self._file_size = 0
+        self._dropped = 0
+        self._written = 0
+
+    def log(self, record):
+        """
+        Buffers a record, never blocks on the disk
+        :type record: AccessRecord
+        :return: None
+        """
+        capacity = len(self._records)
+        with self._lock:
+            if self._count == capacity:
+                self._dropped += 1
+                return
+            self._records[(self._head + self._count) % capacity] = record
+            self._count += 1
+            # the writer is woken up early so the buffer doesn't overflow
+            should_wake = self._count == (capacity + 1) // 2
+        if should_wake:
+            self._wake_event.set()
+
+    def get_stats(self):
+        """
+        :rtype: dict
+        :return: The log's counters
+        """
+        with self._lock:
+            return {"written": self._written,
+                    "dropped": self._dropped,
+                    "buffered": self._count,
+                    "buffer_size": len(self._records)}
+
+    def start(self):
+        """
+        Starts the writer thread, called by every engine when it starts so
+        each prefork worker runs a writer of its own
+        :return: None
+        """
+        if self._writer is not None and self._writer.is_alive():
+            return
+
+        self._stop_event.clear()
+        self._writer = threading.Thread(target=self._write_loop, name="access-log-writer")
+        self._writer.daemon = True
+        self._writer.start()
+
+    def close(self):
+        """
+        Stops the writer, writes the buffered records and closes the file
+        :return: None
+        """
+        self._stop_event.set()
+        self._wake_event.set()
+        if self._writer is not None:
+            self._writer.join()
+            self._writer = None
+        self.flush()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def flush(self):
+        """
+        Writes the buffered records, called by the writer thread
+        :return: None
+        """
+        records = self._take_records()
+        if not records:
+            return
+
+        data = "".join(self._format(record) + "\n" for record in records)
+        try:
+            self._write(data)
+        except (IOError, OSError) as err:
+            if self._debug >= 0:
+                print >> sys.stderr, "Couldn't write the access log: {}".format(err)
+            with self._lock:
+                self._dropped += len(records)
+            return
+        with self._lock:
+            self._written += len(records)
+
+    def _write_loop(self):
+        while not self._stop_event.is_set():
+            self._wake_event.wait(self._flush_interval)
+            self._wake_event.clear()
+            self.flush()
+
+    def _take_records(self):
+        """
+        :return: a list of the buffered records, the buffer is emptied
+        """
+        capacity = len(self._records)
+        with self._lock:
+            head, count = self._head, self._count
+            end = head + count
+            if end <= capacity:
+                records = self._records[head:end]
+            else:
+                records = self._records[head:] + self._records[:end - capacity]
+            self._head = end % capacity
+            self._count = 0
+        return records
+
+    def _write(self, data):
+        """
+        may raise IOError, OSError
+        """
+        path = self._path_template.format(pid=os.getpid())
+        if self._file is None or path != self._path:
+            # a forked worker doesn't keep writing to its parent's file
+            self._open(path)
+        elif self._max_size and self._file_size and \
+                self._file_size + len(data) > self._max_size:
+            self._rotate()
+        self._file.write(data)
+        self._file.flush()
+        self._file_size += len(data)
+
+    def _open(self, path):
+        if self._file is not None:
+            self._file.close()
+        self._path = path
+        self._file = open(path, "ab")
+        self._file_size = os.fstat(self._file.fileno()).st_size
+
+    def _rotate(self):
+        self._file.close()
+        self._file = None
+        for index in xrange(self._backup_count - 1, 0, -1):
+            source = "{}.{}".format(self._path, index)
+            if os.path.exists(source):
+                os.rename(source, "{}.{}".format(self._path, index + 1))
+        if self._backup_count > 0:
+            os.rename(self._path, self._path + ".1")
+        else:
+            os.remove(self._path)
+        self._open(self._path)
+
+
+def format_common(record):
+    """
+    :type record: AccessRecord
+    :return: the record in the Common Log Format followed by its duration
+    """
+    return "{} - - [{}] {} {} {} {}".format(
+        record.remote_host, _format_time(record.timestamp), _format_request_line(record),
+        record.status or EMPTY_FIELD, record.bytes_sent, int(record.duration * 1000000))
+
+
+def format_combined(record):
+    """
+    :type record: AccessRecord
+    :return: the record in the Combined Log Format followed by its duration
+    """
+    return "{} - - [{}] {} {} {} {} {} {}".format(
+        record.remote_host, _format_time(record.timestamp), _format_request_line(record),
+        record.status or EMPTY_FIELD, record.bytes_sent, _quote(record.referer),
+        _quote(record.user_agent), int(record.duration * 1000000))
+
+
+def format_json(record):
+    """
+    :type record: AccessRecord
+    :return: the record as a JSON object
+    """
+    return json.dumps({"remote_host": record.remote_host,
+                       "time": _format_time(record.timestamp),
+                       "method": record.method,
+                       "uri": record.uri,
+                       "version": record.version,
+                       "status": int(record.status) if record.status else None,
+                       "bytes": record.bytes_sent,
+                       "referer": record.referer,
+                       "user_agent": record.user_agent,
+                       "duration": record.duration}, sort_keys=True)
+
+
+FORMATTERS = {COMMON_FORMAT: format_common,
+              COMBINED_FORMAT: format_combined,
+              JSON_FORMAT: format_json}
+
+
+def _format_time(timestamp):
+    """
+    :return: the time in the format of the Apache logs e.g
+             "10/Oct/2000:13:55:36 +0000"
+    """
+    t = time.gmtime(timestamp)
+    return "{:02d}/{}/{:04d}:{:02d}:{:02d}:{:02d} +0000".format(
+        t.tm_mday, _MONTHS[t.tm_mon - 1], t.tm_year, t.tm_hour, t.tm_min, t.tm_sec)
+
+
+def _format_request_line(record):
+    if record.method is None:
+        return _quote(None)
+    return _quote("{} {} {}".format(record.method, record.uri, record.version))
+
+
+def _quote(value):
+    if value is None:
+        return '"{}"'.format(EMPTY_FIELD)
+    return '"{}"'.format(value.replace("\\", "\\\\").replace('"', '\\"'))
@@ -0,0 +1,229 @@
+"""
+Compressed variants of the static files.
+The encoding of a response is negotiated from the request's Accept-Encoding,
+gzip is always available and brotli (br) when the brotli package is installed.
+A precompressed sibling in root (e.g style.css.gz next to style.css) that is
+at least as new as the file is preferred, otherwise the file is compressed once
+and the result is kept in a bounded LRU cache keyed by the file, its mtime and
+the encoding. Small files and types that are already compressed (images,
+archives...) are sent as they are.
+The cache is thread safe.
+"""
+import collections
+import os
+import threading
+import time
+import zlib
+from server_constants import COMPRESSION_CACHE_SIZE, COMPRESSION_MIN_SIZE, \
+    COMPRESSION_MAX_SIZE, COMPRESSION_LEVEL, COMPRESSIBLE_TYPES, \
+    STATIC_CACHE_REVALIDATE_INTERVAL
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+GZIP = "gzip"
+BROTLI = "br"
+# window bits that make zlib write a gzip header and trailer
+GZIP_WBITS = 16 + zlib.MAX_WBITS
+# the file extension of a precompressed sibling of every encoding
+SIBLING_EXTENSIONS = {GZIP: ".gz", BROTLI: ".br"}
+# supported encodings, the preferred first
+ENCODINGS = (BROTLI, GZIP) if brotli is not None else (GZIP,)
+
+
+def negotiate_encoding(accept_encoding):
+    """
+    :type accept_encoding: str
+    :param accept_encoding: The value of the Accept-Encoding header
+    :return: The supported encoding the client prefers, or None if
+             the response should not be encoded
+    """
+    qualities = {}
+    for item in accept_encoding.split(","):
+        coding, _, parameters = item.partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+
+        quality = 1.0
+        parameters = parameters.strip()
+        if parameters.startswith("q="):
+            try:
+                quality = float(parameters[2:])
+            except ValueError:
+                quality = 0.0
+        qualities[coding] = quality
+
+    best_encoding, best_quality = None, 0.0
+    for encoding in ENCODINGS:
+        quality = qualities.get(encoding, qualities.get("*", 0.0))
+        # on a tie the encoding that comes first in ENCODINGS wins
+        if quality > best_quality:
+            best_encoding, best_quality = encoding, quality
+    return best_encoding
+
+
+def is_compressible(content_type, size):
+    """
+    :return: True if a file of that type and size is worth compressing
+    """
+    if size < COMPRESSION_MIN_SIZE:
+        return False
+    return content_type.startswith("text/") or content_type in COMPRESSIBLE_TYPES
+
+
+def compress(data, encoding, level=COMPRESSION_LEVEL):
+    """
+    :param data: The content of a file
+    :param encoding: GZIP or BROTLI
+    :return: The encoded data
+    """
+    if encoding == BROTLI:
+        return brotli.compress(data)
+
+    compressor = zlib.compressobj(level, zlib.DEFLATED, GZIP_WBITS)
+    return compressor.compress(data) + compressor.flush()
+
+
+class CompressionCache(object):
+    def __init__(self, max_size=COMPRESSION_CACHE_SIZE, max_file_size=COMPRESSION_MAX_SIZE,
+                 revalidate_interval=STATIC_CACHE_REVALIDATE_INTERVAL):
+        """
+        :type max_size: int
+        :param max_size: The maximal total size of the compressed variants in
+                         bytes, 0 disables compressing on the fly (precompressed
+                         siblings are still used)
+        :param max_file_size: Larger files are only sent compressed if they
+                              have a precompressed sibling
+        :param revalidate_interval: Seconds the result of looking for a
+                                    sibling is trusted
+        """
+        self._max_size = max_size
+        self._max_file_size = max_file_size
+        self._revalidate_interval = revalidate_interval
+        # (real path, encoding): (mtime, compressed data), least recently used first
+        self._variants = collections.OrderedDict()
+        self._size = 0
+        # (real path, encoding): (mtime of the file, sibling path or None, checked at)
+        self._siblings = {}
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    def can_compress(self, size):
+        """
+        :param size: The size of a file
+        :return: True if a file of that size may be compressed on the fly
+        """
+        return 0 < self._max_size and size <= self._max_file_size
+
+    def get_sibling(self, real_path, encoding, mtime, manifest=None):
+        """
+        :param real_path: The real path of the file
+        :param encoding: The negotiated encoding
+        :param mtime: The modification time of the file
+        :type manifest: DocumentManifest.DocumentManifest
+        :param manifest: if given siblings are looked for in it instead of
+                         the file system
+        :return: The path of an up to date precompressed sibling or None
+        """
+        sibling_path = real_path + SIBLING_EXTENSIONS[encoding]
+        if manifest is not None:
+            sibling_info = manifest.get(sibling_path)
+            if sibling_info is not None and sibling_info.mtime >= mtime:
+                return sibling_path
+            return None
+
+        key = (real_path, encoding)
+        now = time.time()
+        cached = self._siblings.get(key)
+        if cached is not None and cached[0] == mtime and \
+                now - cached[2] < self._revalidate_interval:
+            return cached[1]
+
+        try:
+            sibling_stat = os.stat(sibling_path)
+        except OSError:
+            sibling_stat = None
+        if sibling_stat is None or sibling_stat.st_mtime < mtime:
+            sibling_path = None
+
+        self._siblings[key] = (mtime, sibling_path, now)
+        return sibling_path
+
+    def get(self, real_path, encoding, mtime, load_content):
+        """
+        Returns the compressed variant of a file, compressing it only if the
+        cached variant is missing or older than the file
+        :param real_path: The real path of the file
+        :param encoding: The negotiated encoding
+        :param mtime: The modification time of the file
+        :type load_content: function
+        :param load_content: called without arguments to get the content of
+                             the file when it has to be compressed
+        :return: The compressed content
+        may raise whatever load_content raises
+        """
+        key = (real_path, encoding)
+        with self._lock:
+            variant = self._variants.get(key)
+            if variant is not None and variant[0] == mtime:
+                del self._variants[key]
+                self._variants[key] = variant
+                self._hits += 1
+                return variant[1]
+            self._misses += 1
+
+        # compressing takes a while, other threads may use the cache meanwhile
+        data = compress(load_content(), encoding)
+        with self._lock:
+            if key in self._variants:
+                self._remove(key)
+            if len(data) <= self._max_size:
+                while self._variants and self._size + len(data) > self._max_size:
+                    self._remove(next(iter(self._variants)))
+                self._variants[key] = (mtime, data)
+                self._size += len(data)
+        return data
+
+    def get_stats(self):
+        """
+        :rtype: dict
+        :return: The cache's counters
+        """
+        with self._lock:
+            return {"hits": self._hits,
+                    "misses": self._misses,
+                    "entries": len(self._variants),
+                    "size": self._size,
+                    "max_size": self._max_size}
+
+    def invalidate(self, real_path=None):
+        """
+        Removes the variants of a single file or of all of them
+        :return: None
+        """
+        with self._lock:
+            if real_path is None:
+                self._variants.clear()
+                self._size = 0
+                self._siblings = {}
+                return
+
+            for encoding in ENCODINGS:
+                key = (real_path, encoding)
+                if key in self._variants:
+                    self._remove(key)
+                self._siblings.pop(key, None)
+
+                # the sibling of another file was changed
+                extension = SIBLING_EXTENSIONS[encoding]
+                if real_path.endswith(extension):
+                    self._siblings.pop((real_path[:-len(extension)], encoding), None)
+
+    def _remove(self, key):
+        _, data = self._variants.pop(key)
+        self._size -= len(data)
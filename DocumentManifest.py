@@ -0,0 +1,261 @@
+"""
+An in-memory manifest of the files served from the server's root.
+The root is scanned once and the size, mtime, MIME type, ETag and restricted
+flag of every file are kept in memory, so a request learns whether a file
+exists and what its metadata is without a stat call.
+Usage:
+Construction- provide the server's root and its PathResolver, optionally a
+              file the manifest is snapshotted to:
+              DocumentManifest(root, resolver, snapshot_path="/tmp/root.json")
+Loading- load() reads the snapshot if there is one for the same root and
+         scans the root otherwise, the result is written back to the snapshot.
+         A loaded snapshot is trusted until the watcher's first scan.
+Watching- start_watcher() polls the root every poll_interval seconds from a
+          daemon thread. Only the files that were added, removed or modified
+          are updated and the listeners (see add_listener) are called with
+          their real paths.
+"""
+import json
+import mimetypes
+import os
+import os.path as path
+import threading
+from server_constants import MANIFEST_POLL_INTERVAL, DEFAULT_CONTENT_TYPE
+
+
+# snapshots of older versions are ignored (version 1 had ETags of whole seconds)
+SNAPSHOT_VERSION = 2
+
+
+def guess_content_type(file_path):
+    """
+    :return: The MIME type of a file according to its extension
+    """
+    content_type, encoding = mimetypes.guess_type(file_path, strict=False)
+    if content_type is None or encoding is not None:
+        return DEFAULT_CONTENT_TYPE
+    return content_type
+
+
+def make_etag(mtime, size):
+    """
+    A strong validator derived from the metadata so the file doesn't have
+    to be read. The mtime is taken in microseconds, a file rewritten with the
+    same size in the same second still gets a new ETag (as long as the file
+    system keeps sub-second times), so If-Range never mixes two versions.
+    :return: the value of an ETag header e.g "5a1f3c02e4a1c-4d2"
+    """
+    return '"{:x}-{:x}"'.format(int(mtime * 1000000), size)
+
+
+class FileInfo(object):
+    __slots__ = ("size", "mtime", "content_type", "etag", "restricted")
+
+    def __init__(self, size, mtime, content_type, etag, restricted):
+        self.size = size
+        self.mtime = mtime
+        self.content_type = content_type
+        self.etag = etag
+        self.restricted = restricted
+
+    def to_list(self):
+        return [self.size, self.mtime, self.content_type, self.etag]
+
+
+class DocumentManifest(object):
+    def __init__(self, root, path_resolver, snapshot_path=None,
+                 poll_interval=MANIFEST_POLL_INTERVAL, debug=0):
+        """
+        :type root: str
+        :param root: The absolute path of the server's root
+        :type path_resolver: PathResolver.PathResolver
+        :param path_resolver: decides which files are restricted, it is
+                              invalidated whenever files change
+        :type snapshot_path: str
+        :param snapshot_path: a file the manifest is saved to and loaded
+                              from, None disables the snapshot
+        :param poll_interval: seconds between two scans of the watcher
+        :param debug: For debugging purposes
+        """
+        self._root = path.realpath(root)
+        self._path_resolver = path_resolver
+        self._snapshot_path = snapshot_path
+        self._poll_interval = poll_interval
+        self._debug = debug
+        # real path: FileInfo
+        self._files = {}
+        self._listeners = []
+        self._watcher = None
+        self._stop_event = threading.Event()
+
+    def __contains__(self, real_path):
+        return real_path in self._files
+
+    def __len__(self):
+        return len(self._files)
+
+    def get(self, real_path):
+        """
+        :rtype: FileInfo
+        :return: The metadata of the file or None if it isn't in the manifest
+        """
+        return self._files.get(real_path)
+
+    def add_listener(self, listener):
+        """
+        :type listener: function
+        :param listener: called with a list of the real paths that were added,
+                         removed or modified whenever the manifest is refreshed
+        :return: None
+        """
+        self._listeners.append(listener)
+
+    def load(self):
+        """
+        Loads the snapshot, or scans the root if there isn't a valid one,
+        and saves the result
+        :return: None
+        """
+        if not self._load_snapshot():
+            self._files = self._scan()
+        self.save_snapshot()
+
+        if self._debug >= 0:
+            print "Manifest of {} holds {} files".format(self._root, len(self._files))
+
+    def refresh(self):
+        """
+        Scans the root and updates the entries of the files that changed
+        since the last scan
+        :return: a list of the real paths that changed
+        """
+        files = self._scan(self._files)
+        changed = [real_path for real_path, info in files.iteritems()
+                   if self._files.get(real_path) is not info]
+        changed.extend(real_path for real_path in self._files
+                       if real_path not in files)
+
+        # a single assignment, requests never see a half updated manifest
+        self._files = files
+        if changed:
+            if self._debug >= 1:
+                print "Manifest: {} files changed".format(len(changed))
+            for listener in self._listeners:
+                listener(changed)
+        return changed
+
+    def start_watcher(self):
+        """
+        Refreshes the manifest every poll_interval seconds from a daemon thread
+        :return: None
+        """
+        if self._watcher is not None and self._watcher.is_alive():
+            return
+
+        self._stop_event.clear()
+        self._watcher = threading.Thread(target=self._watch, name="manifest-watcher")
+        self._watcher.daemon = True
+        self._watcher.start()
+
+    def stop_watcher(self):
+        self._stop_event.set()
+        if self._watcher is not None:
+            self._watcher.join()
+            self._watcher = None
+
+    def save_snapshot(self):
+        """
+        Writes the manifest to the snapshot file, errors are ignored
+        since the snapshot is only an optimization
+        :return: None
+        """
+        if self._snapshot_path is None:
+            return
+
+        snapshot = {"version": SNAPSHOT_VERSION,
+                    "root": self._root,
+                    "files": dict((real_path, info.to_list())
+                                  for real_path, info in self._files.iteritems())}
+        temporary_path = self._snapshot_path + ".tmp"
+        try:
+            with open(temporary_path, "wb") as snapshot_file:
+                json.dump(snapshot, snapshot_file)
+            # replaces the previous snapshot at once
+            os.rename(temporary_path, self._snapshot_path)
+        except (IOError, OSError) as err:
+            if self._debug >= 0:
+                print "Couldn't save manifest snapshot: {}".format(err)
+
+    def _load_snapshot(self):
+        """
+        :return: True if a snapshot of the same root was loaded
+        """
+        if self._snapshot_path is None:
+            return False
+
+        try:
+            with open(self._snapshot_path, "rb") as snapshot_file:
+                snapshot = json.load(snapshot_file)
+        except (IOError, OSError, ValueError):
+            return False
+
+        if not isinstance(snapshot, dict) or snapshot.get("version") != SNAPSHOT_VERSION or \
+                snapshot.get("root") != self._root:
+            return False
+
+        files = {}
+        try:
+            for real_path, (size, mtime, content_type, etag) in snapshot["files"].iteritems():
+                # json returns unicode strings, the rest of the server uses str
+                real_path = real_path.encode("utf-8")
+                # the restricted folders may have changed since the snapshot
+                files[real_path] = FileInfo(size, mtime, str(content_type), str(etag),
+                                            self._path_resolver.is_restricted(real_path))
+        except (KeyError, TypeError, ValueError):
+            return False
+
+        self._files = files
+        return True
+
+    def _scan(self, previous=None):
+        """
+        Walks the root and builds the entry of every file
+        :param previous: entries of a former scan, unchanged files keep them
+        :return: a dictionary of real path: FileInfo
+        """
+        previous = previous or {}
+        files = {}
+        # linked folders are followed once, a link to a parent can't loop
+        visited = set()
+        for directory, folder_names, file_names in os.walk(self._root, followlinks=True):
+            real_directory = path.realpath(directory)
+            if real_directory in visited:
+                del folder_names[:]
+                continue
+            visited.add(real_directory)
+
+            for file_name in file_names:
+                real_path = path.realpath(path.join(directory, file_name))
+                try:
+                    stat = os.stat(real_path)
+                except OSError:
+                    continue
+
+                info = previous.get(real_path)
+                if info is None or info.mtime != stat.st_mtime or info.size != stat.st_size:
+                    info = FileInfo(stat.st_size, stat.st_mtime,
+                                    guess_content_type(real_path),
+                                    make_etag(stat.st_mtime, stat.st_size),
+                                    self._path_resolver.is_restricted(real_path))
+                files[real_path] = info
+        return files
+
+    def _watch(self):
+        while not self._stop_event.wait(self._poll_interval):
+            try:
+                if self.refresh():
+                    self.save_snapshot()
+            except Exception as err:
+                # the watcher must outlive a single failed scan
+                if self._debug >= 0:
+                    print "Manifest refresh failed: {}".format(err)
@@ -0,0 +1,126 @@
+"""
+Error responses rendered ahead of time.
+Every error page is serialized once, only the Date header is added when the
+response is sent. Pages that are read from a file in root (e.g not_found.html)
+are rebuilt only when the file changes, the file is checked at most once
+every ERROR_PAGE_RECHECK_INTERVAL seconds.
+The objects are safe to use from several threads.
+"""
+import os
+import os.path as path
+import time
+import HTTPHeaders
+import public_response_functions
+from server_constants import NOT_FOUND, RESTRICTED_HTML_PAGE, ERROR_PAGE_RECHECK_INTERVAL
+
+
+DEFAULT_NOT_FOUND_BODY = "<body><h1>Not Found</h1></body>"
+DEFAULT_FORBIDDEN_BODY = "<html><body><h1>Forbidden</h1></body></html>"
+
+
+class ErrorPage(object):
+    def __init__(self, status_code, phrase, default_body="", source_path=None,
+                 close_connection=False, recheck_interval=ERROR_PAGE_RECHECK_INTERVAL):
+        """
+        :type status_code: int
+        :type phrase: str
+        :type default_body: str
+        :param default_body: used when there is no source file or it can't be read
+        :type source_path: str
+        :param source_path: a file whose content is the body of the response
+        :type close_connection: bool
+        :param close_connection: if True the response has Connection: close
+        :param recheck_interval: seconds between checks of the source file
+        """
+        self._status_code = status_code
+        self._phrase = phrase
+        self._default_body = default_body
+        self._source_path = source_path
+        self._close_connection = close_connection
+        self._recheck_interval = recheck_interval
+        # (mtime, size) of the source file when it was read, None if missing
+        self._source_version = None
+        self._checked_at = 0
+        self._rendered = self._render(self._read_source())
+
+    def get_response(self, connection=None):
+        """
+        :param connection: The value of the Connection header, if any
+                           (a page that closes the connection has it already)
+        :return: The full response with an up to date Date header
+        """
+        if self._source_path is not None:
+            now = time.time()
+            if now - self._checked_at >= self._recheck_interval:
+                self._checked_at = now
+                if self._get_source_version() != self._source_version:
+                    self._rendered = self._render(self._read_source())
+
+        headers, body = self._rendered
+        return headers + public_response_functions.get_date_header_line(connection) + body
+
+    def _get_source_version(self):
+        try:
+            stat = os.stat(self._source_path)
+        except OSError:
+            return None
+        return stat.st_mtime, stat.st_size
+
+    def _read_source(self):
+        """
+        :return: the content of the source file, or the default body
+        """
+        self._checked_at = time.time()
+        self._source_version = None
+        if self._source_path is None:
+            return self._default_body
+
+        try:
+            with open(self._source_path, "rb") as source:
+                self._source_version = self._get_source_version()
+                return source.read()
+        except IOError:
+            return self._default_body
+
+    def _render(self, body):
+        """
+        :return: a tuple of the serialized headers (without Date) and the body
+        """
+        headers = HTTPHeaders.HTTPHeaders()
+        public_response_functions.add_default_headers(headers, include_date=False)
+        headers["Content-Length"] = str(len(body))
+        if body:
+            headers["Content-Type"] = "text/html"
+        if self._close_connection:
+            headers["Connection"] = "close"
+
+        return public_response_functions.build_response_template(
+            self._status_code, self._phrase, headers), body
+
+
+class ErrorPages(object):
+    """
+    The error pages of a single server
+    """
+    def __init__(self, root, restricted_page=RESTRICTED_HTML_PAGE):
+        """
+        :param root: The server's root, not_found.html and the restricted page
+                     are looked for in it
+        :param restricted_page: The name of the page sent for restricted paths
+        """
+        self._pages = {
+            403: ErrorPage(403, "Forbidden", DEFAULT_FORBIDDEN_BODY,
+                           path.join(root, restricted_page)),
+            404: ErrorPage(404, "Not Found", DEFAULT_NOT_FOUND_BODY,
+                           path.join(root, NOT_FOUND)),
+            405: ErrorPage(405, "Method Not Allowed", close_connection=True),
+        }
+
+    def get_response(self, status_code, connection=None):
+        """
+        :type status_code: int
+        :param connection: The value of the Connection header, if any
+        :return: The response of the given error
+        may raise KeyError for an unknown status code
+        """
+        return self._pages[status_code].get_response(connection)
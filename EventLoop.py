@@ -0,0 +1,293 @@
+"""
+A single threaded, non blocking connection engine.
+The loop multiplexes the listening socket and all the client connections
+with epoll (or poll where epoll isn't available), so idle keep-alive
+connections cost only a registered file descriptor.
+Usage:
+Construction- provide a bound and listening socket and the function that
+              handles a single request:
+              EventLoop(listening_socket, handle_request)
+              handle_request(connection, request) receives a non blocking
+              HTTPConnection and a single framed request (see
+              HTTPConnection.next_request), it sends the response with
+              connection.send and returns False if the connection should
+              be closed.
+Starting- run() is a blocking call, just like HTTPServer.start_server
+Limits- at most max_connections are served, further clients get a 503
+        response as soon as they're accepted. Every TIMEOUT_CHECK_INTERVAL
+        seconds connections whose deadline passed (see
+        HTTPConnection.get_deadline) are closed, those in the middle of a
+        request get a 408 response first.
+"""
+import errno
+import select
+import socket
+import time
+import HTTPConnection
+import public_response_functions
+from server_constants import RECV_BUFFER_SIZE, MAX_CONNECTIONS, TIMEOUT_CHECK_INTERVAL
+
+
+READ_EVENTS = select.POLLIN | select.POLLPRI
+WRITE_EVENTS = select.POLLOUT
+ERROR_EVENTS = select.POLLERR | select.POLLHUP | select.POLLNVAL
+
+
+class _Poller(object):
+    """
+    Wraps epoll/poll with a single interface, the timeout is in seconds
+    """
+    def __init__(self):
+        if hasattr(select, "epoll"):
+            self._poller = select.epoll()
+            self._timeout_factor = 1
+        else:
+            self._poller = select.poll()
+            self._timeout_factor = 1000
+
+    def register(self, fd, events):
+        self._poller.register(fd, events)
+
+    def modify(self, fd, events):
+        self._poller.modify(fd, events)
+
+    def unregister(self, fd):
+        self._poller.unregister(fd)
+
+    def poll(self, timeout):
+        """
+        :param timeout: seconds to wait for events, None to wait forever
+        :return: a list of (fd, events) tuples
+        """
+        if timeout is None:
+            timeout = -1
+        else:
+            timeout *= self._timeout_factor
+
+        try:
+            return self._poller.poll(timeout)
+        except (IOError, OSError, select.error) as err:
+            if err.args[0] == errno.EINTR:
+                return []
+            raise
+
+
+class EventLoop(object):
+    def __init__(self, listening_socket, handle_request, debug=0,
+                 max_connections=MAX_CONNECTIONS, timeouts=None):
+        """
+        :type listening_socket: socket.socket
+        :param listening_socket: a bound socket that listen was called on
+        :type handle_request: function
+        :param handle_request: called with (connection, request) for every
+                               request read, returns False if the connection
+                               should be closed
+        :param debug: For debugging purposes
+        :param max_connections: The maximal number of connections served
+        :type timeouts: HTTPConnection.Timeouts
+        :param timeouts: The timeouts of the connections, None for the defaults
+        """
+        self._listening_socket = listening_socket
+        self._handle_request = handle_request
+        self._debug = debug
+        self._max_connections = max_connections
+        self._timeouts = timeouts
+        self._poller = _Poller()
+        # fd: HTTPConnection
+        self._connections = {}
+
+    def get_connections_count(self):
+        return len(self._connections)
+
+    def run(self):
+        """
+        Serves connections until interrupted
+        :return: None
+        """
+        self._listening_socket.setblocking(0)
+        listening_fd = self._listening_socket.fileno()
+        self._poller.register(listening_fd, READ_EVENTS)
+
+        next_check = time.time() + TIMEOUT_CHECK_INTERVAL
+        try:
+            while True:
+                events_list = self._poller.poll(TIMEOUT_CHECK_INTERVAL)
+                now = time.time()
+                if now >= next_check:
+                    self._close_expired(now)
+                    next_check = now + TIMEOUT_CHECK_INTERVAL
+
+                for fd, events in events_list:
+                    if fd == listening_fd:
+                        self._accept_connections()
+                        continue
+
+                    connection = self._connections.get(fd)
+                    if connection is None:
+                        continue
+
+                    if events & READ_EVENTS:
+                        self._on_readable(connection)
+                    elif events & ERROR_EVENTS:
+                        self._drop(connection)
+                        continue
+
+                    if events & WRITE_EVENTS and not connection.is_closed():
+                        self._update(connection)
+        finally:
+            for connection in self._connections.values():
+                connection.abort()
+            self._connections = {}
+            self._poller.unregister(listening_fd)
+
+    def _accept_connections(self):
+        """
+        Accepts every pending client
+        :return: None
+        """
+        while True:
+            try:
+                client_socket, client_address = self._listening_socket.accept()
+            except socket.error as err:
+                if err.errno in HTTPConnection.WOULD_BLOCK_ERRORS:
+                    return
+                if self._debug >= 1:
+                    print "Got error on accept: {}".format(err)
+                return
+
+            if self._debug >= 0:
+                print "Got connection from: {}".format(client_address)
+
+            connection = HTTPConnection.HTTPConnection(client_socket, client_address,
+                                                       non_blocking=True,
+                                                       timeouts=self._timeouts)
+            if len(self._connections) >= self._max_connections:
+                self._reject(connection)
+                continue
+
+            self._connections[connection.fileno()] = connection
+            self._poller.register(connection.fileno(), READ_EVENTS)
+
+    def _on_readable(self, connection):
+        try:
+            request = connection.recv(RECV_BUFFER_SIZE)
+        except socket.error as err:
+            if err.errno in HTTPConnection.WOULD_BLOCK_ERRORS:
+                return
+            if self._debug >= 1:
+                print "Got socket error: {}".format(err)
+            self._drop(connection)
+            return
+
+        if not request:
+            if self._debug >= 0:
+                print "Closing connection"
+            self._drop(connection)
+            return
+
+        connection.feed(request)
+        # several pipelined requests may be in the buffer, their responses
+        # are queued in order
+        while True:
+            try:
+                request = connection.next_request()
+            except ValueError as err:
+                if self._debug >= 0:
+                    print "{}, closing...".format(err)
+                connection.send(public_response_functions.get_request_too_large_response())
+                connection.close()
+                break
+
+            if request is None:
+                break
+
+            # a failing request must not take the whole loop down
+            try:
+                keep_alive = self._handle_request(connection, request)
+            except Exception as err:
+                if self._debug >= 1:
+                    print "Error while handling request: {}".format(err)
+                self._drop(connection)
+                return
+
+            if not keep_alive:
+                connection.close()
+                break
+
+        self._update(connection)
+
+    def _update(self, connection):
+        """
+        Writes whatever the connection has queued and registers the
+        events the connection waits for. While a response is still being
+        written the connection isn't read from, so pipelined requests are
+        answered in order and a slow reader can't make the output grow.
+        :return: None
+        """
+        fd = connection.fileno()
+        try:
+            connection.flush()
+        except socket.error as err:
+            if self._debug >= 1:
+                print "Got socket error: {}".format(err)
+            self._drop(connection)
+            return
+
+        if connection.is_closed():
+            self._forget(fd)
+        elif connection.has_pending_output():
+            self._poller.modify(fd, WRITE_EVENTS)
+        else:
+            self._poller.modify(fd, READ_EVENTS)
+
+    def _reject(self, connection):
+        """
+        Answers a client there is no room for with the pre-built 503
+        response, whatever doesn't fit in the socket's buffer is discarded
+        :return: None
+        """
+        if self._debug >= 0:
+            print "Overloaded, rejecting {}".format(connection.get_address())
+        connection.send(public_response_functions.get_service_unavailable_response())
+        try:
+            connection.flush()
+        except socket.error:
+            pass
+        connection.abort()
+
+    def _close_expired(self, now):
+        """
+        Closes the connections whose deadline passed, a client that didn't
+        complete its request gets a 408 response
+        :param now: The current time
+        :return: None
+        """
+        for connection in self._connections.values():
+            if connection.get_deadline() > now:
+                continue
+
+            if connection.has_partial_request() and not connection.has_pending_output():
+                if self._debug >= 0:
+                    print "Request from {} timed out, closing...".format(
+                        connection.get_address())
+                connection.send(public_response_functions.get_request_timeout_response())
+                connection.close()
+                self._update(connection)
+                # a client that doesn't read the 408 is dropped next time
+                continue
+
+            if self._debug >= 1:
+                print "Connection {} timed out".format(connection.get_address())
+            self._drop(connection)
+
+    def _drop(self, connection):
+        fd = connection.fileno()
+        connection.abort()
+        self._forget(fd)
+
+    def _forget(self, fd):
+        if self._connections.pop(fd, None) is not None:
+            try:
+                self._poller.unregister(fd)
+            except (IOError, OSError, KeyError):
+                pass
@@ -0,0 +1,782 @@
+"""
+This class holds the state of a single client connection.
+Every accepted client socket is wrapped by an HTTPConnection object
+so the server itself doesn't have to keep any per-client members,
+which allows several connections to be handled at the same time
+(e.g by different worker threads).
+A connection may also be non blocking (used by the event loop), in that
+case send only queues the data and flush writes as much of it as
+the socket accepts without blocking.
+Data read from the client is kept in a buffer and split into requests
+at the empty line ending the headers, so a request may arrive in several
+segments and several (pipelined) requests may arrive in a single one.
+Files are sent with send_file, which uses the sendfile system call when it's
+available so the file's content never has to be copied into python strings.
+send_file_ranges sends several parts of the same file (e.g byte ranges).
+send_stream sends a body produced by an iterator (e.g a generator), the next
+chunk is taken from the iterator only after the previous one was written, so
+a slow client holds back the producer instead of making the output grow.
+A response made of several buffers (e.g cached headers and a cached body) is
+sent with send_buffers, the buffers are written as they are instead of being
+concatenated into a new string first.
+Every connection has a deadline (see Timeouts and get_deadline), read_request
+gives up on a client once it passed, the event loop checks it periodically.
+The status code, size and sending time of every response are kept for the
+server's metrics (see begin_response).
+"""
+import collections
+import errno
+import re
+import select
+import socket
+import time
+import constants
+import HTTPParser
+import public_response_functions
+from server_constants import RECV_BUFFER_SIZE, MAX_REQUEST_HEAD_SIZE, FILE_CHUNK_SIZE, \
+    GATHER_COPY_THRESHOLD, IDLE_TIMEOUT, KEEP_ALIVE_TIMEOUT, HEADER_TIMEOUT, IO_TIMEOUT
+
+try:
+    from os import sendfile
+except ImportError:
+    try:
+        # the pysendfile package offers the same function for python 2
+        from sendfile import sendfile
+    except ImportError:
+        sendfile = None
+
+
+# errors that mean a non blocking operation should simply be retried later
+WOULD_BLOCK_ERRORS = (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR)
+HEAD_END = constants.CRLF * 2
+CONTENT_LENGTH_PATTERN = re.compile(r"\r\ncontent-length:[ \t]*(\d+)[ \t]*\r\n",
+                                    re.IGNORECASE)
+
+
+class RequestTimeoutError(socket.timeout):
+    """
+    Raised when a client started a request but didn't send its whole
+    request line and headers in time
+    """
+    pass
+
+
+class Timeouts(object):
+    __slots__ = ("idle", "keep_alive", "header", "io")
+
+    def __init__(self, idle=IDLE_TIMEOUT, keep_alive=KEEP_ALIVE_TIMEOUT,
+                 header=HEADER_TIMEOUT, io=IO_TIMEOUT):
+        """
+        All the timeouts are in seconds
+        :param idle: how long a new connection may wait before it starts
+                     sending its first request
+        :param keep_alive: how long a persistent connection may wait for
+                           its next request
+        :param header: how long a client may take to send a whole request
+                       line and headers once it started, no matter how
+                       often it sends a few bytes
+        :param io: how long a read or a write may make no progress
+        """
+        self.idle = idle
+        self.keep_alive = keep_alive
+        self.header = header
+        self.io = io
+
+
+class _FileSegment(object):
+    """
+    A part of a file waiting to be sent, the file is closed once
+    the whole segment was sent unless other segments still need it
+    """
+    def __init__(self, file_object, offset, count, owns_file=True):
+        self.file = file_object
+        self.offset = offset
+        self.remaining = count
+        self.owns_file = owns_file
+        self._chunk = None
+        self._chunk_offset = 0
+
+    def write_to(self, client_socket):
+        """
+        Writes as much of the segment as the socket accepts
+        :return: the number of bytes written
+        may raise socket.error, EAGAIN included if nothing could be written
+        """
+        if sendfile is not None:
+            try:
+                sent = sendfile(client_socket.fileno(), self.file.fileno(),
+                                self.offset, self.remaining)
+            except OSError as err:
+                raise socket.error(err.errno, err.strerror)
+            self.offset += sent
+            self.remaining -= sent
+            if sent == 0 and self.remaining:
+                raise socket.error(errno.EPIPE, "File ended before it was sent")
+            return sent
+
+        # a chunk is read only after the previous one was written entirely
+        if self._chunk is None:
+            self.file.seek(self.offset)
+            self._chunk = self.file.read(min(self.remaining, FILE_CHUNK_SIZE))
+            self._chunk_offset = 0
+            if not self._chunk:
+                raise socket.error(errno.EPIPE, "File ended before it was sent")
+
+        sent = client_socket.send(buffer(self._chunk, self._chunk_offset))
+        self._chunk_offset += sent
+        self.offset += sent
+        self.remaining -= sent
+        if self._chunk_offset == len(self._chunk):
+            self._chunk = None
+        return sent
+
+    def is_done(self):
+        return self.remaining == 0
+
+    def close(self):
+        if self.owns_file:
+            self.file.close()
+
+
+class _StreamSegment(object):
+    """
+    A body produced by an iterator of strings, optionally framed with the
+    chunked transfer coding. The iterator is closed (if it can be) once
+    it is exhausted or when the connection is closed.
+    """
+    def __init__(self, chunks, chunked=True):
+        self.chunks = iter(chunks)
+        self.chunked = chunked
+        self._chunk = None
+        self._chunk_offset = 0
+        self._exhausted = False
+        self._done = False
+
+    def write_to(self, client_socket):
+        """
+        Writes as much of the current chunk as the socket accepts, the next
+        one is taken from the iterator when the current one was written
+        :return: the number of bytes written
+        may raise socket.error, EAGAIN included if nothing could be written,
+        errors raised by the iterator are raised as socket.error as well
+        since the response can't be completed
+        """
+        if self._chunk is None:
+            self._chunk = self._next_chunk()
+            self._chunk_offset = 0
+            if self._chunk is None:
+                self._done = True
+                return 0
+
+        sent = client_socket.send(buffer(self._chunk, self._chunk_offset))
+        self._chunk_offset += sent
+        if self._chunk_offset >= len(self._chunk):
+            self._chunk = None
+            if self._exhausted:
+                self._done = True
+        return sent
+
+    def _next_chunk(self):
+        """
+        :return: The next data to write, None if there is nothing left
+        """
+        if self._exhausted:
+            return None
+        try:
+            # empty chunks would end a chunked body early
+            data = ""
+            while not data:
+                data = next(self.chunks)
+        except StopIteration:
+            self._exhausted = True
+            self.close()
+            return public_response_functions.LAST_CHUNK if self.chunked else None
+        except Exception as err:
+            raise socket.error(errno.EIO, "Response stream failed: {}".format(err))
+        if not isinstance(data, str):
+            # e.g a unicode chunk, its length isn't the number of bytes sent
+            raise socket.error(errno.EIO, "Response stream yielded {}, expected {}".format(
+                type(data), str))
+
+        if self.chunked:
+            return public_response_functions.encode_chunk(data)
+        return data
+
+    def is_done(self):
+        return self._done
+
+    def close(self):
+        close = getattr(self.chunks, "close", None)
+        if close is not None:
+            close()
+
+
+class HTTPConnection(object):
+    def __init__(self, client_socket, address, non_blocking=False,
+                 max_head_size=MAX_REQUEST_HEAD_SIZE, timeouts=None):
+        """
+        :type client_socket: socket.socket
+        :param client_socket: The socket returned by accept
+        :type address: tuple
+        :param address: The address of the client e.g ("127.0.0.1", 53422)
+        :type non_blocking: bool
+        :param non_blocking: if True the socket is set to non blocking mode
+                             and sent data is queued until flush is called
+        :type max_head_size: int
+        :param max_head_size: The maximal size of a request line and headers
+        :type timeouts: Timeouts
+        :param timeouts: if None the default timeouts are used
+        """
+        self._socket = client_socket
+        # kept since a closed socket has no file descriptor
+        self._fileno = client_socket.fileno()
+        self._address = address
+        self._max_head_size = max_head_size
+        self._incoming = ""
+        # where to continue looking for the end of the headers
+        self._scan_offset = 0
+        # body bytes of the previous request that were not received yet
+        self._skip = 0
+        self._non_blocking = non_blocking
+        self._outgoing = collections.deque()
+        # how much of the first queued item was already written
+        self._outgoing_offset = 0
+        self._close_requested = False
+        self._closed = False
+        # number of requests taken out of the buffer so far
+        self._requests_count = 0
+        self._timeouts = timeouts if timeouts is not None else Timeouts()
+        # when data was last received or written
+        self._last_activity = time.time()
+        # when the first byte of the request in the buffer was received
+        self._head_started_at = None
+        # the status code, the number of bytes and the seconds spent sending
+        # of the current response, see begin_response
+        self._response_status = None
+        self._response_bytes = 0
+        self._send_seconds = 0.0 if not self._non_blocking else None
+        if non_blocking:
+            self._socket.setblocking(0)
+        else:
+            self._socket.settimeout(self._timeouts.io)
+
+    def get_socket(self):
+        return self._socket
+
+    def get_address(self):
+        return self._address
+
+    def fileno(self):
+        return self._fileno
+
+    def is_closed(self):
+        return self._closed
+
+    def get_requests_count(self):
+        """
+        :return: The number of requests received on the connection so far
+        """
+        return self._requests_count
+
+    def get_deadline(self):
+        """
+        :return: The time at which the connection should be given up on,
+                 which depends on what it waits for (see Timeouts)
+        """
+        timeouts = self._timeouts
+        if self._outgoing or self._skip:
+            return self._last_activity + timeouts.io
+        if self._incoming:
+            return min(self._head_started_at + timeouts.header,
+                       self._last_activity + timeouts.io)
+        if self._requests_count == 0:
+            return self._last_activity + timeouts.idle
+        return self._last_activity + timeouts.keep_alive
+
+    def begin_response(self):
+        """
+        Resets the statistics of the response, called before a request
+        is handled
+        :return: None
+        """
+        self._response_status = None
+        self._response_bytes = 0
+        self._send_seconds = 0.0 if not self._non_blocking else None
+
+    def get_response_stats(self):
+        """
+        :return: a tuple of the status code of the response (a string, None
+                 if no response was sent), the number of bytes sent (streamed
+                 bodies aren't counted) and the seconds spent sending, None
+                 for non blocking connections which only queue the response
+        """
+        return self._response_status, self._response_bytes, self._send_seconds
+
+    def _count_output(self, first_data, size):
+        """
+        :param first_data: The first data of what is sent, its status line
+                           if it starts a response
+        :param size: The number of bytes sent
+        """
+        if self._response_status is None and first_data.startswith("HTTP/"):
+            # "HTTP/1.1 200 OK"
+            self._response_status = first_data[9:12]
+        self._response_bytes += size
+
+    def has_partial_request(self):
+        """
+        :return: True if a request was started but not received entirely
+        """
+        return len(self._incoming) != 0
+
+    def has_pending_output(self):
+        """
+        :return: True if there is queued data that wasn't written yet
+        """
+        return len(self._outgoing) != 0
+
+    def recv(self, size):
+        """
+        :param size: maximal amount of bytes to read
+        :return: the data read from the client, "" if the client closed
+                 the connection
+        may raise socket.error
+        """
+        return self._socket.recv(size)
+
+    def feed(self, data):
+        """
+        Adds data read from the client to the buffer
+        :type data: str
+        :return: None
+        """
+        self._last_activity = time.time()
+        if self._skip:
+            skipped = min(self._skip, len(data))
+            self._skip -= skipped
+            data = data[skipped:]
+        if data and not self._incoming:
+            self._head_started_at = self._last_activity
+        self._incoming += data
+
+    def next_request(self):
+        """
+        Takes the next complete request out of the buffer.
+        The request body, if the client sent one, is discarded since none
+        of the supported methods uses it.
+        :return: The request line and headers including the empty line
+                 ending them, or None if a whole request wasn't received yet
+        may raise HTTPParser.RequestTooLargeError if the request head
+        is larger than allowed
+        """
+        # empty lines before a request line should be ignored
+        if self._incoming.startswith(constants.CRLF):
+            self._incoming = self._incoming.lstrip(constants.CRLF)
+            self._scan_offset = 0
+
+        head_end = self._incoming.find(HEAD_END, self._scan_offset)
+        if head_end == -1:
+            if len(self._incoming) > self._max_head_size:
+                raise HTTPParser.RequestTooLargeError("Request head is larger than {} bytes".format(
+                    self._max_head_size))
+            # the end may be split between this data and the next one
+            self._scan_offset = max(len(self._incoming) - len(HEAD_END) + 1, 0)
+            return None
+
+        head_end += len(HEAD_END)
+        if head_end > self._max_head_size:
+            raise HTTPParser.RequestTooLargeError("Request head is larger than {} bytes".format(
+                self._max_head_size))
+
+        request = self._incoming[:head_end]
+        self._incoming = self._incoming[head_end:]
+        self._scan_offset = 0
+        # a pipelined request that follows starts its own clock
+        self._head_started_at = time.time()
+
+        content_length = CONTENT_LENGTH_PATTERN.search(request)
+        if content_length:
+            self._discard(int(content_length.group(1)))
+
+        self._requests_count += 1
+        return request
+
+    def _discard(self, count):
+        """
+        Discards the next count bytes the client sends
+        :param count: number of bytes
+        :return: None
+        """
+        skipped = min(count, len(self._incoming))
+        self._incoming = self._incoming[skipped:]
+        self._skip += count - skipped
+
+    def read_request(self):
+        """
+        Blocks until a complete request is received or the deadline of the
+        connection passed
+        :return: The request (see next_request), or "" if the client closed
+                 the connection or didn't start a request in time
+        may raise socket.error, RequestTimeoutError if a request was started
+        but not completed in time or HTTPParser.RequestTooLargeError
+        """
+        # the previous response was sent, the connection waits from now on
+        self._last_activity = time.time()
+        request = self.next_request()
+        if request is not None:
+            # pipelined, the socket doesn't have to be touched
+            return request
+
+        try:
+            while True:
+                timeout = self.get_deadline() - time.time()
+                if timeout <= 0:
+                    if self._incoming:
+                        raise RequestTimeoutError("Request wasn't completed in time")
+                    return ""
+
+                self._socket.settimeout(timeout)
+                try:
+                    data = self.recv(RECV_BUFFER_SIZE)
+                except socket.timeout:
+                    # the deadline is checked by the next iteration
+                    continue
+                if not data:
+                    return ""
+                self.feed(data)
+
+                request = self.next_request()
+                if request is not None:
+                    return request
+        finally:
+            # responses are written with the io timeout
+            self._socket.settimeout(self._timeouts.io)
+
+    def send(self, data):
+        """
+        Sends all of the data to the client. A non blocking connection
+        only queues the data, it is written by flush.
+        :type data: str
+        :param data: The data to send
+        :return: None
+        may raise socket.error
+        """
+        self._count_output(data, len(data))
+        if self._non_blocking:
+            if data:
+                self._outgoing.append(data)
+            return
+
+        started = time.time()
+        self._socket.sendall(data)
+        self._send_seconds += time.time() - started
+
+    def send_buffers(self, buffers):
+        """
+        Sends several buffers one after the other (scatter-gather).
+        Small responses are simply joined, copying a few bytes is cheaper than
+        the extra system calls. Larger ones are written with a single sendmsg
+        when the socket supports it, otherwise the socket is corked so the
+        buffers still leave in full packets. A non blocking connection joins
+        small responses as well, so they're written with a single send
+        (separate small sends of a response stall on Nagle's algorithm and the
+        client's delayed ACK), larger ones are queued as they are.
+        :type buffers: list
+        :param buffers: a list of strings
+        :return: None
+        may raise socket.error
+        """
+        total_size = sum(len(data) for data in buffers)
+        if buffers:
+            self._count_output(buffers[0], total_size)
+        if self._non_blocking:
+            if total_size <= GATHER_COPY_THRESHOLD:
+                if total_size:
+                    self._outgoing.append("".join(buffers))
+                return
+            for data in buffers:
+                if data:
+                    self._outgoing.append(data)
+            return
+
+        started = time.time()
+        try:
+            if total_size <= GATHER_COPY_THRESHOLD:
+                self._socket.sendall("".join(buffers))
+                return
+
+            sendmsg = getattr(self._socket, "sendmsg", None)
+            if sendmsg is not None:
+                self._sendmsg_all(sendmsg, buffers)
+                return
+
+            self._set_cork(True)
+            try:
+                for data in buffers:
+                    self._socket.sendall(data)
+            finally:
+                self._set_cork(False)
+        finally:
+            self._send_seconds += time.time() - started
+
+    def _sendmsg_all(self, sendmsg, buffers):
+        """
+        Calls sendmsg until all the buffers were written
+        """
+        buffers = [memoryview(data) for data in buffers if len(data)]
+        while buffers:
+            try:
+                sent = sendmsg(buffers)
+            except socket.error as err:
+                if err.errno not in WOULD_BLOCK_ERRORS:
+                    raise
+                self._wait_writable()
+                continue
+
+            # drop what was written, the first remaining buffer may be partial
+            while buffers and sent >= len(buffers[0]):
+                sent -= len(buffers[0])
+                buffers.pop(0)
+            if buffers and sent:
+                buffers[0] = buffers[0][sent:]
+
+    def _set_cork(self, cork):
+        """
+        While corked the kernel only sends full packets, uncorking sends
+        whatever is left. Does nothing where TCP_CORK isn't available.
+        """
+        if not hasattr(socket, "TCP_CORK"):
+            return
+        try:
+            self._socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_CORK, int(cork))
+        except socket.error:
+            pass
+
+    def send_file(self, file_object, offset, count, header=""):
+        """
+        Sends count bytes of a file starting at offset. The connection
+        takes ownership of the file and closes it once it was sent (or when
+        the connection is closed). A non blocking connection only queues the
+        file, it is written by flush.
+        :type file_object: file
+        :param file_object: a file opened for reading in binary mode
+        :param offset: where to start reading
+        :param count: the number of bytes to send
+        :type header: str
+        :param header: data sent right before the file (e.g the response's
+                       status line and headers), the socket is corked so it
+                       leaves in the same packet as the start of the file
+        :return: None
+        may raise socket.error
+        """
+        self.send_file_ranges(file_object, [("", offset, count)], header)
+
+    def send_file_ranges(self, file_object, ranges, header="", trailer=""):
+        """
+        Sends several parts of the same file, each one may be preceded by
+        data of its own (e.g the boundaries of a multipart/byteranges
+        response). Like send_file the connection takes ownership of the file.
+        :type file_object: file
+        :param file_object: a file opened for reading in binary mode
+        :type ranges: list
+        :param ranges: a list of (data sent before the part, offset, count)
+        :type header: str
+        :param header: data sent before the first part
+        :type trailer: str
+        :param trailer: data sent after the last part
+        :return: None
+        may raise socket.error
+        """
+        items = [header] if header else []
+        segments = []
+        for part_header, offset, count in ranges:
+            if part_header:
+                items.append(part_header)
+            if count:
+                segment = _FileSegment(file_object, offset, count, owns_file=False)
+                segments.append(segment)
+                items.append(segment)
+        if trailer:
+            items.append(trailer)
+
+        if not segments:
+            file_object.close()
+        else:
+            # the file is closed with the last segment that uses it
+            segments[-1].owns_file = True
+
+        self._count_output(header, len(header) + len(trailer) + sum(
+            len(part_header) + count for part_header, _, count in ranges))
+        if self._non_blocking:
+            self._outgoing.extend(items)
+            return
+
+        started = time.time()
+        cork = len(items) > 1
+        if cork:
+            self._set_cork(True)
+        try:
+            for item in items:
+                if not isinstance(item, _FileSegment):
+                    self._socket.sendall(item)
+                    continue
+
+                while not item.is_done():
+                    try:
+                        item.write_to(self._socket)
+                    except socket.error as err:
+                        if err.errno not in WOULD_BLOCK_ERRORS:
+                            raise
+                        # sockets with a timeout are non blocking underneath
+                        self._wait_writable()
+        finally:
+            file_object.close()
+            if cork:
+                self._set_cork(False)
+            self._send_seconds += time.time() - started
+
+    def send_stream(self, chunks, header="", chunked=True):
+        """
+        Sends a body produced by an iterator. A non blocking connection
+        queues the iterator, flush takes chunks from it only while the socket
+        accepts them, so the iterator shouldn't block.
+        :param chunks: an iterator (e.g a generator) of strings
+        :type header: str
+        :param header: data sent before the body (e.g the response's status
+                       line and headers)
+        :type chunked: bool
+        :param chunked: if True every string is sent as a chunk of the chunked
+                        transfer coding and the body is ended by the last chunk
+        :return: None
+        may raise socket.error
+        """
+        segment = _StreamSegment(chunks, chunked)
+        self._count_output(header, len(header))
+        if self._non_blocking:
+            if header:
+                self._outgoing.append(header)
+            self._outgoing.append(segment)
+            return
+
+        started = time.time()
+        try:
+            if header:
+                self._socket.sendall(header)
+            while not segment.is_done():
+                try:
+                    segment.write_to(self._socket)
+                except socket.error as err:
+                    if err.errno not in WOULD_BLOCK_ERRORS:
+                        raise
+                    self._wait_writable()
+        finally:
+            segment.close()
+            self._send_seconds += time.time() - started
+
+    def _wait_writable(self):
+        timeout = self._socket.gettimeout()
+        try:
+            _, writable, _ = select.select([], [self._socket], [], timeout)
+        except select.error as err:
+            if err.args[0] == errno.EINTR:
+                return
+            raise
+
+        if not writable:
+            raise socket.timeout("timed out")
+
+    def flush(self):
+        """
+        Writes queued data until the socket would block. If close was
+        requested and everything was written the socket is closed.
+        When several items are queued (e.g a header and a file) the socket
+        is corked while they're written, otherwise the last small packet of
+        a response waits for the client's delayed ACK of the previous one.
+        :return: True if all the queued data was written
+        may raise socket.error
+        """
+        cork = len(self._outgoing) > 1
+        if cork:
+            self._set_cork(True)
+        try:
+            return self._write_outgoing()
+        finally:
+            if cork and not self._closed:
+                self._set_cork(False)
+
+    def _write_outgoing(self):
+        """
+        see flush
+        """
+        had_output = len(self._outgoing) != 0
+        while self._outgoing:
+            data = self._outgoing[0]
+            if isinstance(data, (_FileSegment, _StreamSegment)):
+                try:
+                    data.write_to(self._socket)
+                except socket.error as err:
+                    if err.errno in WOULD_BLOCK_ERRORS:
+                        return False
+                    raise
+
+                self._last_activity = time.time()
+                if not data.is_done():
+                    continue
+                data.close()
+                self._outgoing.popleft()
+                continue
+
+            try:
+                # buffer avoids copying the rest of a partially written item
+                sent = self._socket.send(buffer(data, self._outgoing_offset))
+            except socket.error as err:
+                if err.errno in WOULD_BLOCK_ERRORS:
+                    return False
+                raise
+
+            self._last_activity = time.time()
+            self._outgoing_offset += sent
+            if self._outgoing_offset < len(data):
+                return False
+            self._outgoing.popleft()
+            self._outgoing_offset = 0
+
+        if self._close_requested:
+            self._close_socket()
+        elif had_output and self._incoming:
+            # the pipelined request that waited for the response starts now
+            self._head_started_at = time.time()
+        return True
+
+    def close(self):
+        """
+        Closes the client socket, errors are ignored since the client
+        may have already closed its side of the connection.
+        A non blocking connection with queued data is closed only
+        after the data is flushed.
+        :return: None
+        """
+        if self._non_blocking and self._outgoing:
+            self._close_requested = True
+            return
+
+        self._close_socket()
+
+    def abort(self):
+        """
+        Closes the socket immediately, queued data is discarded
+        :return: None
+        """
+        self._outgoing_offset = 0
+        self._close_socket()
+
+    def _close_socket(self):
+        self._closed = True
+        for item in self._outgoing:
+            if isinstance(item, (_FileSegment, _StreamSegment)):
+                item.close()
+        self._outgoing.clear()
+        try:
+            self._socket.close()
+        except socket.error:
+            pass
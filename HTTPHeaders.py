@@ -1,15 +1,42 @@
 """
 This class handles the headers of an http request/response.
-Given the headers part the class will parse it and create
-a dictionary of the format: header:value.
-Headers may be added or changed.
+Given the headers part the class will parse it and keep every
+header in the order it was added.
+Headers may be added or changed. Names are case insensitive
+(headers["content-length"] is headers["Content-Length"]) and a header
+may have several values (see add and get_all), reading a header with
+several values returns them joined by ", ".
 The method build_headers will return a string of all the headers
 according to the http format: "header1: blabla\r\nlast-header: blabla\r\n\r\n"
 """
 import constants
 
 
+# The names of common headers are interned and mapped to their lower case
+# form ahead of time, so looking them up doesn't build a new string
+COMMON_HEADERS = ["Accept", "Accept-Encoding", "Accept-Language", "Accept-Ranges",
+                  "Allow", "Cache-Control", "Connection", "Content-Encoding",
+                  "Content-Length", "Content-Range", "Content-Type", "Cookie",
+                  "Date", "ETag", "Host", "If-Modified-Since", "If-None-Match",
+                  "If-Range", "Keep-Alive", "Last-Modified", "Range", "Retry-After",
+                  "Transfer-Encoding", "User-Agent", "Vary"]
+_LOWER_NAMES = {}
+for _name in COMMON_HEADERS:
+    _LOWER_NAMES[intern(_name)] = intern(_name.lower())
+    _LOWER_NAMES[_LOWER_NAMES[_name]] = _LOWER_NAMES[_name]
+del _name
+
+HEADER_SEPARATOR = constants.COLON + constants.SPACE
+VALUES_SEPARATOR = ", "
+
+
+def _lower(name):
+    return _LOWER_NAMES.get(name) or name.lower()
+
+
 class HTTPHeaders(object):
+    __slots__ = ("_debug", "_headers", "_order")
+
     def __init__(self, headers="", debug=0):
         """
         :param debug: For debugging purposes
@@ -23,7 +50,10 @@ class HTTPHeaders(object):
         self._debug = debug
         if not isinstance(headers, str):
             raise TypeError("Got {} but expected {}".format(type(headers), str))
+        # lower case name: (name as it was first added, value, value...)
         self._headers = {}
+        # lower case names in the order they were added
+        self._order = []
         if headers:
             try:
                 self._parse_headers(headers)
@@ -31,18 +61,111 @@ class HTTPHeaders(object):
                 raise
 
     def __setitem__(self, key, value):
+        """
+        Sets the value of a header, replacing all of its previous values
+        """
+        if not (isinstance(key, str) and isinstance(value, str)):
+            raise TypeError("Got {} and {} but expected {}".format(type(key), type(value), str))
+
+        # _lower inlined, this is the most common call
+        lower_name = _LOWER_NAMES.get(key) or key.lower()
+        if lower_name not in self._headers:
+            self._order.append(lower_name)
+        self._headers[lower_name] = (key, value)
+
+    def __getitem__(self, key):
+        """
+        :return: The value of the header, several values are joined by ", "
+        may raise KeyError
+        """
+        entry = self._headers[_LOWER_NAMES.get(key) or key.lower()]
+        if len(entry) == 2:
+            return entry[1]
+        return VALUES_SEPARATOR.join(entry[1:])
+
+    def __delitem__(self, key):
+        lower_name = _lower(key)
+        del self._headers[lower_name]
+        self._order.remove(lower_name)
+
+    def __contains__(self, key):
+        return _lower(key) in self._headers
+
+    def __len__(self):
+        return len(self._order)
+
+    def __iter__(self):
+        """
+        :return: an iterator over the names of the headers in the order
+                 they were added
+        """
+        for lower_name in self._order:
+            yield self._headers[lower_name][0]
+
+    def get(self, key, default=None):
+        """
+        :return: The value of the header (see __getitem__) or default
+                 if the header is missing
+        """
+        entry = self._headers.get(_lower(key))
+        if entry is None:
+            return default
+        if len(entry) == 2:
+            return entry[1]
+        return VALUES_SEPARATOR.join(entry[1:])
+
+    def get_all(self, key):
+        """
+        :return: A list of all the values of the header, empty if missing
+        """
+        entry = self._headers.get(_lower(key))
+        return list(entry[1:]) if entry is not None else []
+
+    def add(self, key, value):
+        """
+        Adds a value to a header without removing the previous ones
+        (e.g for several Set-Cookie headers)
+        """
         if not isinstance(key, str):
             raise TypeError("Got {} but expected {}".format(type(key), str))
         if not isinstance(value, str):
             raise TypeError("Got {} but expected {}".format(type(value), str))
 
-        self._headers[key] = value
+        self._add(key, value)
 
-    def __getitem__(self, key):
-        if not isinstance(key, str):
-            raise TypeError("Got {} but expected {}".format(type(key), str))
+    def items(self):
+        """
+        :return: a list of (name, value) tuples in the order the headers were
+                 added, a header with several values appears several times
+        """
+        result = []
+        for lower_name in self._order:
+            entry = self._headers[lower_name]
+            name = entry[0]
+            for value in entry[1:]:
+                result.append((name, value))
+        return result
+
+    def update(self, fields):
+        """
+        Adds several headers at once. The names and values are expected to be
+        strings that were already validated (e.g by HTTPParser), so unlike
+        __setitem__ no type checks are done. Repeated names are kept as
+        several values of the same header.
+        :param fields: an iterable of (name, value) tuples
+        :return: None
+        """
+        for name, value in fields:
+            self._add(name, value)
 
-        return self._headers[key]
+    def _add(self, name, value):
+        lower_name = _LOWER_NAMES.get(name) or name.lower()
+        entry = self._headers.get(lower_name)
+        if entry is None:
+            self._order.append(lower_name)
+            self._headers[lower_name] = (name, value)
+        else:
+            self._headers[lower_name] = entry + (value,)
 
     def _parse_headers(self, headers_string):
         """
@@ -59,7 +182,9 @@ class HTTPHeaders(object):
         headers_list = filter(lambda s: s != "", headers_list)
 
         for header in headers_list:
-            header_field_list = header.split(constants.COLON)
+            # only the first colon separates the name, the value may
+            # contain colons as well (e.g Host: localhost:8080)
+            header_field_list = header.split(constants.COLON, 1)
 
             # check header structure
             if len(header_field_list) < 2:
@@ -71,20 +196,29 @@ class HTTPHeaders(object):
                 raise ValueError("Expected space after colon \
                                  in header: {}:{}".format(field_name, header_value))
 
-            self._headers[field_name] = header_value[1:]
+            self._add(field_name, header_value[1:])
 
         if self._debug:
-            print self._headers
+            print self.items()
 
     def build_headers(self):
         """
-        builds a string comprising of the headers in the dictionary member
-        if self._headers = {"Connection": "keep-alive", "Content-Encoding": "base64"}
+        builds a string comprising of the headers in the order they were added
+        if Connection: keep-alive and then Content-Encoding: base64 were added
         the result will be: "Connection: keep-alive\r\nContent-Encoding: base64\r\n\r\n"
+        The string is built with a single join.
         :return:
         """
-        result = ""
-        for key in self._headers.keys():
-            result += "{}: {}{}".format(key, self._headers[key], constants.CRLF)
+        parts = []
+        headers = self._headers
+        for lower_name in self._order:
+            entry = headers[lower_name]
+            if len(entry) == 2:
+                parts.append(entry[0] + HEADER_SEPARATOR + entry[1] + constants.CRLF)
+            else:
+                name = entry[0]
+                for index in xrange(1, len(entry)):
+                    parts.append(name + HEADER_SEPARATOR + entry[index] + constants.CRLF)
 
-        return result + constants.CRLF
+        parts.append(constants.CRLF)
+        return "".join(parts)
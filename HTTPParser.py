@@ -0,0 +1,97 @@
+"""
+Parses a raw request (request line and headers) into an HTTPRequest.
+The request is scanned once: the request line is matched against a single
+precompiled pattern, and the whole header block is validated and tokenized by
+two precompiled patterns instead of being sliced line by line. Every header is
+split at its first colon, so values such as "Host: a:8080" are kept whole.
+The sizes of the request line, of every header line and the number
+of headers are limited.
+Usage:
+request = HTTPParser.parse_request(raw_request)
+may raise RequestTooLargeError (a ValueError) if a limit is exceeded or
+ValueError for any other malformed request.
+"""
+import re
+import constants
+import HTTPHeaders
+import HTTPRequest
+from server_constants import MAX_REQUEST_LINE_SIZE, MAX_HEADER_LINE_SIZE, MAX_HEADERS_COUNT
+
+
+HEAD_END = constants.CRLF * 2
+# method, uri (with optional parameters) and version
+REQUEST_LINE_PATTERN = re.compile(r"([A-Z]{3,7}) ([/a-zA-Z._\-0-9]+(?:\?[a-zA-Z._\-0-9=&]*)?)"
+                                  r" (HTTP/1\.[01])\Z")
+# the name of a header is an RFC 7230 token
+TOKEN = r"[!#$%&'*+.^_`|~0-9A-Za-z\-]+"
+# a whole block of header lines, each one ending with CRLF
+HEADERS_BLOCK_PATTERN = re.compile(r"(?:{}:[^\r\n]*\r\n)*\Z".format(TOKEN))
+# name and value of a single header, whitespace around the value is dropped
+# (the value is matched greedily and gives back only trailing whitespace,
+# a non greedy value would be matched one character at a time)
+HEADER_PATTERN = re.compile(r"({}):[ \t]*((?:[^\r\n]*[^\r\n \t])?)[ \t]*\r\n".format(TOKEN))
+
+
+class RequestTooLargeError(ValueError):
+    """
+    Raised when a request exceeds one of the size limits
+    """
+    pass
+
+
+def parse_request(request, max_request_line_size=MAX_REQUEST_LINE_SIZE,
+                  max_header_line_size=MAX_HEADER_LINE_SIZE,
+                  max_headers_count=MAX_HEADERS_COUNT):
+    """
+    Validates and tokenizes a request
+    :type request: str
+    :param request: The request line and headers, including the empty line
+                    ending them. Anything after the empty line is ignored.
+    :param max_request_line_size: maximal length of the request line
+    :param max_header_line_size: maximal length of a single header line
+    :param max_headers_count: maximal number of headers
+    :rtype: HTTPRequest.HTTPRequest
+    may raise ValueError or RequestTooLargeError
+    """
+    request_line_end = request.find(constants.CRLF)
+    if request_line_end == -1:
+        raise ValueError("No CR LF found in request")
+
+    if request_line_end > max_request_line_size:
+        raise RequestTooLargeError("Request line is longer than {}".format(
+            max_request_line_size))
+    request_line = request[:request_line_end]
+    match = REQUEST_LINE_PATTERN.match(request_line)
+    if match is None:
+        raise ValueError("Invalid request line: {}".format(request_line))
+    method, uri, version = match.groups()
+
+    head_end = request.find(HEAD_END, request_line_end)
+    if head_end == -1:
+        raise ValueError("End of headers not found")
+    # every header line including its CRLF
+    headers_block = request[request_line_end + len(constants.CRLF):
+                            head_end + len(constants.CRLF)]
+
+    if HEADERS_BLOCK_PATTERN.match(headers_block) is None:
+        raise ValueError("Invalid headers: {}".format(headers_block))
+
+    # a block shorter than the limit can't have a line that exceeds it
+    if len(headers_block) > max_header_line_size:
+        for line in headers_block.split(constants.CRLF):
+            if len(line) > max_header_line_size:
+                raise RequestTooLargeError("Header line is longer than {}".format(
+                    max_header_line_size))
+
+    fields = HEADER_PATTERN.findall(headers_block)
+    if len(fields) > max_headers_count:
+        raise RequestTooLargeError("More than {} headers".format(max_headers_count))
+
+    headers = HTTPHeaders.HTTPHeaders()
+    headers.update(fields)
+
+    parsed_request = HTTPRequest.HTTPRequest(headers=headers)
+    parsed_request.set_method(method)
+    parsed_request.set_uri(uri)
+    parsed_request.set_version(version)
+    return parsed_request
@@ -24,16 +24,20 @@ class HTTPRequest(object):
         self._uri = ""
         self._parameters = {}
 
-        try:
-            self._headers = HTTPHeaders.HTTPHeaders(headers)
-        except ValueError:
-            raise
+        if isinstance(headers, HTTPHeaders.HTTPHeaders):
+            self._headers = headers
+        else:
+            try:
+                self._headers = HTTPHeaders.HTTPHeaders(headers)
+            except ValueError:
+                raise
 
         self._debug = debug
-        try:
-            self._parse_request_line(request_line)
-        except ValueError:
-            raise
+        if request_line:
+            try:
+                self._parse_request_line(request_line)
+            except ValueError:
+                raise
 
     def _parse_request_line(self, request_line):
         """
@@ -50,14 +54,13 @@ class HTTPRequest(object):
 
         self._method = request_components[0]
 
-        self._uri = request_components[1]
-        self._extract_params_to_dictionary(self._uri)
+        self.set_uri(request_components[1])
 
         # validate version
         version = request_components[2].split("/")
         if len(version) != 2:
             raise ValueError("Unknown version {}".format(request_components[2]))
-        self._version = version
+        self._version = request_components[2]
 
     def _extract_params_to_dictionary(self, uri):
         """
@@ -65,9 +68,10 @@ class HTTPRequest(object):
         :param uri:
         :return:
         """
+        self._parameters = {}
         parameters_start_point = uri.find(PARAM_START)
         if parameters_start_point == -1:
-            self._parameters = {}
+            return
 
         params = uri[parameters_start_point + 1:]
         params_list = params.split(PARAM_SEPARATOR)
@@ -103,7 +107,7 @@ class HTTPRequest(object):
 
     def get_version(self):
         """
-        :return:current value of member _version1
+        :return:current value of member _version e.g "HTTP/1.1"
         """
         return self._version
 
@@ -138,6 +142,18 @@ class HTTPRequest(object):
     def get_uri(self):
         return self._uri
 
+    def set_uri(self, uri):
+        """
+        Sets the uri and extracts its parameters
+        :param uri: e.g /say_hello?name=Michael
+        :return:
+        may throw TypeError if uri isn't string
+        """
+        if not isinstance(uri, str):
+            raise TypeError("Unexpected type {}".format(type(uri)))
+        self._uri = uri
+        self._extract_params_to_dictionary(uri)
+
     def get_params(self):
         return self._parameters
 
@@ -3,23 +3,26 @@ import constants
 
 
 class HTTPResponse(object):
-    def __init__(self, version=1.0, status_code=0,
+    def __init__(self, version=1.1, status_code=0,
                  phrase="", headers="", data=""):
         """
 
-        :param version: The version of the http response (float) default is 1.0
+        :param version: The version of the http response (float) default is 1.1
         :param status_code: e.g 200, 404 etc. (int)
         :param phrase: A phrase that indicates what the status code means (Not Found, OK)
                        (str)
         :param headers: can be either HTTPHeaders or a valid string
         :param data: Consider this one an optional parameter. The user may not use this
                      one and then chain the data in its own code: build_reponse() + data
+                     May also be an iterator (e.g a generator) of strings, the
+                     body is then streamed by the server (see is_streamed).
+                     A unicode string is encoded to UTF-8
         """
         self._headers = HTTPHeaders.HTTPHeaders()
-        self._version = 1.0
+        self._version = 1.1
         self._phrase = ""
         self._status_code = 0
-        self._data = data
+        self._data = data.encode("utf-8") if isinstance(data, unicode) else data
 
         try:
             self.set_headers(headers)
@@ -34,10 +37,22 @@ class HTTPResponse(object):
         builds an http response when called on an object
         :return: A string that is the full http response
         """
+        return "".join(self.build_response_buffers())
+
+    def build_response_buffers(self):
+        """
+        builds an http response as separate buffers, so the body is never
+        copied into a larger string. Send it with HTTPConnection.send_buffers.
+        :return: A list of the status line, the headers block (including
+                 the empty line ending it) and the data if there is any.
+                 Streamed data isn't included.
+        """
         status_line = "HTTP/{} {} {}{}".format(self._version,
                                                self._status_code,
                                                self._phrase, constants.CRLF)
-        return status_line + self._headers.build_headers() + self._data
+        if not self._data or self.is_streamed():
+            return [status_line, self._headers.build_headers()]
+        return [status_line, self._headers.build_headers(), self._data]
 
     def set_headers(self, headers):
         if isinstance(headers, str):
@@ -63,13 +78,27 @@ class HTTPResponse(object):
         return self._version
 
     def set_data(self, data):
-        if not isinstance(data, str):
-            raise TypeError("Expected type is {}".format(str))
+        """
+        :param data: a string or an iterator of strings, a unicode string is
+                     encoded to UTF-8
+        may raise TypeError
+        """
+        if not isinstance(data, basestring) and not hasattr(data, "__iter__"):
+            raise TypeError("Expected type is {} or an iterator".format(str))
+        if isinstance(data, unicode):
+            data = data.encode("utf-8")
         self._data = data
 
     def get_data(self):
         return self._data
 
+    def is_streamed(self):
+        """
+        :return: True if the data is an iterator of strings which is sent as
+                 it is produced instead of a string
+        """
+        return not isinstance(self._data, basestring) and hasattr(self._data, "__iter__")
+
     def set_status_code(self, status_code):
         if not isinstance(status_code, int):
             raise TypeError("Expected type is {}".format(int))
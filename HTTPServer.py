@@ -6,28 +6,79 @@ Construction- you must provide to the __init__ method an address(ip, port) and
               HTTPServer(root=root_path, address=("127.0.0.1", 8080)
 Starting the server- just use the method start_server from the main code.
                      Keep in mind that the method is a blocking code piece.
+                     start_server handles a single client at a time, in order
+                     to handle several clients concurrently use
+                     start_threaded_server(pool_size, queue_size) instead.
+                     start_event_loop_server serves all the clients from a
+                     single thread with non blocking sockets, which is the
+                     cheapest way to hold many idle keep-alive connections.
+                     start_prefork_server(workers, engine) forks several
+                     processes that share the listening socket, each running
+                     one of the engines above, so all the cores are used.
+Static files- load_manifest() may be called before starting, so the metadata
+              of the files in root is kept in memory instead of being read
+              from the disk on every request.
+Server functions- requests whose path is routed in server_functions.py (see
+                  its route decorator) are answered by the routed function
+                  instead of a file.
+Metrics- requests, bytes, latencies, connections and the caches are recorded
+         in Metrics.REGISTRY, served by /server-status.
+Tracing and profiling- enable_tracing(hook) calls hook with the phase timings
+                       of every request, enable_profiling(sample_every)
+                       profiles one request out of sample_every (see Tracing.py).
+Access log- enable_access_log(path) logs every request from a background
+            thread (see AccessLog.py).
 Termination- Just use a keyboard interrupt
 """
 
 import socket
+import AccessLog
 import constants
-import HTTPRequest
-import HTTPValidation
-import HTTPResponse
+import CompressionCache
+import HTTPConnection
+import DocumentManifest
+import ErrorPages
+import EventLoop
+import Prefork
+import HTTPParser
 import HTTPHeaders
-import os.path as path
+import Metrics
+import os
+import PathResolver
+import Queue
 import public_response_functions
+import range_requests
+from public_response_functions import get_date_header_line
 from server_constants import *
 import server_functions
+import StaticCache
+import threading
+import ThreadPool
+import time
+import Tracing
+import ValidatorCache
 
-# determines how much information will be printed
-# TODO: add a logfile
+HTTP_1_0 = "HTTP/1.0"
+# the route label of requests that aren't answered by a server function
+STATIC_ROUTE = "static"
+INVALID_ROUTE = "invalid"
+PARSE_PHASE = (("phase", "parse"),)
+RESOLVE_PHASE = (("phase", "resolve"),)
+READ_PHASE = (("phase", "read"),)
+SEND_PHASE = (("phase", "send"),)
+
+# determines how much information will be printed, requests are logged by
+# the access log (see enable_access_log)
 DEBUG_LEVEL = 0
 
 
 class HTTPServer(object):
     def __init__(self, root, restricted_folders,
-                 restricted_page=RESTRICTED_HTML_PAGE, address=constants.ADDR):
+                 restricted_page=RESTRICTED_HTML_PAGE, address=constants.ADDR,
+                 static_cache_size=STATIC_CACHE_SIZE,
+                 compression_cache_size=COMPRESSION_CACHE_SIZE,
+                 max_keep_alive_requests=MAX_KEEP_ALIVE_REQUESTS,
+                 max_connections=MAX_CONNECTIONS, timeouts=None):
         """
         Constructs an HTTPServer object
         :type root: str
@@ -37,11 +88,47 @@ class HTTPServer(object):
         :type address: tuple
         :param address: The server's socket will be bound to
                         the given address tuple e.g ("localhost", 8080)
+        :type static_cache_size: int
+        :param static_cache_size: The maximal number of bytes of static files
+                                  kept in memory, 0 disables the cache
+        :type compression_cache_size: int
+        :param compression_cache_size: The maximal number of bytes of
+                                       compressed files kept in memory, 0
+                                       disables compressing on the fly
+        :type max_keep_alive_requests: int
+        :param max_keep_alive_requests: The number of requests served on a
+                                        single connection before it is closed
+        :type max_connections: int
+        :param max_connections: The maximal number of open connections (per
+                                process with start_prefork_server), further
+                                clients get a 503 response right away
+        :type timeouts: HTTPConnection.Timeouts
+        :param timeouts: The timeouts of the connections, None for the defaults
         """
         self._root = root
         self._restricted_folders = restricted_folders
         self._restricted_html = restricted_page
-        self._client = socket.socket()
+        self._static_cache = StaticCache.StaticCache(max_size=static_cache_size)
+        self._path_resolver = PathResolver.PathResolver(root, restricted_folders)
+        self._manifest = None
+        self._validators = ValidatorCache.ValidatorCache()
+        self._compression = CompressionCache.CompressionCache(max_size=compression_cache_size)
+        self._error_pages = ErrorPages.ErrorPages(root, restricted_page)
+        self._max_keep_alive_requests = max_keep_alive_requests
+        self._router = server_functions.get_router()
+        self._max_connections = max_connections
+        self._timeouts = timeouts if timeouts is not None else HTTPConnection.Timeouts()
+        self._open_connections = 0
+        self._connections_lock = threading.Lock()
+        # the pool of start_threaded_server
+        self._pool = None
+        self._event_loop = None
+        self._metrics = Metrics.REGISTRY
+        self._register_gauges()
+        # None while tracing/profiling are disabled
+        self._tracer = None
+        self._profiler = None
+        self._access_log = None
         try:
             self._socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
 
@@ -52,7 +139,7 @@ class HTTPServer(object):
             self._socket.bind(address)
             if DEBUG_LEVEL >= 0:
                 print "Listening on: {}".format(address)
-            self._socket.listen(5)
+            self._socket.listen(LISTEN_BACKLOG)
         except socket.error as err:
             if DEBUG_LEVEL > 0:
                 print "Got error: {}".format(err.message)
@@ -63,112 +150,848 @@ class HTTPServer(object):
         method that handles request
         :return: None
         """
-        while True:
-            if DEBUG_LEVEL >= 0:
-                print "Awaiting connection..."
+        self._start_background_threads()
+        try:
+            while True:
+                if DEBUG_LEVEL >= 0:
+                    print "Awaiting connection..."
 
-            (client_socket, client_address) = self._socket.accept()
-            if DEBUG_LEVEL >= 0:
-                print "Got connection from: {}".format(client_address)
+                connection = self._accept_connection()
+                with self._connections_lock:
+                    self._open_connections += 1
+                self._serve_connection(connection)
+        finally:
+            self._stop_background_threads()
+            self._socket.close()
+
+    def start_threaded_server(self, pool_size=DEFAULT_POOL_SIZE,
+                              queue_size=DEFAULT_QUEUE_SIZE):
+        """
+        Accepts connections and hands each one of them to a pool of
+        worker threads, so a single client can't block the others.
+        :type pool_size: int
+        :param pool_size: The number of connections handled concurrently
+        :type queue_size: int
+        :param queue_size: The number of accepted connections that may wait
+                           for a free worker. When the queue is full (or
+                           max_connections are open) new clients get a 503
+                           response instead of waiting, and while connections
+                           wait the workers end their persistent connections
+                           (with Connection: close) after the current response.
+        :return: None
+        """
+        self._start_background_threads()
+        pool = ThreadPool.ThreadPool(self._serve_connection, pool_size,
+                                     queue_size, DEBUG_LEVEL)
+        pool.start()
+        self._pool = pool
+        try:
+            while True:
+                connection = self._accept_connection()
+                if self._open_connections >= self._max_connections:
+                    self._shed_connection(connection)
+                    continue
+
+                with self._connections_lock:
+                    self._open_connections += 1
+                try:
+                    pool.submit(connection, block=False)
+                except Queue.Full:
+                    self._connection_closed()
+                    self._shed_connection(connection)
+        finally:
+            self._pool = None
+            pool.stop()
+            self._stop_background_threads()
+            self._socket.close()
+
+    def _accept_connection(self):
+        """
+        Accepts a single client
+        :rtype: HTTPConnection.HTTPConnection
+        :return: the state of the new connection
+        """
+        (client_socket, client_address) = self._socket.accept()
+        if DEBUG_LEVEL >= 0:
+            print "Got connection from: {}".format(client_address)
+
+        return HTTPConnection.HTTPConnection(client_socket, client_address,
+                                             timeouts=self._timeouts)
+
+    def _serve_connection(self, connection):
+        """
+        Called by the workers of start_threaded_server
+        :return: None
+        """
+        try:
+            self._listen_to_requests(connection)
+        finally:
+            self._connection_closed()
+
+    def _connection_closed(self):
+        with self._connections_lock:
+            self._open_connections -= 1
+
+    def _shed_connection(self, connection):
+        """
+        Answers a client the server has no room for, the pre-built 503
+        response is sent without reading the request
+        :return: None
+        """
+        if DEBUG_LEVEL >= 0:
+            print "Overloaded, rejecting {}".format(connection.get_address())
+        self._send_quietly(connection,
+                           public_response_functions.get_service_unavailable_response())
+        connection.close()
 
-            self._client = client_socket
+    def start_event_loop_server(self):
+        """
+        Serves all the connections from a single thread with an event loop.
+        Requests go through the same pipeline as in start_server.
+        :return: None
+        """
+        self._start_background_threads()
+        loop = EventLoop.EventLoop(self._socket, self._handle_request, DEBUG_LEVEL,
+                                   self._max_connections, self._timeouts)
+        self._event_loop = loop
+        try:
+            loop.run()
+        finally:
+            self._event_loop = None
+            self._stop_background_threads()
+            self._socket.close()
+
+    def start_prefork_server(self, workers=DEFAULT_WORKERS,
+                             engine=ENGINE_EVENT_LOOP):
+        """
+        Forks worker processes that accept connections from the shared
+        listening socket. Workers that crash are replaced.
+        :type workers: int
+        :param workers: The number of worker processes
+        :type engine: str
+        :param engine: The engine every worker runs, one of ENGINE_BLOCKING,
+                       ENGINE_THREADED and ENGINE_EVENT_LOOP
+        :return: None
+        """
+        engines = {ENGINE_BLOCKING: self.start_server,
+                   ENGINE_THREADED: self.start_threaded_server,
+                   ENGINE_EVENT_LOOP: self.start_event_loop_server}
+        if engine not in engines:
+            raise ValueError("Unknown engine {}".format(engine))
+
+        supervisor = Prefork.WorkerSupervisor(engines[engine], workers, DEBUG_LEVEL)
+        try:
+            supervisor.run()
+        finally:
+            self._socket.close()
+
+    def load_manifest(self, snapshot_path=None,
+                      poll_interval=MANIFEST_POLL_INTERVAL):
+        """
+        Scans the root (or loads the snapshot of a former scan) before the
+        server starts. From then on whether a file exists and its Content-Type
+        are answered from memory, and a watcher thread started with the
+        server picks up changed files every poll_interval seconds.
+        :type snapshot_path: str
+        :param snapshot_path: a file the manifest is saved to, so the next
+                              start doesn't have to scan the root
+        :param poll_interval: seconds between two scans of the watcher
+        :return: None
+        """
+        manifest = DocumentManifest.DocumentManifest(
+            self._root, self._path_resolver, snapshot_path, poll_interval, DEBUG_LEVEL)
+        manifest.load()
+        manifest.add_listener(self._on_files_changed)
+        self._manifest = manifest
+        self._path_resolver.set_manifest(manifest)
 
-            self._listen_to_requests()
+    def enable_tracing(self, hook):
+        """
+        Adds a hook that is called with the Tracing.RequestTrace of every
+        request, may be called several times
+        :type hook: function
+        :return: None
+        """
+        if self._tracer is None:
+            self._tracer = Tracing.Tracer()
+        self._tracer.add_hook(hook)
 
-        self._socket.close()
+    def disable_tracing(self):
+        self._tracer = None
+
+    def enable_profiling(self, sample_every=PROFILE_SAMPLE_EVERY,
+                         output_path=PROFILE_OUTPUT_PATH, dump_every=PROFILE_DUMP_EVERY):
+        """
+        Profiles one request out of sample_every with cProfile, the samples
+        are aggregated into a pstats file (see Tracing.Profiler)
+        :return: the Tracing.Profiler, whose dump method writes the file
+        may raise ValueError if sample_every isn't a positive int
+        """
+        self._profiler = Tracing.Profiler(sample_every, output_path, dump_every)
+        return self._profiler
 
-    def _listen_to_requests(self):
+    def disable_profiling(self):
         """
-        Accepts a request from the client, closes the connection
-        if the client terminated the connection, validates that the
-        request is an http request, and sends it to _send_response
-        for interpretation.
+        Stops profiling and dumps the samples that were taken
+        :return: None
+        may raise IOError
+        """
+        profiler = self._profiler
+        self._profiler = None
+        if profiler is not None:
+            profiler.dump()
+
+    def enable_access_log(self, path=ACCESS_LOG_PATH, log_format=AccessLog.COMBINED_FORMAT,
+                          buffer_size=ACCESS_LOG_BUFFER_SIZE,
+                          max_size=ACCESS_LOG_MAX_SIZE, backup_count=ACCESS_LOG_BACKUP_COUNT):
+        """
+        Logs every request to path, call it before starting the server.
+        Records are buffered and written by a background thread, when the
+        buffer is full they're dropped (counted by access_log_dropped_total).
+        :param path: The log file, {pid} is replaced by the id of the process
+                     so prefork workers may write files of their own
+        :param log_format: AccessLog.COMMON_FORMAT, COMBINED_FORMAT or JSON_FORMAT
+        :param buffer_size: The number of records buffered in memory
+        :param max_size: The size in bytes the file is rotated at
+        :param backup_count: The number of rotated files kept
+        :rtype: AccessLog.AccessLog
+        may raise ValueError
+        """
+        self._access_log = AccessLog.AccessLog(path, log_format, buffer_size,
+                                               max_size=max_size, backup_count=backup_count,
+                                               debug=DEBUG_LEVEL)
+        self._metrics.add_gauge("access_log_dropped_total",
+                                _get_stat_function(self._access_log, "dropped"),
+                                metric_type=Metrics.COUNTER)
+        return self._access_log
+
+    def _register_gauges(self):
+        """
+        Registers the metrics that are read from the server's state
+        :return: None
+        """
+        self._metrics.add_gauge("http_active_connections", self._get_active_connections)
+        caches = (("path", self._path_resolver), ("static", self._static_cache),
+                  ("validators", self._validators), ("compression", self._compression),
+                  ("response", server_functions.RESPONSE_CACHE))
+        for name, cache in caches:
+            labels = (("cache", name),)
+            for counter in ("hits", "misses"):
+                self._metrics.add_gauge("cache_{}_total".format(counter),
+                                        _get_stat_function(cache, counter), labels,
+                                        Metrics.COUNTER)
+
+    def _get_active_connections(self):
+        loop = self._event_loop
+        if loop is not None:
+            return loop.get_connections_count()
+        return self._open_connections
+
+    def _record_request(self, connection, route, started, request=None, trace=None):
+        """
+        Records the metrics of a request whose response was sent, logs it
+        and ends its trace
+        :param route: The route label of the request
+        :param started: The time the request started being handled
+        :type request: HTTPRequest.HTTPRequest
+        :param request: None if the request couldn't be parsed
+        :type trace: Tracing.RequestTrace
+        :param trace: None if tracing is disabled
+        :return: None
+        """
+        status, bytes_sent, send_seconds = connection.get_response_stats()
+        if trace is not None:
+            trace.mark("send")
+            trace.route = route
+            trace.status = status
+            self._tracer.finish(trace)
+        route_labels = (("route", route),)
+        self._metrics.increment("http_requests_total", route_labels + (("status", status),))
+        self._metrics.increment("http_response_bytes_total", route_labels, bytes_sent)
+        now = time.time()
+        self._metrics.observe("http_request_duration_seconds", now - started, route_labels)
+        if send_seconds is not None:
+            self._metrics.observe("http_phase_seconds", send_seconds, SEND_PHASE)
+
+        access_log = self._access_log
+        if access_log is not None:
+            if request is not None:
+                headers = request.get_headers()
+                access_log.log(AccessLog.AccessRecord(
+                    connection.get_address()[0], now, request.get_method(), request.get_uri(),
+                    request.get_version(), status, bytes_sent, headers.get("Referer"),
+                    headers.get("User-Agent"), now - started))
+            else:
+                access_log.log(AccessLog.AccessRecord(
+                    connection.get_address()[0], now, None, None, None, status, bytes_sent,
+                    None, None, now - started))
+
+    def _start_background_threads(self):
+        """
+        Called by every engine when it starts, so each prefork worker
+        runs a manifest watcher and an access log writer of its own
+        :return: None
+        """
+        if self._manifest is not None:
+            self._manifest.start_watcher()
+        if self._access_log is not None:
+            self._access_log.start()
+
+    def _stop_background_threads(self):
+        """
+        Called by every engine when it stops, the buffered access log
+        records are written
+        :return: None
+        """
+        if self._access_log is not None:
+            self._access_log.close()
+
+    def _on_files_changed(self, changed_paths):
+        """
+        Called by the manifest's watcher with the real paths of the files
+        that were added, removed or modified
+        :return: None
+        """
+        self._path_resolver.invalidate()
+        for real_path in changed_paths:
+            self._static_cache.invalidate(real_path)
+            self._validators.invalidate(real_path)
+            self._compression.invalidate(real_path)
+
+    def _listen_to_requests(self, connection):
+        """
+        Reads the requests of the client one after the other, closes the
+        connection if the client terminated the connection and sends every
+        request to _handle_request for interpretation.
+        :type connection: HTTPConnection.HTTPConnection
+        :param connection: The connection to serve
         :return: None
         """
         while True:
             try:
-                request = self._client.recv(1024)
+                request = connection.read_request()
+            except HTTPConnection.RequestTimeoutError as err:
+                if DEBUG_LEVEL >= 0:
+                    print "{}, closing...".format(err)
+                self._send_quietly(connection,
+                                   public_response_functions.get_request_timeout_response())
+                connection.close()
+                return True
             except socket.error as err:
                 if DEBUG_LEVEL >= 1:
                     print "Got socket error: {}".format(err.message)
-                self._client.close()
+                connection.close()
+                return True
+            except ValueError as err:
+                if DEBUG_LEVEL >= 0:
+                    print "{}, closing...".format(err)
+                self._send_quietly(connection,
+                                   public_response_functions.get_request_too_large_response())
+                connection.close()
                 return True
 
             if not request:
                 if DEBUG_LEVEL >= 0:
                     print "Closing connection"
-                self._client.close()
+                connection.close()
                 return True
 
-            if DEBUG_LEVEL >= 2:
-                print request
-
-            if not HTTPValidation.validate_request(request):
-                if DEBUG_LEVEL >= 0:
-                    print "Invalid request, closing..."
-                self._client.send(public_response_functions.get_error_response())
-                self._client.close()
+            try:
+                if not self._handle_request(connection, request):
+                    if DEBUG_LEVEL >= 0:
+                        print "Closing connection..."
+                    connection.close()
+                    return
+            except socket.error as err:
+                if DEBUG_LEVEL >= 1:
+                    print "Got socket error: {}".format(err.message)
+                connection.close()
                 return True
 
-            if not self._send_response(request):
-                if DEBUG_LEVEL >= 0:
-                    print "Closing connection..."
-                self._client.close()
-                return
+    @staticmethod
+    def _send_quietly(connection, data):
+        """
+        Sends data on a connection that is about to be closed,
+        socket errors are ignored
+        :return: None
+        """
+        try:
+            connection.send(data)
+        except socket.error:
+            pass
 
-    def _send_response(self, request):
+    def _handle_request(self, connection, request):
+        """
+        parses the request (which validates it is an http request),
+        and sends it to _send_response for interpretation.
+        The request is profiled if profiling is enabled and it is sampled.
+        :type connection: HTTPConnection.HTTPConnection
+        :param connection: The connection the request was read from
+        :param request: The raw request
+        :return: False if the connection should be closed
+        may raise socket.error
+        """
+        profiler = self._profiler
+        if profiler is not None and profiler.should_sample():
+            return profiler.runcall(self._process_request, connection, request)
+        return self._process_request(connection, request)
+
+    def _process_request(self, connection, request):
+        """
+        see _handle_request
+        """
+        if DEBUG_LEVEL >= 2:
+            print request
+
+        started = time.time()
+        tracer = self._tracer
+        trace = tracer.start() if tracer is not None else None
+        connection.begin_response()
+        try:
+            request = HTTPParser.parse_request(request)
+        except HTTPParser.RequestTooLargeError as err:
+            if DEBUG_LEVEL >= 0:
+                print "{}, closing...".format(err)
+            connection.send(public_response_functions.get_request_too_large_response())
+            self._record_request(connection, INVALID_ROUTE, started, trace=trace)
+            return False
+        except ValueError as err:
+            if DEBUG_LEVEL >= 0:
+                print "Invalid request ({}), closing...".format(err)
+            connection.send(public_response_functions.get_error_response())
+            self._record_request(connection, INVALID_ROUTE, started, trace=trace)
+            return False
+
+        self._metrics.observe("http_phase_seconds", time.time() - started, PARSE_PHASE)
+        if trace is not None:
+            trace.mark("parse")
+            trace.method = request.get_method()
+            trace.uri = request.get_uri()
+        return self._send_response(connection, request, started, trace)
+
+    def _send_response(self, connection, request, started, trace=None):
         """
         given a valid request, sends an appropriate response to the client
 
-        :param request: The request the server received from the client
+        :type connection: HTTPConnection.HTTPConnection
+        :param connection: The connection the response is sent on
+        :type request: HTTPRequest.HTTPRequest
+        :param request: The parsed request the server received from the client
+        :param started: The time the request started being handled
+        :type trace: Tracing.RequestTrace
+        :param trace: The trace of the request, None if tracing is disabled
         :return: False if the server is to close the connection with the
                  client, or True if the server should wait for the client's next
                  request.
-        Won't raise any exception
+        A server function that raises is answered with a 500 response.
+        may raise socket.error
         """
-        request_line, headers = split_http_request(request)
         if DEBUG_LEVEL > 1:
-            print "Request: {}\nHeaders: {}".format(request_line, headers)
+            print "Request: {} {}\nHeaders: {}".format(
+                request.get_method(), request.get_uri(),
+                request.get_headers().build_headers())
+
+        keep_alive = self._should_keep_alive(connection, request)
+        if not keep_alive:
+            connection_header = "close"
+        elif request.get_version() == HTTP_1_0:
+            # an HTTP/1.0 client closes the connection unless told otherwise
+            connection_header = "keep-alive"
+        else:
+            connection_header = None
+
+        route = self._router.match(request.get_method(), request.get_uri_with_no_params())
+        if trace is not None:
+            trace.mark("route")
+        if route is not None:
+            function, path_parameters = route
+            parameters = request.get_params()
+            if path_parameters:
+                parameters = dict(parameters, **path_parameters)
+            try:
+                response, flag = function(parameters)
+            except Exception as err:
+                if DEBUG_LEVEL >= 0:
+                    print "{} failed: {}".format(function.__name__, err)
+                connection.send(public_response_functions.get_error_response())
+                self._record_request(connection, function.__name__, started, request, trace)
+                return False
+            if trace is not None:
+                trace.mark("handler")
+            keep_alive = self._send_function_response(connection, request, response,
+                                                      keep_alive and flag)
+            self._record_request(connection, function.__name__, started, request, trace)
+            return keep_alive
+
+        keep_alive = self._send_static_file(connection, request, connection_header,
+                                            trace) and keep_alive
+        self._record_request(connection, STATIC_ROUTE, started, request, trace)
+        return keep_alive
+
+    def _should_keep_alive(self, connection, request):
+        """
+        Applies the connection rules of HTTP/1.1: HTTP/1.1 connections are
+        persistent unless the client sent Connection: close, HTTP/1.0 ones
+        only if the client sent Connection: keep-alive. A connection is also
+        closed after max_keep_alive_requests requests, or if the request has
+        a chunked body since the next request can't be found after it.
+        With start_threaded_server a connection is closed as well while other
+        connections wait for a worker, a worker waiting for the next request
+        of a client is better spent on them. This is decided before the
+        response is sent so it tells the client with Connection: close.
+        :return: True if the connection should be kept open after the response
+        """
+        headers = request.get_headers()
+        tokens = [token.strip().lower() for token in headers.get("Connection", "").split(",")]
+        if "close" in tokens or "Transfer-Encoding" in headers:
+            return False
+        if request.get_version() == HTTP_1_0 and "keep-alive" not in tokens:
+            return False
+        pool = self._pool
+        if pool is not None and pool.get_pending():
+            return False
+        return connection.get_requests_count() < self._max_keep_alive_requests
 
-        request = HTTPRequest.HTTPRequest(request_line, headers, DEBUG_LEVEL)
+    def _send_function_response(self, connection, request, response, keep_alive):
+        """
+        Sends the response of a server function with the Connection header
+        the request calls for. A body without Content-Length is sent with
+        Transfer-Encoding: chunked to HTTP/1.1 clients, HTTP/1.0 clients get
+        it delimited by closing the connection. A streamed body (see
+        HTTPResponse.is_streamed) is sent as it is produced.
+        :type response: HTTPResponse.HTTPResponse
+        :param keep_alive: False if the connection is closed after the response
+        :return: False if the connection should be closed
+        may raise socket.error
+        """
+        response.set_version(HTTP_VERSION)
+        headers = response.get_headers()
+        chunked = False
+        if "Content-Length" not in headers and "Transfer-Encoding" not in headers:
+            if request.get_version() == HTTP_1_0:
+                keep_alive = False
+            else:
+                headers["Transfer-Encoding"] = "chunked"
+                chunked = True
 
-        uri = request.get_uri_with_no_params()
-        uri = uri[1:] if uri[0] == "/" else uri
+        if not keep_alive:
+            headers["Connection"] = "close"
+        elif request.get_version() == HTTP_1_0:
+            headers["Connection"] = "keep-alive"
+        elif "Connection" in headers:
+            # persistent is the default of HTTP/1.1
+            del headers["Connection"]
 
-        if uri in server_functions.AVAILABLE_FUNCTIONS.keys():
-            response, flag = server_functions.\
-                             AVAILABLE_FUNCTIONS[uri](request.get_params())
-            self._client.send(response.build_response())
-            return flag
+        buffers = response.build_response_buffers()
+        if response.is_streamed():
+            connection.send_stream(response.get_data(), header="".join(buffers),
+                                   chunked=chunked)
+            return keep_alive
 
-        result = self._check_status_errors(request)
+        if chunked:
+            if len(buffers) > 2:
+                buffers[2] = public_response_functions.encode_chunk(buffers[2])
+            buffers.append(public_response_functions.LAST_CHUNK)
+        connection.send_buffers(buffers)
+        return keep_alive
+
+    def _send_static_file(self, connection, request, connection_header, trace=None):
+        """
+        Sends a file from root, or the error the request calls for
+        :param connection_header: The value of the Connection header of the
+                                  response, None if it shouldn't have one
+        :param trace: The trace of the request, None if tracing is disabled
+        :return: False if the connection should be closed
+        may raise socket.error
+        """
+        resolve_started = time.time()
+        resolved_path = self._path_resolver.resolve(request.get_uri_with_no_params())
+        self._metrics.observe("http_phase_seconds", time.time() - resolve_started,
+                              RESOLVE_PHASE)
+        if trace is not None:
+            trace.mark("resolve")
+        full_file_path = resolved_path.real_path
+        result = self._check_status_errors(connection, request, resolved_path,
+                                           connection_header)
+        if trace is not None:
+            trace.mark("check")
         if result == -1:
             return False
         elif result == 1:
             return True
 
-        full_file_path = self._get_full_path(request)
+        file_info = self._manifest.get(full_file_path) if self._manifest is not None else None
+        validators = self._validators.get(full_file_path, file_info)
+        if validators is not None and validators.is_not_modified(request.get_headers()):
+            # the client's copy is up to date, the file isn't read
+            connection.send(validators.get_not_modified_response(connection_header))
+            return True
+
+        range_requested = "Range" in request.get_headers()
+        cache_entry = self._static_cache.get(full_file_path)
+        if trace is not None:
+            trace.mark("lookup")
+        # ranges are served from the file as it is, never compressed
+        if not range_requested and self._send_compressed(
+                connection, request, full_file_path, file_info, validators, cache_entry,
+                connection_header):
+            return True
+
+        if cache_entry is not None:
+            if range_requested and self._send_ranges(
+                    connection, request, full_file_path, file_info, validators,
+                    cache_entry.size, connection_header, body=cache_entry.body):
+                return True
+            connection.send_buffers([cache_entry.headers,
+                                     get_date_header_line(connection_header),
+                                     cache_entry.body])
+            return True
+
+        read_started = time.time()
+        try:
+            requested_file = open(full_file_path, "rb")
+            file_stat = os.fstat(requested_file.fileno())
+        except (IOError, OSError) as err:
+            if DEBUG_LEVEL >= 0:
+                print "Couldn't open {}: {}".format(full_file_path, err)
+            connection.send(self._get_404_response(connection_header))
+            return True
+
+        file_size = file_stat.st_size
+        # reading a file into the cache is part of the phase, see below
+        if range_requested or not self._static_cache.is_cacheable(file_size):
+            self._metrics.observe("http_phase_seconds", time.time() - read_started,
+                                  READ_PHASE)
+            if trace is not None:
+                trace.mark("read")
+        validators = self._validators.put_stat(full_file_path, file_stat)
+        # only the requested parts are streamed from the file
+        if range_requested and self._send_ranges(
+                connection, request, full_file_path, file_info, validators,
+                file_size, connection_header, requested_file=requested_file):
+            return True
+
+        headers = HTTPHeaders.HTTPHeaders()
+        public_response_functions.add_default_headers(headers, include_date=False)
+        headers["Content-Length"] = str(file_size)
+        content_type = self._get_content_type(full_file_path, file_info)
+        headers["Content-Type"] = content_type
+        headers["Accept-Ranges"] = "bytes"
+        if CompressionCache.is_compressible(content_type, file_size):
+            # caches must not give this response to clients that accept gzip
+            headers["Vary"] = "Accept-Encoding"
+        validators.add_headers(headers)
+
+        # the Date header is the only one that changes between responses,
+        # so it is added last and the rest may be cached
+        static_headers = public_response_functions.build_response_template(200, "OK", headers)
+
+        if self._static_cache.is_cacheable(file_size):
+            try:
+                data = requested_file.read()
+            finally:
+                requested_file.close()
+            if not range_requested:
+                self._metrics.observe("http_phase_seconds", time.time() - read_started,
+                                      READ_PHASE)
+                if trace is not None:
+                    trace.mark("read")
+            self._static_cache.put(full_file_path, StaticCache.CacheEntry(
+                data, static_headers, file_stat.st_mtime, file_size))
+            connection.send_buffers([static_headers,
+                                     get_date_header_line(connection_header), data])
+            return True
+
+        # the body is streamed from the file instead of being read into memory
+        connection.send_file(requested_file, 0, file_size,
+                             header=static_headers + get_date_header_line(connection_header))
+        return True
+
+    def _send_compressed(self, connection, request, real_path, file_info, validators,
+                         cache_entry, connection_header):
+        """
+        Sends the file compressed with the encoding negotiated from the
+        request's Accept-Encoding, if it's worth compressing. A precompressed
+        sibling (e.g style.css.gz) is streamed from the disk, otherwise the
+        compressed variant is taken from the compression cache.
+        :param real_path: The real path of the requested file
+        :type file_info: DocumentManifest.FileInfo
+        :param file_info: The metadata of the file from the manifest or None
+        :type validators: ValidatorCache.FileValidators
+        :param validators: The validators of the file
+        :type cache_entry: StaticCache.CacheEntry
+        :param cache_entry: The cached file, if it is cached
+        :param connection_header: The value of the Connection header, if any
+        :return: True if a response was sent, False if the file should be
+                 sent as it is
+        may raise socket.error
+        """
+        accept_encoding = request.get_headers().get("Accept-Encoding")
+        if accept_encoding is None or validators is None:
+            return False
+
+        content_type = self._get_content_type(real_path, file_info)
+        if not CompressionCache.is_compressible(content_type, validators.size):
+            return False
+        encoding = CompressionCache.negotiate_encoding(accept_encoding)
+        if encoding is None:
+            return False
+
+        sibling = None
+        sibling_path = self._compression.get_sibling(real_path, encoding, validators.mtime,
+                                                     self._manifest)
+        if sibling_path is not None:
+            try:
+                sibling = open(sibling_path, "rb")
+                body_size = os.fstat(sibling.fileno()).st_size
+            except (IOError, OSError):
+                sibling = None
+
+        if sibling is None:
+            if not self._compression.can_compress(validators.size):
+                return False
+
+            def load_content():
+                if cache_entry is not None:
+                    return cache_entry.body
+                with open(real_path, "rb") as requested_file:
+                    return requested_file.read()
+
+            try:
+                data = self._compression.get(real_path, encoding, validators.mtime, load_content)
+            except IOError as err:
+                if DEBUG_LEVEL >= 0:
+                    print "Couldn't read {}: {}".format(real_path, err)
+                return False
+            body_size = len(data)
+
+        headers = HTTPHeaders.HTTPHeaders()
+        public_response_functions.add_default_headers(headers, include_date=False)
+        headers["Content-Length"] = str(body_size)
+        headers["Content-Type"] = content_type
+        headers["Content-Encoding"] = encoding
+        headers["Vary"] = "Accept-Encoding"
+        validators.add_headers(headers)
+        # the encoded bytes differ, only a weak comparison may match them
+        headers["ETag"] = "W/" + validators.etag
+        response_head = public_response_functions.build_response_template(
+            200, "OK", headers) + get_date_header_line(connection_header)
 
-        requested_file = open(full_file_path, "r")
-        data = requested_file.read()
-        requested_file.close()
+        if sibling is not None:
+            connection.send_file(sibling, 0, body_size, header=response_head)
+        else:
+            connection.send_buffers([response_head, data])
+        return True
+
+    def _send_ranges(self, connection, request, real_path, file_info, validators,
+                     size, connection_header, body=None, requested_file=None):
+        """
+        Sends the byte ranges the client asked for with a 206 response, a
+        single range as is and several ones as multipart/byteranges.
+        Either body or requested_file must be given.
+        :param real_path: The real path of the requested file
+        :type file_info: DocumentManifest.FileInfo
+        :param file_info: The metadata of the file from the manifest or None
+        :type validators: ValidatorCache.FileValidators
+        :param validators: The validators of the file, used for If-Range
+        :param size: The size of the file
+        :param connection_header: The value of the Connection header, if any
+        :type body: str
+        :param body: The content of the file if it is cached
+        :type requested_file: file
+        :param requested_file: The open file, it is owned by the connection
+                               once a response was sent
+        :return: True if a response was sent, False if the whole file
+                 should be sent instead
+        may raise socket.error
+        """
+        try:
+            ranges = range_requests.get_ranges(request.get_headers(), size, validators)
+        except range_requests.RangeNotSatisfiableError as err:
+            if DEBUG_LEVEL >= 1:
+                print "{}: {}".format(real_path, err)
+            if requested_file is not None:
+                requested_file.close()
+            connection.send(range_requests.get_range_not_satisfiable_response(
+                size, connection_header))
+            return True
+
+        if ranges is None:
+            return False
 
         headers = HTTPHeaders.HTTPHeaders()
-        public_response_functions.add_default_headers(headers)
-        headers["Content-Length"] = str(len(data))
+        public_response_functions.add_default_headers(headers, include_date=False)
+        content_type = self._get_content_type(real_path, file_info)
+        if len(ranges) == 1:
+            first, last = ranges[0]
+            headers["Content-Length"] = str(last - first + 1)
+            headers["Content-Type"] = content_type
+            headers["Content-Range"] = range_requests.get_content_range(first, last, size)
+            parts = [("", first, last - first + 1)]
+            trailer = ""
+        else:
+            multipart_type, part_headers, trailer, body_length = \
+                range_requests.build_multipart_parts(ranges, size, content_type)
+            headers["Content-Length"] = str(body_length)
+            headers["Content-Type"] = multipart_type
+            parts = [(part_header, first, last - first + 1)
+                     for part_header, (first, last) in zip(part_headers, ranges)]
+        if validators is not None:
+            validators.add_headers(headers)
 
-        response = HTTPResponse.HTTPResponse(version=1.0, status_code=200,
-                                             phrase="OK", headers=headers)
-        self._client.send(response.build_response() + data)
+        response_head = public_response_functions.build_response_template(
+            206, "Partial Content", headers) + get_date_header_line(connection_header)
+
+        if requested_file is not None:
+            connection.send_file_ranges(requested_file, parts, response_head, trailer)
+            return True
+
+        buffers = [response_head]
+        for part_header, offset, count in parts:
+            if part_header:
+                buffers.append(part_header)
+            buffers.append(body[offset:offset + count])
+        if trailer:
+            buffers.append(trailer)
+        connection.send_buffers(buffers)
         return True
 
-    def _check_status_errors(self, request):
+    def _get_content_type(self, real_path, file_info):
+        """
+        :type file_info: DocumentManifest.FileInfo
+        :param file_info: The metadata of the file from the manifest or None
+        :return: The MIME type of a file
+        """
+        if file_info is not None:
+            return file_info.content_type
+        return DocumentManifest.guess_content_type(real_path)
+
+    def get_static_cache_stats(self):
+        """
+        :rtype: dict
+        :return: hits, misses and evictions counters of the static cache
+        """
+        return self._static_cache.get_stats()
+
+    def invalidate_paths(self):
+        """
+        Forgets the resolved paths of all the uris, should be called when
+        files in root are added, removed or replaced by links
+        :return: None
+        """
+        self._path_resolver.invalidate()
+
+    def _check_status_errors(self, connection, request, resolved_path, connection_header=None):
         """
         given an HTTPRequest checks for various status errors
         and sends them to the client if necessary. For example:
         if the client tries to access a restricted folder error 403
         will be sent.
+        :param connection: The connection errors are sent on
         :param request:
+        :type resolved_path: PathResolver.ResolvedPath
+        :param resolved_path: The resolved path of the requested file
+        :param connection_header: The value of the Connection header, if any
         :return: 1 if an error was sent and the server shouldn't terminate
                  connection 0 if no errors were sent and -1 in case
                  the server should close the connection with the client
@@ -177,29 +1000,22 @@ class HTTPServer(object):
             if DEBUG_LEVEL >= 0:
                 print "Unsupported request method: {}".format(request.get_method())
             # send code 405
-            response = HTTPResponse.HTTPResponse(version=1.0, status_code=405,
-                                                 phrase="Method Not Allowed")
-            headers = HTTPHeaders.HTTPHeaders()
-            public_response_functions.add_default_headers(headers)
-            headers["Content-Length"] = "0"
-            response.set_headers(headers)
-            self._client.send(response.build_response())
+            connection.send(self._error_pages.get_response(405))
             return -1
 
-        full_file_path = self._get_full_path(request)
-        # check if the root abs path is the first substring at the
-        # start, if not send forbidden response
-        if self._is_restricted(full_file_path):
+        # paths outside root or in a restricted folder get a forbidden response
+        if not resolved_path.allowed:
             if DEBUG_LEVEL >= 0:
-                print "Client tried to access {} which is restricted".format(full_file_path)
-            self._client.send(self._get_restricted_error())
+                print "Client tried to access {} which is restricted".format(
+                    resolved_path.real_path)
+            connection.send(self._get_restricted_error(connection_header))
             return 1
 
-        if not path.isfile(full_file_path):
+        if not resolved_path.exists:
             if DEBUG_LEVEL >= 0:
-                print "File: {} not found".format(full_file_path)
+                print "File: {} not found".format(resolved_path.real_path)
             # send 404 Not Found response
-            self._client.send(self._get_404_response())
+            connection.send(self._get_404_response(connection_header))
             return 1
 
         return 0
@@ -211,17 +1027,7 @@ class HTTPServer(object):
         :param request: HTTPRequest
         :return: a real path to the requested file
         """
-        # get rid of the preceding /
-        url = request.get_uri()[1:] if request.get_uri()[0] == "/" else \
-            request.get_uri()
-
-        # if url is / change to index.html
-        url = "index.html" if url == "" else url
-
-        full_file_path = path.join(self._root, url)
-        full_file_path = path.realpath(full_file_path)
-
-        return full_file_path
+        return self._path_resolver.resolve(request.get_uri_with_no_params()).real_path
 
     def _is_restricted(self, real_path):
         """
@@ -230,75 +1036,23 @@ class HTTPServer(object):
         :param real_path:
         :return:
         """
-        if real_path.find(self._root) != 0:
-            return True
-
-        # get rid of the root part plus the following /
-        real_path = real_path[len(self._root)+1:]
-        for folder in self._restricted_folders:
-            if real_path.find(folder) == 0:
-                return True
-
-        return False
+        return self._path_resolver.is_restricted(real_path)
 
-    def _get_404_response(self):
+    def _get_404_response(self, connection_header=None):
         """
-        builds a typical 404 http response
-        :return: an http not found response
+        :param connection_header: The value of the Connection header, if any
+        :return: an http not found response, the body is not_found.html
+                 if it exists in root
         """
-        response = HTTPResponse.HTTPResponse(version=1.0, status_code=404,
-                                             phrase="Not Found")
-        # try to open not_found.html if it exists and utilize it
-        # for the message
-        # in case opening the file was unsuccessful just create a quick
-        # message
-        try:
-            file_path = path.join(self._root, NOT_FOUND)
-            f = open(file_path, "r")
-        except IOError:
-            message = "<body><h1>Not Found</h1></body>"
-            if DEBUG_LEVEL >= 2:
-                print "File {} wasn't found in root"
-        else:
-            message = f.read()
-            f.close()
-
-        headers = HTTPHeaders.HTTPHeaders()
-        public_response_functions.add_default_headers(headers)
-        headers["Content-Length"] = str(len(message))
-        headers["Content-Type"] = "text/html"
-        response.set_headers(headers)
-
-        response.set_data(message)
-
-        return response.build_response()
+        return self._error_pages.get_response(404, connection_header)
 
-    def _get_restricted_error(self):
+    def _get_restricted_error(self, connection_header=None):
         """
-        builds a typical restricted file/path response
-        :return:
+        :param connection_header: The value of the Connection header, if any
+        :return: an http forbidden response, the body is the restricted page
+                 if it exists in root
         """
-        response = HTTPResponse.HTTPResponse(version=1.0, status_code=403,
-                                             phrase="Forbidden")
-        headers = HTTPHeaders.HTTPHeaders()
-        headers["Content-Type"] = "text/html"
-        public_response_functions.add_default_headers(headers)
-
-        response_body = "<html><body><h1>Forbidden</h1></body></html>"
-
-        try:
-            html_page = open(path.join(self._root, self._restricted_html))
-        except IOError:
-            if DEBUG_LEVEL >= 2:
-                print "File {} wasn't found in root".format(self._restricted_html)
-        else:
-            response_body = html_page.read()
-
-        headers["Content-Length"] = str(len(response_body))
-        response.set_data(response_body)
-        response.set_headers(headers)
-
-        return response.build_response()
+        return self._error_pages.get_response(403, connection_header)
 
 
 def split_http_request(request):
@@ -326,3 +1080,10 @@ def split_http_request(request):
         raise ValueError("End of headers not found")
 
     return request_status_line, headers
+
+
+def _get_stat_function(cache, name):
+    """
+    :return: a function that returns a counter of the cache's get_stats()
+    """
+    return lambda: cache.get_stats()[name]
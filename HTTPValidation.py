@@ -3,20 +3,26 @@ contains function that validate http requests and responses
 There are are no validation for the data itself but for the
 request line and headers
 The functions in this file utilizes the regex module(hopefully it is allowed)
+The server itself uses HTTPParser.parse_request, which validates and
+tokenizes a request in a single pass.
 """
 import re
 import constants
 
 
+# compiled once, not on every call
+REQUEST_LINE_PATTERN = re.compile("[A-Z]{3,7} [/a-zA-Z._\-0-9]+\??"
+                                  "[a-zA-Z._\-0-9=&]* HTTP/1\.[01]")
+HEADER_PATTERN = re.compile("^[a-zA-Z\-]+: [^\r\n]+\r\n")
+
+
 def validate_request_line(request_line):
     """
     Validates that a request line is a HTTP compliant request
     :param request_line: The request line of an http message
     :return:
     """
-    pattern = re.compile("[A-Z]{3,7} [/a-zA-Z._\-0-9]+\??"
-                         "[a-zA-Z._\-0-9=&]* HTTP/1\.[01]")
-    return True if re.match(pattern, request_line) else False
+    return True if REQUEST_LINE_PATTERN.match(request_line) else False
 
 
 def validate_request(request):
@@ -45,9 +51,8 @@ def validate_headers(headers):
     :param headers:
     :return:
     """
-    pattern = re.compile("^[a-zA-Z\-]+: [^\r\n]+\r\n")
     while True:
-        if not re.match(pattern, headers):
+        if not HEADER_PATTERN.match(headers):
             return False
 
         string_index = headers.find(constants.CRLF) + 2
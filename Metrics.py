@@ -0,0 +1,202 @@
+"""
+A registry of the server's metrics: counters, latency histograms and gauges.
+Every thread updates counters and histograms of its own (a shard), so
+recording doesn't take a lock and threads don't contend on shared counters.
+The shards are summed only when the metrics are read (snapshot).
+Gauges are functions called when the metrics are read, so values that are
+kept elsewhere anyway (e.g the hits of a cache) cost nothing per request.
+A metric is identified by its name and its labels, a tuple of (name, value)
+tuples e.g (("route", "say_hello"), ("status", "200")).
+The metrics can be rendered as JSON or in the Prometheus text format.
+Every process has its own registry, with start_prefork_server each worker
+reports only the requests it served.
+"""
+import bisect
+import json
+import threading
+from server_constants import LATENCY_BUCKETS
+
+
+COUNTER = "counter"
+GAUGE = "gauge"
+HISTOGRAM = "histogram"
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4"
+
+
+class _Shard(object):
+    __slots__ = ("counters", "histograms")
+
+    def __init__(self):
+        # (name, labels): value
+        self.counters = {}
+        # (name, labels): [count of every bucket and of +Inf, sum]
+        self.histograms = {}
+
+
+class MetricsRegistry(object):
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        """
+        :type buckets: tuple
+        :param buckets: The sorted upper bounds (in seconds) of the buckets
+                        of the histograms
+        """
+        self._buckets = tuple(buckets)
+        self._local = threading.local()
+        self._shards = []
+        # (name, labels): (function, type)
+        self._gauges = {}
+        self._lock = threading.Lock()
+
+    def increment(self, name, labels=(), value=1):
+        """
+        Adds value to a counter
+        :type labels: tuple
+        :return: None
+        """
+        counters = self._get_shard().counters
+        key = (name, labels)
+        counters[key] = counters.get(key, 0) + value
+
+    def observe(self, name, value, labels=()):
+        """
+        Records a value (e.g a duration in seconds) in a histogram
+        :return: None
+        """
+        histograms = self._get_shard().histograms
+        key = (name, labels)
+        histogram = histograms.get(key)
+        if histogram is None:
+            histogram = [0] * (len(self._buckets) + 2)
+            histograms[key] = histogram
+        histogram[bisect.bisect_left(self._buckets, value)] += 1
+        histogram[-1] += value
+
+    def add_gauge(self, name, function, labels=(), metric_type=GAUGE):
+        """
+        Registers a function whose value is read with the other metrics
+        :type function: function
+        :param function: called without arguments, returns a number
+        :param metric_type: GAUGE, or COUNTER if the value only grows
+        :return: None
+        """
+        with self._lock:
+            self._gauges[(name, labels)] = (function, metric_type)
+
+    def snapshot(self):
+        """
+        :rtype: dict
+        :return: {"counters": {(name, labels): value},
+                  "gauges": {(name, labels): (value, type)},
+                  "histograms": {(name, labels): (cumulative bucket counts
+                                                  including +Inf, sum)}}
+        """
+        with self._lock:
+            shards = list(self._shards)
+            gauges = dict(self._gauges)
+
+        counters = {}
+        histograms = {}
+        for shard in shards:
+            # copied first, the thread of the shard may add keys meanwhile
+            for key, value in shard.counters.items():
+                counters[key] = counters.get(key, 0) + value
+            for key, histogram in shard.histograms.items():
+                total = histograms.get(key)
+                if total is None:
+                    histograms[key] = list(histogram)
+                else:
+                    for index, value in enumerate(histogram):
+                        total[index] += value
+
+        cumulative_histograms = {}
+        for key, histogram in histograms.iteritems():
+            buckets = []
+            count = 0
+            for value in histogram[:-1]:
+                count += value
+                buckets.append(count)
+            cumulative_histograms[key] = (buckets, histogram[-1])
+
+        gauge_values = {}
+        for key, (function, metric_type) in gauges.iteritems():
+            gauge_values[key] = (function(), metric_type)
+
+        return {"counters": counters, "gauges": gauge_values,
+                "histograms": cumulative_histograms}
+
+    def to_json(self):
+        """
+        :return: The metrics as a JSON document, every metric is an object
+                 with its name, labels and value(s)
+        """
+        snapshot = self.snapshot()
+        counters = [{"name": name, "labels": dict(labels), "value": value}
+                    for (name, labels), value in sorted(snapshot["counters"].iteritems())]
+        gauges = [{"name": name, "labels": dict(labels), "value": value, "type": metric_type}
+                  for (name, labels), (value, metric_type)
+                  in sorted(snapshot["gauges"].iteritems())]
+        histograms = []
+        for (name, labels), (buckets, total) in sorted(snapshot["histograms"].iteritems()):
+            histograms.append({"name": name, "labels": dict(labels),
+                               "buckets": [[bound, count] for bound, count
+                                           in zip(self._buckets + ("+Inf",), buckets)],
+                               "count": buckets[-1], "sum": total})
+        return json.dumps({"counters": counters, "gauges": gauges,
+                           "histograms": histograms}, sort_keys=True)
+
+    def to_prometheus(self):
+        """
+        :return: The metrics in the Prometheus text exposition format
+        """
+        snapshot = self.snapshot()
+        lines = []
+        # name: type, a TYPE line is written once before the first sample
+        types = {}
+
+        def add_type(name, metric_type):
+            if name not in types:
+                types[name] = metric_type
+                lines.append("# TYPE {} {}".format(name, metric_type))
+
+        for (name, labels), value in sorted(snapshot["counters"].iteritems()):
+            add_type(name, COUNTER)
+            lines.append("{}{} {}".format(name, _format_labels(labels), value))
+
+        for (name, labels), (value, metric_type) in sorted(snapshot["gauges"].iteritems()):
+            add_type(name, metric_type)
+            lines.append("{}{} {}".format(name, _format_labels(labels), value))
+
+        for (name, labels), (buckets, total) in sorted(snapshot["histograms"].iteritems()):
+            add_type(name, HISTOGRAM)
+            for bound, count in zip(self._buckets + ("+Inf",), buckets):
+                lines.append("{}_bucket{} {}".format(
+                    name, _format_labels(labels + (("le", str(bound)),)), count))
+            lines.append("{}_sum{} {}".format(name, _format_labels(labels), repr(total)))
+            lines.append("{}_count{} {}".format(name, _format_labels(labels), buckets[-1]))
+
+        lines.append("")
+        return "\n".join(lines)
+
+    def _get_shard(self):
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = _Shard()
+            self._local.shard = shard
+            with self._lock:
+                self._shards.append(shard)
+        return shard
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join('{}="{}"'.format(name, _escape_label_value(value))
+                          for name, value in labels) + "}"
+
+
+def _escape_label_value(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+# the registry the server records its metrics in
+REGISTRY = MetricsRegistry()
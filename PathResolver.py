@@ -0,0 +1,204 @@
+"""
+Maps request uris to files in the server's root and decides whether
+they may be accessed.
+The result of every uri (real path, allowed, exists) is memoized, so a
+request doesn't call realpath and isfile again for a uri that was resolved
+recently. Cached results are dropped when the file system generation changes
+(see invalidate) or when they are older than max_age seconds.
+Restricted folders are kept in a trie of path components, so checking a path
+takes as many steps as the path has components no matter how many folders are
+restricted, and "admin" restricts "admin/x" but not "adminx/x".
+"""
+import collections
+import os
+import os.path as path
+import threading
+import time
+from server_constants import PATH_CACHE_SIZE, PATH_CACHE_MAX_AGE, INDEX_PAGE
+
+
+# marks a trie node at which a restricted folder ends
+_END = object()
+
+
+class RestrictedTrie(object):
+    def __init__(self, folders):
+        """
+        :type folders: list
+        :param folders: folders relative to root e.g ["admin", "private/logs"]
+        """
+        self._root_node = {}
+        for folder in folders:
+            self.add(folder)
+
+    def add(self, folder):
+        node = self._root_node
+        for component in _split_components(folder):
+            node = node.setdefault(component, {})
+        node[_END] = True
+
+    def is_restricted(self, components):
+        """
+        :type components: list
+        :param components: the components of a path relative to root
+        :return: True if the path is a restricted folder or inside one
+        """
+        node = self._root_node
+        if _END in node:
+            return True
+
+        for component in components:
+            node = node.get(component)
+            if node is None:
+                return False
+            if _END in node:
+                return True
+
+        return False
+
+
+class ResolvedPath(object):
+    __slots__ = ("real_path", "allowed", "exists", "generation", "resolved_at")
+
+    def __init__(self, real_path, allowed, exists, generation):
+        """
+        :param real_path: the real path of the requested file
+        :param allowed: False if the file is outside root or restricted
+        :param exists: True if the path is an existing regular file
+        :param generation: the file system generation it was resolved in
+        """
+        self.real_path = real_path
+        self.allowed = allowed
+        self.exists = exists
+        self.generation = generation
+        self.resolved_at = time.time()
+
+
+class PathResolver(object):
+    def __init__(self, root, restricted_folders, max_entries=PATH_CACHE_SIZE,
+                 max_age=PATH_CACHE_MAX_AGE):
+        """
+        :type root: str
+        :param root: The absolute path of the server's root
+        :type restricted_folders: list
+        :param restricted_folders: folders in root that are not to be accessed
+        :param max_entries: the maximal number of memoized uris
+        :param max_age: seconds a memoized result is trusted, 0 disables
+                        the memoization
+        """
+        self._root = path.realpath(root)
+        self._root_prefix = path.join(self._root, "")
+        self._restricted = RestrictedTrie(restricted_folders)
+        self._max_entries = max_entries
+        self._max_age = max_age
+        self._generation = 0
+        # uri: ResolvedPath, ordered from the least recently used
+        self._cache = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._manifest = None
+        self._hits = 0
+        self._misses = 0
+
+    def get_root(self):
+        return self._root
+
+    def get_generation(self):
+        return self._generation
+
+    def set_manifest(self, manifest):
+        """
+        Once set, whether a file exists and whether it is restricted are
+        answered by the manifest instead of the file system and the trie
+        :type manifest: DocumentManifest.DocumentManifest
+        :return: None
+        """
+        self._manifest = manifest
+        self.invalidate()
+
+    def invalidate(self):
+        """
+        Starts a new file system generation, every memoized result
+        is resolved again on its next use
+        :return: None
+        """
+        self._generation += 1
+
+    def resolve(self, uri):
+        """
+        :type uri: str
+        :param uri: The uri of the request without its parameters
+        :rtype: ResolvedPath
+        """
+        with self._lock:
+            resolved = self._cache.get(uri)
+            if resolved is not None and resolved.generation == self._generation and \
+                    time.time() - resolved.resolved_at < self._max_age:
+                # mark as the most recently used
+                del self._cache[uri]
+                self._cache[uri] = resolved
+                self._hits += 1
+                return resolved
+            self._misses += 1
+
+        resolved = self._resolve(uri)
+        if self._max_age > 0:
+            with self._lock:
+                self._cache.pop(uri, None)
+                while self._cache and len(self._cache) >= self._max_entries:
+                    self._cache.popitem(last=False)
+                self._cache[uri] = resolved
+        return resolved
+
+    def get_stats(self):
+        """
+        :rtype: dict
+        :return: The cache's counters
+        """
+        return {"hits": self._hits,
+                "misses": self._misses,
+                "entries": len(self._cache)}
+
+    def get_real_path(self, uri):
+        """
+        Given a uri returns the real path of the requested file.
+        If the uri is / substitutes it for index.html
+        """
+        # get rid of the preceding /
+        relative_path = uri[1:] if uri.startswith("/") else uri
+        if relative_path == "":
+            relative_path = INDEX_PAGE
+
+        return path.realpath(path.join(self._root, relative_path))
+
+    def is_restricted(self, real_path):
+        """
+        given a full real path of a file or directory, checks if the file
+        is outside root or in a restricted area
+        """
+        if real_path == self._root:
+            return False
+        if not real_path.startswith(self._root_prefix):
+            return True
+
+        relative_path = real_path[len(self._root_prefix):]
+        return self._restricted.is_restricted(_split_components(relative_path))
+
+    def _resolve(self, uri):
+        generation = self._generation
+        real_path = self.get_real_path(uri)
+        if self._manifest is not None:
+            # the manifest already knows whether its files are restricted
+            file_info = self._manifest.get(real_path)
+            if file_info is not None:
+                allowed = not file_info.restricted
+                return ResolvedPath(real_path, allowed, allowed, generation)
+            return ResolvedPath(real_path, not self.is_restricted(real_path), False,
+                                generation)
+
+        allowed = not self.is_restricted(real_path)
+        exists = allowed and path.isfile(real_path)
+        return ResolvedPath(real_path, allowed, exists, generation)
+
+
+def _split_components(relative_path):
+    return [component for component in relative_path.split(os.sep) if component]
@@ -0,0 +1,135 @@
+"""
+Runs a serving function in several forked worker processes and
+keeps them alive.
+The listening socket must be created before the supervisor runs, the workers
+inherit it through fork and the kernel spreads the connections between them,
+which lets the server use more than a single core.
+Usage:
+Construction- provide the function each worker runs (it should serve
+              forever) and the number of workers:
+              WorkerSupervisor(server.start_event_loop_server, workers=4)
+Starting- run() forks the workers and blocks, a worker that exits or crashes
+          is replaced by a new one.
+Termination- a keyboard interrupt or SIGTERM sent to the master stops all
+             the workers. A worker turns SIGTERM into SystemExit, so the
+             serving function's finally clauses run (e.g the server writes
+             its buffered access log) before the worker exits.
+"""
+import errno
+import os
+import signal
+import time
+
+
+# a worker that dies sooner than that after it was forked is
+# considered to crash on start, its replacement is delayed
+# so a broken worker won't make the master fork endlessly
+MIN_WORKER_LIFETIME = 1.0
+RESPAWN_DELAY = 1.0
+
+
+def _raise_system_exit(signum, frame):
+    raise SystemExit(0)
+
+
+class WorkerSupervisor(object):
+    def __init__(self, serve_function, workers, debug=0):
+        """
+        :type serve_function: function
+        :param serve_function: called without arguments in every worker
+        :type workers: int
+        :param workers: The number of worker processes
+        :param debug: For debugging purposes
+        """
+        if not isinstance(workers, int) or workers < 1:
+            raise ValueError("workers must be a positive int, got {}".format(workers))
+
+        self._serve_function = serve_function
+        self._workers_count = workers
+        self._debug = debug
+        # pid: time the worker was forked
+        self._workers = {}
+
+    def get_workers(self):
+        """
+        :return: the pids of the running workers
+        """
+        return self._workers.keys()
+
+    def run(self):
+        """
+        Forks the workers and replaces the ones that exit until interrupted
+        :return: None
+        """
+        previous_handler = signal.signal(signal.SIGTERM, _raise_system_exit)
+        try:
+            for _ in xrange(self._workers_count):
+                self._spawn_worker()
+
+            while True:
+                pid, status = self._wait_for_worker()
+                if pid not in self._workers:
+                    continue
+
+                started = self._workers.pop(pid)
+                if self._debug >= 0:
+                    print "Worker {} exited with status {}".format(pid, status)
+
+                if time.time() - started < MIN_WORKER_LIFETIME:
+                    time.sleep(RESPAWN_DELAY)
+                self._spawn_worker()
+        except (KeyboardInterrupt, SystemExit):
+            pass
+        finally:
+            signal.signal(signal.SIGTERM, previous_handler)
+            self._stop_workers()
+
+    def _spawn_worker(self):
+        pid = os.fork()
+        if pid == 0:
+            self._run_worker()
+
+        self._workers[pid] = time.time()
+        if self._debug >= 0:
+            print "Started worker {}".format(pid)
+
+    def _run_worker(self):
+        """
+        The body of a worker process, never returns
+        """
+        signal.signal(signal.SIGTERM, _raise_system_exit)
+        exit_code = 0
+        try:
+            self._serve_function()
+        except (KeyboardInterrupt, SystemExit):
+            pass
+        except Exception as err:
+            if self._debug >= 0:
+                print "Worker {} crashed: {}".format(os.getpid(), err)
+            exit_code = 1
+        finally:
+            # never return into the master's code
+            os._exit(exit_code)
+
+    def _wait_for_worker(self):
+        while True:
+            try:
+                return os.wait()
+            except OSError as err:
+                if err.errno != errno.EINTR:
+                    raise
+
+    def _stop_workers(self):
+        for pid in self._workers.keys():
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except OSError:
+                pass
+
+        for pid in self._workers.keys():
+            try:
+                os.waitpid(pid, 0)
+            except OSError:
+                pass
+
+        self._workers = {}
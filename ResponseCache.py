@@ -0,0 +1,198 @@
+"""
+A cache of the responses of server functions.
+Caching is opt-in per function with the cached decorator:
+
+    @route("/report")
+    @cached(ttl=30)
+    def report(request_parameters):
+        ...
+
+A response is kept for ttl seconds, keyed by the function and its parameters
+(sorted, so the order of the query string doesn't matter, key_parameters
+restricts them to those the function actually uses). Only complete 200
+responses are kept, streamed ones are not. Responses carry a Cache-Control
+max-age of the ttl, cached ones an Age header of the time they spent in the
+cache (downstream caches subtract it from max-age) and a fresh Date.
+When the total size of the entries exceeds the limit the least recently used
+entries are evicted.
+While a response is computed, other requests for the same key wait for it
+instead of calling the function as well (single flight).
+The cache is thread safe.
+"""
+import collections
+import threading
+import time
+import HTTPHeaders
+import HTTPResponse
+import public_response_functions
+from server_constants import RESPONSE_CACHE_SIZE
+
+
+class CachedResponse(object):
+    __slots__ = ("version", "status_code", "phrase", "headers", "data", "flag",
+                 "ttl", "stored_at", "expires_at")
+
+    def __init__(self, response, flag, ttl):
+        """
+        :type response: HTTPResponse.HTTPResponse
+        :param flag: The flag the function returned with the response
+        :param ttl: Seconds the response may be served from the cache
+        """
+        self.version = response.get_version()
+        self.status_code = response.get_status_code()
+        self.phrase = response.get_phrase()
+        # the headers are copied, the server changes those of the response
+        self.headers = response.get_headers().items()
+        self.data = response.get_data()
+        self.flag = flag
+        self.ttl = ttl
+        self.stored_at = time.time()
+        self.expires_at = self.stored_at + ttl
+
+    def get_memory_size(self):
+        return len(self.data) + sum(len(name) + len(value) for name, value in self.headers)
+
+    def build_response(self, now):
+        """
+        :param now: The current time
+        :rtype: HTTPResponse.HTTPResponse
+        :return: A new response of the cached one
+        """
+        headers = HTTPHeaders.HTTPHeaders()
+        headers.update(self.headers)
+        headers["Cache-Control"] = _get_cache_control(self.ttl)
+        headers["Age"] = str(int(now - self.stored_at))
+        if "Date" in headers:
+            headers["Date"] = public_response_functions.get_rfc_822_time()
+        return HTTPResponse.HTTPResponse(version=self.version, status_code=self.status_code,
+                                         phrase=self.phrase, headers=headers, data=self.data)
+
+
+class ResponseCache(object):
+    def __init__(self, max_size=RESPONSE_CACHE_SIZE):
+        """
+        :type max_size: int
+        :param max_size: The maximal total size of the cached responses in bytes
+        """
+        self._max_size = max_size
+        # key: CachedResponse, ordered from the least recently used
+        self._entries = collections.OrderedDict()
+        self._size = 0
+        # key: threading.Event set when the response being computed is stored
+        self._in_flight = {}
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    def cached(self, ttl, key_parameters=None):
+        """
+        A decorator that caches the responses of a server function
+        :param ttl: Seconds a response is served from the cache
+        :type key_parameters: tuple
+        :param key_parameters: The names of the parameters the response depends
+                               on, None if it may depend on all of them
+        :return: the decorator, which returns the caching function
+        """
+        def decorate(function):
+            def cached_function(request_parameters):
+                return self.get_response(function, request_parameters, ttl, key_parameters)
+            cached_function.__name__ = function.__name__
+            cached_function.__doc__ = function.__doc__
+            return cached_function
+        return decorate
+
+    def get_response(self, function, request_parameters, ttl, key_parameters=None):
+        """
+        :param function: a server function
+        :type request_parameters: dict
+        :param request_parameters: The parameters the function is called with
+        :param ttl: Seconds a response of the function is kept
+        :param key_parameters: see cached
+        :return: the (response, flag) tuple of the function, from the cache
+                 if it has an entry that didn't expire
+        may raise whatever the function raises
+        """
+        key = _make_key(function, request_parameters, key_parameters)
+        while True:
+            with self._lock:
+                now = time.time()
+                entry = self._entries.get(key)
+                if entry is not None:
+                    if now < entry.expires_at:
+                        del self._entries[key]
+                        self._entries[key] = entry
+                        self._hits += 1
+                        return entry.build_response(now), entry.flag
+                    self._remove(key)
+
+                in_flight = self._in_flight.get(key)
+                if in_flight is None:
+                    self._misses += 1
+                    in_flight = threading.Event()
+                    self._in_flight[key] = in_flight
+                    break
+            # another thread computes this response, its result is used
+            # (if it failed or the response can't be cached this one computes)
+            in_flight.wait()
+            if key not in self._entries:
+                return self._compute(function, request_parameters, ttl, None, None)
+
+        return self._compute(function, request_parameters, ttl, key, in_flight)
+
+    def get_stats(self):
+        """
+        :rtype: dict
+        :return: The cache's counters
+        """
+        with self._lock:
+            return {"hits": self._hits,
+                    "misses": self._misses,
+                    "entries": len(self._entries),
+                    "size": self._size,
+                    "max_size": self._max_size}
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def _compute(self, function, request_parameters, ttl, key, in_flight):
+        """
+        Calls the function and stores its response under key, unless key is
+        None. The threads waiting on in_flight are released either way.
+        """
+        try:
+            response, flag = function(request_parameters)
+            if key is None or response.get_status_code() != 200 or response.is_streamed():
+                return response, flag
+
+            entry = CachedResponse(response, flag, ttl)
+            response.get_headers()["Cache-Control"] = _get_cache_control(ttl)
+            size = entry.get_memory_size()
+            with self._lock:
+                if size <= self._max_size:
+                    while self._entries and self._size + size > self._max_size:
+                        self._remove(next(iter(self._entries)))
+                    self._entries[key] = entry
+                    self._size += size
+            return response, flag
+        finally:
+            if key is not None:
+                with self._lock:
+                    del self._in_flight[key]
+                in_flight.set()
+
+    def _remove(self, key):
+        self._size -= self._entries.pop(key).get_memory_size()
+
+
+def _make_key(function, request_parameters, key_parameters):
+    if key_parameters is None:
+        parameters = tuple(sorted(request_parameters.iteritems()))
+    else:
+        parameters = tuple((name, request_parameters.get(name)) for name in key_parameters)
+    return function, parameters
+
+
+def _get_cache_control(ttl):
+    return "max-age={}".format(max(int(ttl), 0))
@@ -0,0 +1,197 @@
+"""
+Routes requests to the server functions.
+A function is registered with the route decorator for a path and the methods
+it accepts, e.g:
+
+    router = Router()
+
+    @router.route("/users/{id}", methods=("GET",))
+    def get_user(request_parameters):
+        ...
+
+A {name} component matches any single (non empty) path component, its value
+is passed to the function in request_parameters under name.
+The routes are compiled into a trie of path components: paths with no
+{name} components are found with a single dict lookup, the others take as many
+steps as the path has components no matter how many routes are registered.
+"""
+
+
+PATH_SEPARATOR = "/"
+PARAM_OPEN = "{"
+PARAM_CLOSE = "}"
+DEFAULT_METHODS = ("GET",)
+
+
+class RouteError(ValueError):
+    """
+    Raised when a route is invalid or conflicts with a registered one
+    """
+    pass
+
+
+class _Node(object):
+    __slots__ = ("children", "param_name", "param_child", "handlers")
+
+    def __init__(self):
+        # literal path component: _Node
+        self.children = {}
+        # the node of a {name} component, at most one per node
+        self.param_name = None
+        self.param_child = None
+        # method: handler of the routes that end at this node
+        self.handlers = {}
+
+
+class Router(object):
+    def __init__(self):
+        # (pattern, method): handler, in the order the routes were added
+        self._routes = {}
+        # pattern with no parameters: {method: handler}
+        self._static_routes = {}
+        self._trie = _Node()
+        self._compiled = False
+
+    def route(self, pattern, methods=DEFAULT_METHODS):
+        """
+        A decorator that registers a function for a path pattern
+        :param pattern: e.g "/say_hello" or "/users/{id}"
+        :param methods: The request methods the function handles
+        :return: the decorator, which returns the function as it is
+        may raise RouteError
+        """
+        def register(handler):
+            self.add_route(pattern, handler, methods)
+            return handler
+        return register
+
+    def add_route(self, pattern, handler, methods=DEFAULT_METHODS):
+        """
+        :param pattern: e.g "/say_hello" or "/users/{id}"
+        :type handler: function
+        :param handler: called with the request parameters, returns a tuple
+                        of (HTTPResponse, flag) like the functions in
+                        server_functions.py
+        :param methods: The request methods the function handles
+        :return: None
+        may raise RouteError if the pattern is invalid or already registered
+        for one of the methods
+        """
+        _parse_pattern(pattern)
+        for method in methods:
+            if (pattern, method) in self._routes:
+                raise RouteError("{} {} is already routed".format(method, pattern))
+        for method in methods:
+            self._routes[(pattern, method)] = handler
+        self._compiled = False
+
+    def has_route(self, pattern, method):
+        return (pattern, method) in self._routes
+
+    def compile(self):
+        """
+        Builds the lookup tables of the registered routes, called by match
+        when a route was added since the last compile
+        :return: None
+        may raise RouteError if two routes name the same parameter differently
+        """
+        static_routes = {}
+        trie = _Node()
+        for (pattern, method), handler in self._routes.iteritems():
+            components = _parse_pattern(pattern)
+            if all(not is_param for _, is_param in components):
+                static_routes.setdefault(pattern, {})[method] = handler
+                continue
+
+            node = trie
+            for component, is_param in components:
+                if not is_param:
+                    node = node.children.setdefault(component, _Node())
+                    continue
+                if node.param_child is None:
+                    node.param_name = component
+                    node.param_child = _Node()
+                elif node.param_name != component:
+                    raise RouteError("{} conflicts with {{{}}} at the same position".format(
+                        pattern, node.param_name))
+                node = node.param_child
+            node.handlers[method] = handler
+
+        self._static_routes = static_routes
+        self._trie = trie
+        self._compiled = True
+
+    def match(self, method, path):
+        """
+        :param method: The request method
+        :param path: The request uri without its parameters
+        :return: a tuple of the handler and a dict of the path's {name}
+                 components, or None if no route matches the method and path
+        """
+        if not self._compiled:
+            self.compile()
+
+        handlers = self._static_routes.get(path)
+        if handlers is not None:
+            handler = handlers.get(method)
+            if handler is not None:
+                return handler, {}
+
+        if not path.startswith(PATH_SEPARATOR):
+            return None
+        path_parameters = {}
+        handler = _match_node(self._trie, path[1:].split(PATH_SEPARATOR), 0, method,
+                              path_parameters)
+        if handler is None:
+            return None
+        return handler, path_parameters
+
+
+def _parse_pattern(pattern):
+    """
+    :return: a list of (component, is_param) tuples, the name of a {name}
+             component is given without its braces
+    may raise RouteError
+    """
+    if not pattern.startswith(PATH_SEPARATOR):
+        raise RouteError("{} doesn't start with {}".format(pattern, PATH_SEPARATOR))
+
+    components = []
+    for component in pattern[1:].split(PATH_SEPARATOR):
+        if component.startswith(PARAM_OPEN) and component.endswith(PARAM_CLOSE):
+            name = component[1:-1]
+            if not name or PARAM_OPEN in name or PARAM_CLOSE in name:
+                raise RouteError("Invalid parameter {} in {}".format(component, pattern))
+            components.append((name, True))
+        elif PARAM_OPEN in component or PARAM_CLOSE in component:
+            raise RouteError("Invalid component {} in {}".format(component, pattern))
+        else:
+            components.append((component, False))
+    return components
+
+
+def _match_node(node, components, index, method, path_parameters):
+    """
+    Walks the trie from node, a literal component is preferred over a
+    {name} one, e.g /users/me is matched before /users/{id}
+    :return: the handler of the method or None, the values of the {name}
+             components are put in path_parameters
+    """
+    if index == len(components):
+        return node.handlers.get(method)
+
+    component = components[index]
+    child = node.children.get(component)
+    if child is not None:
+        handler = _match_node(child, components, index + 1, method, path_parameters)
+        if handler is not None:
+            return handler
+
+    if node.param_child is not None and component:
+        handler = _match_node(node.param_child, components, index + 1, method,
+                              path_parameters)
+        if handler is not None:
+            path_parameters[node.param_name] = component
+            return handler
+
+    return None
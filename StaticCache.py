@@ -0,0 +1,160 @@
+"""
+A bounded in-memory cache of static files.
+Every entry holds the body of a file and the serialized part of its response
+that doesn't change between requests, keyed by the real path of the file.
+When the total size of the entries exceeds the limit the least recently used
+entries are evicted. An entry is revalidated against the file's mtime and size
+at most once every revalidate_interval seconds, so a hot file is served
+without touching the file system on every request.
+The cache is thread safe.
+"""
+import collections
+import os
+import threading
+import time
+from server_constants import STATIC_CACHE_SIZE, STATIC_CACHE_MAX_ENTRY_SIZE, \
+    STATIC_CACHE_REVALIDATE_INTERVAL
+
+
+class CacheEntry(object):
+    __slots__ = ("body", "headers", "mtime", "size", "validated_at")
+
+    def __init__(self, body, headers, mtime, size):
+        """
+        :type body: str
+        :param body: The content of the file
+        :type headers: str
+        :param headers: The serialized status line and headers that don't
+                        change between responses
+        :param mtime: The modification time of the file when it was read
+        :param size: The size of the file when it was read
+        """
+        self.body = body
+        self.headers = headers
+        self.mtime = mtime
+        self.size = size
+        self.validated_at = time.time()
+
+    def get_memory_size(self):
+        return len(self.body) + len(self.headers)
+
+
+class StaticCache(object):
+    def __init__(self, max_size=STATIC_CACHE_SIZE,
+                 max_entry_size=STATIC_CACHE_MAX_ENTRY_SIZE,
+                 revalidate_interval=STATIC_CACHE_REVALIDATE_INTERVAL):
+        """
+        :type max_size: int
+        :param max_size: The maximal total size of the cached entries in bytes
+        :type max_entry_size: int
+        :param max_entry_size: Larger files are never cached
+        :type revalidate_interval: float
+        :param revalidate_interval: Seconds an entry is trusted without
+                                    checking the file
+        """
+        self._max_size = max_size
+        self._max_entry_size = max_entry_size
+        self._revalidate_interval = revalidate_interval
+        # real path: CacheEntry, ordered from the least recently used
+        self._entries = collections.OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def __contains__(self, real_path):
+        return real_path in self._entries
+
+    def is_cacheable(self, size):
+        """
+        :param size: The size of a file in bytes
+        :return: True if a file of that size may be cached
+        """
+        return size <= self._max_entry_size and size <= self._max_size
+
+    def get(self, real_path):
+        """
+        :param real_path: The real path of the file
+        :rtype: CacheEntry
+        :return: The entry of the file, or None if the file isn't cached or
+                 was modified since it was cached
+        """
+        with self._lock:
+            entry = self._entries.get(real_path)
+            if entry is None:
+                self._misses += 1
+                return None
+
+            now = time.time()
+            if now - entry.validated_at >= self._revalidate_interval:
+                try:
+                    stat = os.stat(real_path)
+                except OSError:
+                    stat = None
+
+                if stat is None or stat.st_mtime != entry.mtime or stat.st_size != entry.size:
+                    self._remove(real_path)
+                    self._misses += 1
+                    return None
+                entry.validated_at = now
+
+            # mark as the most recently used
+            del self._entries[real_path]
+            self._entries[real_path] = entry
+            self._hits += 1
+            return entry
+
+    def put(self, real_path, entry):
+        """
+        Caches an entry, evicting the least recently used
+        entries if there isn't enough room
+        :param real_path: The real path of the file
+        :type entry: CacheEntry
+        :return: None
+        """
+        entry_size = entry.get_memory_size()
+        if entry.size > self._max_entry_size or entry_size > self._max_size:
+            return
+
+        with self._lock:
+            if real_path in self._entries:
+                self._remove(real_path)
+
+            while self._entries and self._size + entry_size > self._max_size:
+                oldest_path = next(iter(self._entries))
+                self._remove(oldest_path)
+                self._evictions += 1
+
+            self._entries[real_path] = entry
+            self._size += entry_size
+
+    def invalidate(self, real_path=None):
+        """
+        Removes a single entry or all of them
+        :param real_path: if None the whole cache is cleared
+        :return: None
+        """
+        with self._lock:
+            if real_path is None:
+                self._entries.clear()
+                self._size = 0
+            elif real_path in self._entries:
+                self._remove(real_path)
+
+    def get_stats(self):
+        """
+        :rtype: dict
+        :return: The cache's counters
+        """
+        with self._lock:
+            return {"hits": self._hits,
+                    "misses": self._misses,
+                    "evictions": self._evictions,
+                    "entries": len(self._entries),
+                    "size": self._size,
+                    "max_size": self._max_size}
+
+    def _remove(self, real_path):
+        entry = self._entries.pop(real_path)
+        self._size -= entry.get_memory_size()
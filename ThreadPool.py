@@ -0,0 +1,102 @@
+"""
+A bounded pool of worker threads.
+Usage:
+Construction- provide the function every worker will run on each item,
+              the number of workers and the maximal amount of items that
+              may wait in the queue:
+              ThreadPool(handle_connection, pool_size=8, queue_size=64)
+Starting- call start() to spawn the workers.
+Submitting work- submit(item) puts the item in the queue, if the queue is
+                 full the call blocks until a worker frees a place
+                 (or raises Queue.Full when block is False).
+Termination- stop() tells all the workers to exit and waits for them.
+"""
+import Queue
+import threading
+
+
+# put in the queue in order to tell a worker to exit
+_STOP = object()
+
+
+class ThreadPool(object):
+    def __init__(self, work_function, pool_size, queue_size, debug=0):
+        """
+        :type work_function: function
+        :param work_function: Will be called by the workers with a single item
+                              taken from the queue
+        :type pool_size: int
+        :param pool_size: The number of worker threads
+        :type queue_size: int
+        :param queue_size: The maximal number of items waiting for a worker,
+                           0 means the queue is unbounded
+        :param debug: For debugging purposes
+        """
+        if not isinstance(pool_size, int) or pool_size < 1:
+            raise ValueError("pool_size must be a positive int, got {}".format(pool_size))
+        if not isinstance(queue_size, int) or queue_size < 0:
+            raise ValueError("queue_size must be a non negative int, got {}".format(queue_size))
+
+        self._work_function = work_function
+        self._pool_size = pool_size
+        self._queue = Queue.Queue(queue_size)
+        self._workers = []
+        self._debug = debug
+
+    def start(self):
+        """
+        Spawns the worker threads
+        :return: None
+        """
+        for index in xrange(self._pool_size):
+            worker = threading.Thread(target=self._work,
+                                      name="worker-{}".format(index))
+            worker.daemon = True
+            worker.start()
+            self._workers.append(worker)
+
+    def submit(self, item, block=True, timeout=None):
+        """
+        Puts an item in the queue for the next free worker
+        :param item: passed as is to the work function
+        :param block: if False raises Queue.Full immediately when
+                      the queue is full
+        :param timeout: maximal time to wait for a free place in the queue
+        :return: None
+        may raise Queue.Full
+        """
+        self._queue.put(item, block, timeout)
+
+    def get_pending(self):
+        """
+        :return: the approximate number of items waiting for a worker
+        """
+        return self._queue.qsize()
+
+    def stop(self):
+        """
+        Tells every worker to exit once the queue is drained
+        and waits for all of them
+        :return: None
+        """
+        for _ in self._workers:
+            self._queue.put(_STOP)
+
+        for worker in self._workers:
+            worker.join()
+
+        self._workers = []
+
+    def _work(self):
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                return
+
+            # a failing item must not kill the worker, otherwise
+            # the pool will shrink on every error
+            try:
+                self._work_function(item)
+            except Exception as err:
+                if self._debug >= 1:
+                    print "Worker got error: {}".format(err)
@@ -0,0 +1,228 @@
+"""
+Per request tracing and sampled profiling.
+Tracing- once HTTPServer.enable_tracing(hook) is called, every request gets
+         a RequestTrace the server marks at the end of each phase of its
+         handling (parse, route, resolve, check, lookup, read, handler, send).
+         When the response was handed to the connection the hooks are called
+         with the trace. Times are taken from a monotonic clock.
+         SlowRequestLog is a hook that prints the phases of slow requests.
+Profiling- HTTPServer.enable_profiling(sample_every) runs one request out
+           of every sample_every under cProfile. The samples are aggregated
+           and dumped as a pstats file every dump_every samples, read it
+           with pstats.Stats(path).
+While both are disabled the server only checks that they are, so they cost
+next to nothing.
+"""
+import cProfile
+import itertools
+import os
+import pstats
+import sys
+import threading
+import time
+from server_constants import PROFILE_SAMPLE_EVERY, PROFILE_DUMP_EVERY, PROFILE_OUTPUT_PATH
+
+CLOCK_MONOTONIC = 1
+
+
+def _load_monotonic():
+    """
+    :return: a function that returns the seconds of a monotonic clock,
+             time.time if none is available
+    """
+    monotonic = getattr(time, "monotonic", None)
+    if monotonic is not None:
+        return monotonic
+
+    try:
+        import ctypes
+        import ctypes.util
+        librt = ctypes.CDLL(ctypes.util.find_library("rt") or ctypes.util.find_library("c"),
+                            use_errno=True)
+        clock_gettime = librt.clock_gettime
+    except (ImportError, OSError, AttributeError, TypeError):
+        return time.time
+
+    class Timespec(ctypes.Structure):
+        _fields_ = [("tv_sec", ctypes.c_long), ("tv_nsec", ctypes.c_long)]
+
+    def clock_monotonic():
+        timespec = Timespec()
+        if clock_gettime(CLOCK_MONOTONIC, ctypes.byref(timespec)) != 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+        return timespec.tv_sec + timespec.tv_nsec * 1e-9
+
+    return clock_monotonic
+
+
+monotonic = _load_monotonic()
+
+
+class RequestTrace(object):
+    __slots__ = ("method", "uri", "route", "status", "started", "phases", "_last_mark")
+
+    def __init__(self):
+        self.method = None
+        self.uri = None
+        # the route label, see HTTPServer.STATIC_ROUTE
+        self.route = None
+        self.status = None
+        self.started = monotonic()
+        # (phase, seconds) in the order the phases ended
+        self.phases = []
+        self._last_mark = self.started
+
+    def mark(self, phase):
+        """
+        Ends a phase, it lasted since the end of the previous one
+        :param phase: The name of the phase that ended
+        :return: None
+        """
+        now = monotonic()
+        self.phases.append((phase, now - self._last_mark))
+        self._last_mark = now
+
+    def get_duration(self):
+        """
+        :return: seconds from the start of the trace to its last mark
+        """
+        return self._last_mark - self.started
+
+    def format(self):
+        """
+        :return: a single line describing the request and its phases
+        """
+        phases = " ".join("{}={:.3f}ms".format(phase, seconds * 1000)
+                          for phase, seconds in self.phases)
+        return "{} {} route={} status={} total={:.3f}ms {}".format(
+            self.method, self.uri, self.route, self.status,
+            self.get_duration() * 1000, phases)
+
+
+class Tracer(object):
+    def __init__(self):
+        self._hooks = []
+
+    def add_hook(self, hook):
+        """
+        :type hook: function
+        :param hook: called with the RequestTrace of every request once its
+                     response was sent (queued by the event loop), it runs on
+                     the thread that handled the request so it should be quick
+        :return: None
+        """
+        self._hooks.append(hook)
+
+    def start(self):
+        """
+        :rtype: RequestTrace
+        """
+        return RequestTrace()
+
+    def finish(self, trace):
+        """
+        Calls the hooks with a complete trace, a failing hook doesn't
+        fail the request
+        :return: None
+        """
+        for hook in self._hooks:
+            try:
+                hook(trace)
+            except Exception as err:
+                print >> sys.stderr, "Trace hook failed: {}".format(err)
+
+
+class SlowRequestLog(object):
+    """
+    A hook that prints the trace of requests that took longer than threshold
+    """
+    def __init__(self, threshold, output=None):
+        """
+        :param threshold: seconds
+        :type output: file
+        :param output: where to print, sys.stderr if None
+        """
+        self._threshold = threshold
+        self._output = output
+        self._lock = threading.Lock()
+
+    def __call__(self, trace):
+        if trace.get_duration() < self._threshold:
+            return
+        output = self._output if self._output is not None else sys.stderr
+        with self._lock:
+            output.write("Slow request: " + trace.format() + "\n")
+
+
+class Profiler(object):
+    def __init__(self, sample_every=PROFILE_SAMPLE_EVERY, output_path=PROFILE_OUTPUT_PATH,
+                 dump_every=PROFILE_DUMP_EVERY):
+        """
+        :param sample_every: one request out of sample_every is profiled
+        :param output_path: The pstats file, {pid} is replaced by the id of
+                            the process so prefork workers don't overwrite
+                            each other's files
+        :param dump_every: The aggregated samples are dumped every dump_every
+                           samples (and by dump)
+        """
+        if not isinstance(sample_every, int) or sample_every < 1:
+            raise ValueError("sample_every must be a positive int, got {}".format(sample_every))
+        self._sample_every = sample_every
+        self._output_path = output_path
+        self._dump_every = dump_every
+        self._counter = itertools.count()
+        self._stats = None
+        self._samples = 0
+        self._lock = threading.Lock()
+
+    def should_sample(self):
+        """
+        :return: True if the next request should be profiled
+        """
+        return next(self._counter) % self._sample_every == 0
+
+    def runcall(self, function, *args):
+        """
+        Calls function under the profiler and adds the result to the samples
+        :return: whatever function returns
+        may raise whatever function raises
+        """
+        profile = cProfile.Profile()
+        try:
+            return profile.runcall(function, *args)
+        finally:
+            self._add_sample(profile)
+
+    def get_output_path(self):
+        return self._output_path.format(pid=os.getpid())
+
+    def dump(self):
+        """
+        Writes the aggregated samples to the output path, the file is
+        replaced at once so readers never see a partial file
+        :return: None
+        may raise IOError
+        """
+        with self._lock:
+            if self._stats is None:
+                return
+            output_path = self.get_output_path()
+            temporary_path = output_path + ".tmp"
+            self._stats.dump_stats(temporary_path)
+            os.rename(temporary_path, output_path)
+
+    def _add_sample(self, profile):
+        with self._lock:
+            if self._stats is None:
+                self._stats = pstats.Stats(profile)
+            else:
+                self._stats.add(profile)
+            self._samples += 1
+            should_dump = self._samples % self._dump_every == 0
+
+        if should_dump:
+            try:
+                self.dump()
+            except (IOError, OSError) as err:
+                print >> sys.stderr, "Couldn't dump the profile: {}".format(err)
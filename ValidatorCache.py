@@ -0,0 +1,206 @@
+"""
+Validators (ETag and Last-Modified) of the static files and the handling of
+conditional requests.
+The validators of a file are derived from its mtime and size and kept in
+memory, they are revalidated against the file at most once every
+revalidate_interval seconds (or taken from the DocumentManifest if one is
+loaded), so answering a conditional request with 304 Not Modified costs
+neither a read nor, most of the time, a stat.
+"""
+import collections
+import os
+import threading
+import time
+import DocumentManifest
+import HTTPHeaders
+import public_response_functions
+from server_constants import STATIC_CACHE_REVALIDATE_INTERVAL, VALIDATOR_CACHE_SIZE
+
+
+class FileValidators(object):
+    __slots__ = ("mtime", "size", "etag", "last_modified", "validated_at",
+                 "not_modified_template")
+
+    def __init__(self, mtime, size, etag=None):
+        """
+        :param mtime: The modification time of the file
+        :param size: The size of the file
+        :param etag: if None it is derived from mtime and size
+        """
+        self.mtime = mtime
+        self.size = size
+        self.etag = etag if etag is not None else DocumentManifest.make_etag(mtime, size)
+        self.last_modified = public_response_functions.format_http_date(mtime)
+        self.validated_at = time.time()
+        # the serialized 304 response, built on its first use
+        self.not_modified_template = None
+
+    def add_headers(self, headers):
+        """
+        Adds the ETag and Last-Modified headers to a response
+        :type headers: HTTPHeaders.HTTPHeaders
+        :return: None
+        """
+        headers["ETag"] = self.etag
+        headers["Last-Modified"] = self.last_modified
+
+    def is_not_modified(self, request_headers):
+        """
+        Evaluates If-None-Match and If-Modified-Since (RFC 7232), the latter
+        is ignored when the former is present
+        :type request_headers: HTTPHeaders.HTTPHeaders
+        :return: True if a 304 response should be sent
+        """
+        if_none_match = request_headers.get("If-None-Match")
+        if if_none_match is not None:
+            return _etag_matches(if_none_match, self.etag)
+
+        if_modified_since = request_headers.get("If-Modified-Since")
+        if if_modified_since is not None:
+            since = public_response_functions.parse_http_date(if_modified_since)
+            # Last-Modified has a resolution of a second
+            return since is not None and int(self.mtime) <= since
+
+        return False
+
+    def get_not_modified_response(self, connection=None):
+        """
+        :param connection: The value of the Connection header, if any
+        :return: a 304 response carrying the validators, with an up to date
+                 Date header
+        """
+        template = self.not_modified_template
+        if template is None:
+            headers = HTTPHeaders.HTTPHeaders()
+            public_response_functions.add_default_headers(headers, include_date=False)
+            self.add_headers(headers)
+            template = public_response_functions.build_response_template(
+                304, "Not Modified", headers)
+            self.not_modified_template = template
+        return template + public_response_functions.get_date_header_line(connection)
+
+
+class ValidatorCache(object):
+    def __init__(self, max_entries=VALIDATOR_CACHE_SIZE,
+                 revalidate_interval=STATIC_CACHE_REVALIDATE_INTERVAL):
+        """
+        :param max_entries: The maximal number of files whose validators
+                            are kept
+        :param revalidate_interval: Seconds the validators of a file are
+                                    trusted without checking the file
+        """
+        self._max_entries = max_entries
+        self._revalidate_interval = revalidate_interval
+        # real path: FileValidators, ordered from the least recently used
+        self._validators = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    def get(self, real_path, file_info=None):
+        """
+        :param real_path: The real path of the file
+        :type file_info: DocumentManifest.FileInfo
+        :param file_info: The metadata of the file from the manifest, the file
+                          isn't checked when it is given
+        :rtype: FileValidators
+        :return: The validators or None if the file can't be stat-ed
+        """
+        validators = self._get_validators(real_path)
+        if file_info is not None:
+            if validators is None or validators.mtime != file_info.mtime or \
+                    validators.size != file_info.size:
+                validators = self._put(real_path, FileValidators(
+                    file_info.mtime, file_info.size, file_info.etag))
+            return validators
+
+        now = time.time()
+        if validators is not None and now - validators.validated_at < self._revalidate_interval:
+            self._hits += 1
+            return validators
+
+        # the file has to be checked
+        self._misses += 1
+        try:
+            stat = os.stat(real_path)
+        except OSError:
+            self.invalidate(real_path)
+            return None
+
+        if validators is not None and validators.mtime == stat.st_mtime and \
+                validators.size == stat.st_size:
+            validators.validated_at = now
+            return validators
+
+        return self._put(real_path, FileValidators(stat.st_mtime, stat.st_size))
+
+    def put_stat(self, real_path, stat):
+        """
+        Updates the validators of a file from a stat result the caller
+        already has (e.g after opening the file)
+        :rtype: FileValidators
+        """
+        validators = self._get_validators(real_path)
+        if validators is not None and validators.mtime == stat.st_mtime and \
+                validators.size == stat.st_size:
+            validators.validated_at = time.time()
+            return validators
+        return self._put(real_path, FileValidators(stat.st_mtime, stat.st_size))
+
+    def get_stats(self):
+        """
+        :rtype: dict
+        :return: The cache's counters
+        """
+        return {"hits": self._hits,
+                "misses": self._misses,
+                "entries": len(self._validators)}
+
+    def invalidate(self, real_path=None):
+        """
+        Removes the validators of a single file or of all of them
+        :return: None
+        """
+        with self._lock:
+            if real_path is None:
+                self._validators.clear()
+            else:
+                self._validators.pop(real_path, None)
+
+    def _get_validators(self, real_path):
+        """
+        :return: The validators of the file marked as the most recently
+                 used, or None if there are none
+        """
+        with self._lock:
+            validators = self._validators.pop(real_path, None)
+            if validators is not None:
+                self._validators[real_path] = validators
+            return validators
+
+    def _put(self, real_path, validators):
+        with self._lock:
+            self._validators.pop(real_path, None)
+            # evicts the least recently used files
+            while self._validators and len(self._validators) >= self._max_entries:
+                self._validators.popitem(last=False)
+            self._validators[real_path] = validators
+        return validators
+
+
+def _etag_matches(if_none_match, etag):
+    """
+    The weak comparison of RFC 7232, W/"x" matches "x"
+    :param if_none_match: The value of If-None-Match, a list of etags or *
+    """
+    if if_none_match.strip() == "*":
+        return True
+
+    etag = etag[2:] if etag.startswith("W/") else etag
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
@@ -0,0 +1,256 @@
+"""
+A load generator that drives a real HTTPServer over the loopback interface.
+The server runs in a process of its own and serves a temporary root of files
+of the given sizes. Every client is a process of its own as well (so the
+clients don't share an interpreter lock) that sends its requests one after
+the other, over a single persistent connection or a new connection per
+request, cycling through the files.
+The result is the throughput in requests per second and the p50/p99 latency
+of a request in milliseconds (from sending it to receiving the whole response).
+Usage:
+    python benchmarks/load.py [--engine event_loop] [--concurrency 8]
+                              [--requests 4000] [--no-keep-alive]
+                              [--file-sizes 1024,65536,1048576]
+"""
+import argparse
+import json
+import math
+import multiprocessing
+import os
+import shutil
+import socket
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import HTTPServer
+from server_constants import ENGINE_BLOCKING, ENGINE_THREADED, ENGINE_EVENT_LOOP
+
+
+DEFAULT_CONCURRENCY = 8
+DEFAULT_REQUESTS = 4000
+DEFAULT_FILE_SIZES = (1024, 65536, 1024 * 1024)
+# seconds the server has to start listening
+SERVER_START_TIMEOUT = 10.0
+RECV_SIZE = 65536
+HEAD_END = "\r\n\r\n"
+
+
+def _serve(root, port, engine, pool_size):
+    """
+    The server process
+    """
+    HTTPServer.DEBUG_LEVEL = -1
+    server = HTTPServer.HTTPServer(root, [], address=("127.0.0.1", port),
+                                   max_connections=pool_size + 64)
+    if engine == ENGINE_BLOCKING:
+        server.start_server()
+    elif engine == ENGINE_THREADED:
+        server.start_threaded_server(pool_size=pool_size)
+    else:
+        server.start_event_loop_server()
+
+
+def _get_free_port():
+    probe = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    try:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+    finally:
+        probe.close()
+
+
+def _wait_for_server(port, server_process):
+    """
+    may raise RuntimeError if the server didn't start
+    """
+    deadline = time.time() + SERVER_START_TIMEOUT
+    while time.time() < deadline:
+        if not server_process.is_alive():
+            raise RuntimeError("The server exited with {}".format(server_process.exitcode))
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return
+        except socket.error:
+            time.sleep(0.05)
+    raise RuntimeError("The server didn't start listening on {}".format(port))
+
+
+def _make_root(file_sizes):
+    """
+    :return: the path of a temporary root and the uris of its files
+    """
+    root = tempfile.mkdtemp(prefix="http-bench-")
+    uris = []
+    for size in file_sizes:
+        name = "file_{}.bin".format(size)
+        with open(os.path.join(root, name), "wb") as bench_file:
+            bench_file.write(os.urandom(size))
+        uris.append("/" + name)
+    return root, uris
+
+
+def _read_response(client, buffered):
+    """
+    Reads a single response with a Content-Length
+    :param buffered: data of the response that was already received
+    :return: the status code, True if the response has Connection: close
+             and the data received after the response
+    may raise socket.error, ValueError
+    """
+    while HEAD_END not in buffered:
+        data = client.recv(RECV_SIZE)
+        if not data:
+            raise socket.error("The connection was closed")
+        buffered += data
+
+    head_size = buffered.index(HEAD_END) + len(HEAD_END)
+    head = buffered[:head_size]
+    content_length = None
+    closing = False
+    for line in head.split("\r\n")[1:]:
+        name, _, value = line.partition(":")
+        name = name.strip().lower()
+        if name == "content-length":
+            content_length = int(value)
+        elif name == "connection":
+            closing = value.strip().lower() == "close"
+    if content_length is None:
+        raise ValueError("No Content-Length in {!r}".format(head))
+
+    left = content_length - (len(buffered) - head_size)
+    while left > 0:
+        data = client.recv(min(left, RECV_SIZE))
+        if not data:
+            raise socket.error("The connection was closed")
+        left -= len(data)
+    return int(head[9:12]), closing, buffered[head_size + content_length:]
+
+
+def _run_client(port, uris, requests, keep_alive, first_index, results):
+    """
+    A client process, puts a tuple of its latencies, errors, start time and
+    end time in results
+    """
+    connection_header = "keep-alive" if keep_alive else "close"
+    latencies = []
+    errors = 0
+    client = None
+    buffered = ""
+    started = time.time()
+    for index in xrange(first_index, first_index + requests):
+        request = "GET {} HTTP/1.1\r\nHost: 127.0.0.1\r\nConnection: {}\r\n\r\n".format(
+            uris[index % len(uris)], connection_header)
+        request_started = time.time()
+        try:
+            if client is None:
+                client = socket.create_connection(("127.0.0.1", port))
+                client.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                buffered = ""
+            client.sendall(request)
+            status, closing, buffered = _read_response(client, buffered)
+        except (socket.error, ValueError):
+            # a persistent connection the server closed without saying so
+            # is an error as well, it isn't hidden by sending the request again
+            status, closing = None, True
+        if status == 200:
+            latencies.append(time.time() - request_started)
+        else:
+            errors += 1
+        if (closing or not keep_alive) and client is not None:
+            client.close()
+            client = None
+    if client is not None:
+        client.close()
+    results.put((latencies, errors, started, time.time()))
+
+
+def _percentile(sorted_values, percent):
+    if not sorted_values:
+        return 0.0
+    index = int(math.ceil(percent / 100.0 * len(sorted_values))) - 1
+    return sorted_values[max(index, 0)]
+
+
+def run_load(engine=ENGINE_EVENT_LOOP, concurrency=DEFAULT_CONCURRENCY,
+             requests=DEFAULT_REQUESTS, keep_alive=True, file_sizes=DEFAULT_FILE_SIZES,
+             pool_size=None):
+    """
+    :param engine: ENGINE_BLOCKING, ENGINE_THREADED or ENGINE_EVENT_LOOP
+    :param concurrency: The number of clients
+    :param requests: The total number of requests, split between the clients
+    :param keep_alive: False if every request is sent on a new connection
+    :param file_sizes: The sizes of the files the requests cycle through
+    :param pool_size: The pool size of the threaded engine, concurrency
+                      if None so persistent connections don't wait
+    :rtype: dict
+    :return: the requests, errors, throughput (requests per second),
+             p50_ms, p99_ms and mean_ms of the run
+    may raise RuntimeError if the server didn't start
+    """
+    if engine not in (ENGINE_BLOCKING, ENGINE_THREADED, ENGINE_EVENT_LOOP):
+        raise ValueError("Unknown engine {}".format(engine))
+    root, uris = _make_root(file_sizes)
+    port = _get_free_port()
+    server_process = multiprocessing.Process(
+        target=_serve, args=(root, port, engine, pool_size or concurrency))
+    server_process.daemon = True
+    server_process.start()
+    try:
+        _wait_for_server(port, server_process)
+        results = multiprocessing.Queue()
+        clients = []
+        for client_index in xrange(concurrency):
+            client_requests = requests // concurrency + (client_index < requests % concurrency)
+            clients.append(multiprocessing.Process(
+                target=_run_client,
+                args=(port, uris, client_requests, keep_alive, client_index, results)))
+        for client in clients:
+            client.start()
+        # read before joining, a process doesn't exit before its queue is drained
+        outcomes = [results.get() for _ in clients]
+        for client in clients:
+            client.join()
+    finally:
+        server_process.terminate()
+        server_process.join()
+        shutil.rmtree(root, ignore_errors=True)
+
+    latencies = sorted(latency for outcome in outcomes for latency in outcome[0])
+    errors = sum(outcome[1] for outcome in outcomes)
+    elapsed = max(outcome[3] for outcome in outcomes) - min(outcome[2] for outcome in outcomes)
+    return {"requests": len(latencies),
+            "errors": errors,
+            "throughput": len(latencies) / elapsed if elapsed > 0 else 0.0,
+            "p50_ms": _percentile(latencies, 50) * 1000,
+            "p99_ms": _percentile(latencies, 99) * 1000,
+            "mean_ms": sum(latencies) / len(latencies) * 1000 if latencies else 0.0}
+
+
+def parse_file_sizes(value):
+    """
+    :param value: e.g "1024,65536"
+    :return: a tuple of the sizes
+    """
+    return tuple(int(size) for size in value.split(","))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--engine", default=ENGINE_EVENT_LOOP,
+                        choices=(ENGINE_BLOCKING, ENGINE_THREADED, ENGINE_EVENT_LOOP))
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY)
+    parser.add_argument("--requests", type=int, default=DEFAULT_REQUESTS)
+    parser.add_argument("--no-keep-alive", dest="keep_alive", action="store_false")
+    parser.add_argument("--file-sizes", type=parse_file_sizes, default=DEFAULT_FILE_SIZES)
+    parser.add_argument("--pool-size", type=int, default=None)
+    args = parser.parse_args()
+    result = run_load(args.engine, args.concurrency, args.requests, args.keep_alive,
+                      args.file_sizes, args.pool_size)
+    print json.dumps(result, indent=4, sort_keys=True)
+
+
+if __name__ == "__main__":
+    main()
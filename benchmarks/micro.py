@@ -0,0 +1,101 @@
+"""
+Microbenchmarks of the request pipeline.
+Every benchmark times a single call of one function with timeit, the result
+is the best of repeat runs (the least disturbed one) in microseconds per call.
+Unless number is given, every run makes as many calls as it takes to last
+MIN_RUN_TIME, a run of a few milliseconds is dominated by noise.
+Usage:
+    python benchmarks/micro.py [--repeat 5] [--number calls per run]
+"""
+import argparse
+import json
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import HTTPHeaders
+import HTTPParser
+import HTTPResponse
+import HTTPServer
+import HTTPValidation
+import public_response_functions
+
+
+DEFAULT_REPEAT = 5
+# seconds a run lasts at least when the number of calls is calibrated
+MIN_RUN_TIME = 0.2
+
+REQUEST = ("GET /static/images/logo.png?size=large&theme=dark HTTP/1.1\r\n"
+           "Host: localhost:8080\r\n"
+           "User-Agent: Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36\r\n"
+           "Accept: image/webp,image/apng,image/*,*/*;q=0.8\r\n"
+           "Accept-Encoding: gzip, deflate\r\n"
+           "Accept-Language: en-US,en;q=0.9\r\n"
+           "Connection: keep-alive\r\n"
+           "\r\n")
+HEADERS = REQUEST[REQUEST.find("\r\n") + 2:]
+
+
+def _build_response():
+    headers = HTTPHeaders.HTTPHeaders()
+    headers["Content-Type"] = "text/html"
+    headers["Content-Length"] = "1024"
+    headers["Connection"] = "keep-alive"
+    return HTTPResponse.HTTPResponse(status_code=200, phrase="OK", headers=headers,
+                                     data="x" * 1024)
+
+
+def get_benchmarks():
+    """
+    :return: a list of (name, function) tuples, each function makes a
+             single call of what is measured
+    """
+    headers = HTTPHeaders.HTTPHeaders(HEADERS)
+    response = _build_response()
+    return [("validate_request", lambda: HTTPValidation.validate_request(REQUEST)),
+            ("split_http_request", lambda: HTTPServer.split_http_request(REQUEST)),
+            ("parse_request", lambda: HTTPParser.parse_request(REQUEST)),
+            ("parse_headers", lambda: HTTPHeaders.HTTPHeaders(HEADERS)),
+            ("build_headers", headers.build_headers),
+            ("build_response", response.build_response),
+            ("get_rfc_822_time", public_response_functions.get_rfc_822_time)]
+
+
+def _calibrate(function):
+    """
+    :return: the number of calls that last at least MIN_RUN_TIME
+    """
+    number = 1
+    while True:
+        if timeit.timeit(function, number=number) >= MIN_RUN_TIME:
+            return number
+        number *= 2
+
+
+def run_microbenchmarks(repeat=DEFAULT_REPEAT, number=None):
+    """
+    :param repeat: The number of times every benchmark is run
+    :param number: The number of calls in a run, calibrated if None
+    :rtype: dict
+    :return: name: microseconds per call
+    """
+    results = {}
+    for name, function in get_benchmarks():
+        calls = number if number is not None else _calibrate(function)
+        best = min(timeit.repeat(function, repeat=repeat, number=calls))
+        results[name] = best / calls * 1e6
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT)
+    parser.add_argument("--number", type=int, default=None)
+    args = parser.parse_args()
+    print json.dumps(run_microbenchmarks(args.repeat, args.number), indent=4, sort_keys=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""
+Runs the microbenchmarks and the load scenarios and compares the results to
+a baseline, a result worse than the baseline by more than the threshold is
+flagged as a regression (and the exit code is 1).
+Usage:
+    python benchmarks/run_benchmarks.py [--threshold 0.25] [--baseline path]
+                                        [--save-baseline] [--micro-only]
+--save-baseline stores the results as the new baseline instead of comparing.
+The baseline only means something on the machine it was recorded on, record
+one before measuring a change (e.g on the commit before it).
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+
+import load
+import micro
+from server_constants import ENGINE_THREADED, ENGINE_EVENT_LOOP
+
+
+DEFAULT_BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                     "baseline.json")
+DEFAULT_THRESHOLD = 0.25
+# name: keyword arguments of load.run_load
+LOAD_SCENARIOS = (("event_loop_keep_alive", {"engine": ENGINE_EVENT_LOOP}),
+                  ("event_loop_close", {"engine": ENGINE_EVENT_LOOP, "keep_alive": False}),
+                  ("threaded_keep_alive", {"engine": ENGINE_THREADED}),
+                  ("threaded_small_files", {"engine": ENGINE_THREADED,
+                                            "file_sizes": (512, 4096)}))
+# the load metrics that are compared, all but throughput are better lower
+LOAD_METRICS = ("throughput", "p50_ms", "p99_ms", "errors")
+HIGHER_IS_BETTER = ("throughput",)
+# metrics where any increase is a regression, no matter the threshold
+EXACT_METRICS = ("errors",)
+
+
+def run_all(micro_only=False):
+    """
+    :rtype: dict
+    :return: result name: value, e.g "micro.parse_request" (microseconds
+             per call) or "load.threaded_keep_alive.p99_ms"
+    """
+    results = {}
+    for name, value in micro.run_microbenchmarks().iteritems():
+        results["micro." + name] = value
+    if micro_only:
+        return results
+
+    for scenario, arguments in LOAD_SCENARIOS:
+        outcome = load.run_load(**arguments)
+        for metric in LOAD_METRICS:
+            results["load.{}.{}".format(scenario, metric)] = outcome[metric]
+    return results
+
+
+def compare(results, baseline, threshold):
+    """
+    :param results: see run_all
+    :param baseline: results of a former run
+    :param threshold: The relative change that is flagged, e.g 0.25
+    :return: a list of (name, baseline value, value, relative change,
+             is_regression) tuples of the results that are in the baseline,
+             a positive change is an improvement
+    """
+    comparison = []
+    for name in sorted(results):
+        if name not in baseline:
+            continue
+        value, baseline_value = results[name], baseline[name]
+        metric = name.rsplit(".", 1)[-1]
+        if metric in EXACT_METRICS:
+            # e.g failed requests, there should be none
+            if value or baseline_value:
+                comparison.append((name, baseline_value, value, 0.0, value > baseline_value))
+            continue
+        if not baseline_value:
+            continue
+        change = (value - baseline_value) / float(baseline_value)
+        if metric not in HIGHER_IS_BETTER:
+            change = -change
+        comparison.append((name, baseline_value, value, change, change < -threshold))
+    return comparison
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--micro-only", action="store_true")
+    args = parser.parse_args()
+
+    results = run_all(args.micro_only)
+    if args.save_baseline:
+        with open(args.baseline, "wb") as baseline_file:
+            json.dump({"machine": platform.platform(),
+                       "python": platform.python_version(),
+                       "results": results}, baseline_file, indent=4, sort_keys=True)
+            baseline_file.write("\n")
+        print "Saved the baseline to {}".format(args.baseline)
+        return 0
+
+    try:
+        with open(args.baseline, "rb") as baseline_file:
+            baseline = json.load(baseline_file)
+    except (IOError, ValueError) as err:
+        print >> sys.stderr, "Couldn't read the baseline: {}".format(err)
+        return 2
+
+    regressions = 0
+    print "{:<42} {:>12} {:>12} {:>9}".format("benchmark", "baseline", "current", "change")
+    for name, baseline_value, value, change, is_regression in compare(
+            results, baseline["results"], args.threshold):
+        regressions += is_regression
+        print "{:<42} {:>12.3f} {:>12.3f} {:>+8.1%}{}".format(
+            name, baseline_value, value, change, "  REGRESSION" if is_regression else "")
+    if regressions:
+        print "{} regression(s) beyond {:.0%}".format(regressions, args.threshold)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,8 +2,11 @@
 contains functions that build general responses
 """
 
+import email.utils
+import time
 import HTTPResponse
 import HTTPHeaders
+import constants
 import server_constants
 
 
@@ -12,43 +15,180 @@ def get_error_response():
     builds a typical http internal error response
     :return: an http error response
     """
-    response = HTTPResponse.HTTPResponse(version=1.0, status_code=500,
-                                         phrase="Internal Error")
-    headers = HTTPHeaders.HTTPHeaders()
-    add_default_headers(headers)
-    headers["Content-Length"] = str(0)
-    headers["Connection"] = "close"
-    response.set_headers(headers)
+    return _get_rendered_response(500, "Internal Error")
+
+
+def get_request_too_large_response():
+    """
+    builds a response for requests whose line and headers are too long
+    :return: an http 431 response
+    """
+    return _get_rendered_response(431, "Request Header Fields Too Large")
+
 
-    return response.build_response()
+def get_request_timeout_response():
+    """
+    builds a response for clients that didn't send a whole request line
+    and headers in time
+    :return: an http 408 response
+    """
+    return _get_rendered_response(408, "Request Timeout")
 
 
-def add_default_headers(headers):
+def get_service_unavailable_response():
+    """
+    builds the response sent to clients the server has no room for
+    :return: an http 503 response asking the client to retry later
+    """
+    return _get_rendered_response(503, "Service Unavailable",
+                                  (("Retry-After", str(server_constants.RETRY_AFTER)),))
+
+
+# (status code, phrase, extra headers): serialized headers without Date
+_rendered_responses = {}
+
+
+def _get_rendered_response(status_code, phrase, extra_headers=()):
+    """
+    Returns an empty response that closes the connection, the headers are
+    serialized on the first call and reused afterwards.
+    :type extra_headers: tuple
+    :param extra_headers: (name, value) tuples of headers to add
+    :return: The response with an up to date Date header
+    """
+    key = (status_code, phrase, extra_headers)
+    template = _rendered_responses.get(key)
+    if template is None:
+        headers = HTTPHeaders.HTTPHeaders()
+        add_default_headers(headers, include_date=False)
+        headers.update(extra_headers)
+        headers["Content-Length"] = str(0)
+        headers["Connection"] = "close"
+        template = build_response_template(status_code, phrase, headers)
+        _rendered_responses[key] = template
+
+    return template + get_date_header_line()
+
+
+def build_response_template(status_code, phrase, headers):
+    """
+    Serializes the status line and headers of a response whose headers
+    don't change between requests except for the Date header. The result
+    should be followed by get_date_header_line() and the body.
+    :type status_code: int
+    :type phrase: str
+    :type headers: HTTPHeaders.HTTPHeaders
+    :param headers: should not contain the Date header
+    :rtype: str
+    """
+    response = HTTPResponse.HTTPResponse(version=server_constants.HTTP_VERSION,
+                                         status_code=status_code,
+                                         phrase=phrase, headers=headers)
+    # drop the empty line ending the headers, the Date header comes first
+    return response.build_response()[:-len(constants.CRLF)]
+
+
+def add_default_headers(headers, include_date=True):
     """
     The following headers are usually added to an http message
     so this function adds them to a headers object instead of adding
     them manually in the code
+    The Connection header isn't added, it depends on the request (see
+    get_date_header_line)
     :param headers: The headers will be added to this argument
+    :param include_date: if False the Date header isn't added, responses
+                         that are cached add it with get_date_header_line
     :return: None
     """
     headers["Allow"] = ", ".join(server_constants.SUPPORTED_METHODS)
-    headers["Connection"] = "keep-alive"
-    headers["Date"] = get_rfc_822_time()
+    if include_date:
+        headers["Date"] = get_rfc_822_time()
+
+
+def get_date_header_line(connection=None):
+    """
+    :type connection: str
+    :param connection: if given a Connection header with that value
+                       ("close" or "keep-alive") follows the Date header
+    :return: The Date header followed by the empty line ending the headers
+    """
+    now = int(time.time())
+    cached = _date_header_lines.get(connection)
+    if cached is not None and cached[0] == now:
+        return cached[1]
+
+    line = "Date: " + get_rfc_822_time() + constants.CRLF
+    if connection:
+        line += "Connection: " + connection + constants.CRLF
+    line += constants.CRLF
+    _date_header_lines[connection] = (now, line)
+    return line
+
+
+def encode_chunk(data):
+    """
+    :param data: a part of a body sent with Transfer-Encoding: chunked,
+                 must not be empty
+    :return: The chunk, its size in hex, the data and CRLF
+    """
+    return "{:x}{}{}{}".format(len(data), constants.CRLF, data, constants.CRLF)
+
+
+_WEEKDAYS = ("Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun")
+_MONTHS = ("Jan", "Feb", "Mar", "Apr", "May", "Jun",
+           "Jul", "Aug", "Sep", "Oct", "Nov", "Dec")
+
+# (second, formatted value), replaced as a whole so readers from other
+# threads always see a matching pair
+_current_date = (None, "")
+# Connection header value: (second, line)
+_date_header_lines = {}
+# ends a body sent with Transfer-Encoding: chunked
+LAST_CHUNK = "0" + constants.CRLF * 2
+
+
+def format_http_date(timestamp):
+    """
+    :param timestamp: seconds since the epoch
+    :return: The time in the IMF-fixdate format of RFC 7231
+             e.g "Sun, 06 Nov 1994 08:49:37 GMT". The names are not taken
+             from the locale, so the result is the same on every machine.
+    """
+    t = time.gmtime(timestamp)
+    return "{}, {:02d} {} {:04d} {:02d}:{:02d}:{:02d} GMT".format(
+        _WEEKDAYS[t.tm_wday], t.tm_mday, _MONTHS[t.tm_mon - 1], t.tm_year,
+        t.tm_hour, t.tm_min, t.tm_sec)
+
+
+def parse_http_date(value):
+    """
+    Parses the value of a date header (e.g If-Modified-Since), the three
+    formats allowed by RFC 7231 are accepted
+    :type value: str
+    :return: seconds since the epoch, or None if the value isn't a valid date
+    """
+    parsed = email.utils.parsedate_tz(value)
+    if parsed is None:
+        return None
+    try:
+        return int(email.utils.mktime_tz(parsed))
+    except (OverflowError, ValueError):
+        return None
 
 
 def get_rfc_822_time():
     """
-    :return: an rfc 822 compliant datetime string
+    The value is formatted at most once a second and shared by all
+    the responses sent during that second.
+    :return: The current time as an rfc 822 (RFC 7231 IMF-fixdate) string
     """
-    from datetime import datetime
-    from time import gmtime, strftime
-    dt = datetime.now()
-    today = dt.strftime("%A")[:3]
-    month = dt.strftime("%B")[:3]
-    time = dt.strftime("%H:%M:%S")
-    tz = strftime("%Z", gmtime())
-    return "{}, {} {} {} {} {}".format(today, dt.strftime("%d"), month,
-                                       dt.strftime("%Y"), time, tz)
+    global _current_date
+    now = int(time.time())
+    cached_second, value = _current_date
+    if cached_second != now:
+        value = format_http_date(now)
+        _current_date = (now, value)
+    return value
 
 
 def get_500_response(message):
@@ -66,5 +206,6 @@ def get_500_response(message):
     headers["Content-Length"] = str(len(message))
     headers["Content-Type"] = "text/plain"
 
-    return HTTPResponse.HTTPResponse(version=1.0, status_code=500, phrase="Internal Error",
+    return HTTPResponse.HTTPResponse(version=server_constants.HTTP_VERSION, status_code=500,
+                                     phrase="Internal Error",
                                      headers=headers, data=message)
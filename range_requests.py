@@ -0,0 +1,157 @@
+"""
+contains functions that handle byte range requests (RFC 7233)
+Only the bytes unit is supported. A Range header that can't be parsed, or
+whose If-Range doesn't match the current version of the file, is ignored and
+the whole file is sent, as the RFC requires.
+"""
+import binascii
+import os
+import constants
+import HTTPHeaders
+import public_response_functions
+from server_constants import MAX_RANGES
+
+
+BYTES_UNIT = "bytes="
+
+
+class RangeNotSatisfiableError(ValueError):
+    """
+    Raised when none of the requested ranges overlaps the file
+    """
+    pass
+
+
+def get_ranges(request_headers, size, validators):
+    """
+    :type request_headers: HTTPHeaders.HTTPHeaders
+    :param size: The size of the requested file
+    :type validators: ValidatorCache.FileValidators
+    :param validators: The validators of the file, used for If-Range
+    :return: a sorted list of (first byte, last byte) tuples that don't
+             overlap, or None if the whole file should be sent
+    may raise RangeNotSatisfiableError
+    """
+    range_header = request_headers.get("Range")
+    if range_header is None:
+        return None
+
+    if_range = request_headers.get("If-Range")
+    if if_range is not None and not _if_range_matches(if_range, validators):
+        return None
+
+    return parse_range_header(range_header, size)
+
+
+def parse_range_header(value, size):
+    """
+    :param value: The value of a Range header e.g "bytes=0-99,-500"
+    :param size: The size of the requested file
+    :return: a sorted list of (first byte, last byte) tuples, overlapping and
+             adjacent ranges are merged. None if the header is invalid or
+             has too many ranges.
+    may raise RangeNotSatisfiableError
+    """
+    if not value.startswith(BYTES_UNIT):
+        return None
+
+    specs = value[len(BYTES_UNIT):].split(",")
+    if len(specs) > MAX_RANGES:
+        return None
+
+    ranges = []
+    for spec in specs:
+        first, dash, last = spec.strip().partition("-")
+        if not dash:
+            return None
+        try:
+            if first == "":
+                # a suffix range, the last bytes of the file
+                suffix_length = int(last)
+                if suffix_length == 0:
+                    continue
+                first, last = max(size - suffix_length, 0), size - 1
+            else:
+                first = int(first)
+                last = int(last) if last != "" else max(first, size - 1)
+        except ValueError:
+            return None
+
+        if first < 0 or last < first:
+            return None
+        # a range that starts after the end of the file is unsatisfiable
+        if first >= size:
+            continue
+        ranges.append((first, min(last, size - 1)))
+
+    if not ranges:
+        raise RangeNotSatisfiableError("No range overlaps {} bytes".format(size))
+
+    ranges.sort()
+    merged = [ranges[0]]
+    for first, last in ranges[1:]:
+        previous_first, previous_last = merged[-1]
+        if first <= previous_last + 1:
+            merged[-1] = (previous_first, max(previous_last, last))
+        else:
+            merged.append((first, last))
+    return merged
+
+
+def get_content_range(first, last, size):
+    """
+    :return: The value of a Content-Range header e.g "bytes 0-99/1000"
+    """
+    return "bytes {}-{}/{}".format(first, last, size)
+
+
+def build_multipart_parts(ranges, size, content_type):
+    """
+    Builds the delimiters of a multipart/byteranges body
+    :param ranges: a list of (first byte, last byte) tuples
+    :param size: The size of the file
+    :param content_type: The Content-Type of the file
+    :return: a tuple of the response's Content-Type, a list of the headers
+             preceding every part, the closing delimiter and the length of the
+             whole body
+    """
+    boundary = binascii.hexlify(os.urandom(12))
+    part_headers = []
+    body_length = 0
+    for first, last in ranges:
+        part_header = "{0}--{1}{0}Content-Type: {2}{0}Content-Range: {3}{0}{0}".format(
+            constants.CRLF, boundary, content_type, get_content_range(first, last, size))
+        part_headers.append(part_header)
+        body_length += len(part_header) + last - first + 1
+
+    trailer = "{0}--{1}--{0}".format(constants.CRLF, boundary)
+    body_length += len(trailer)
+    return ("multipart/byteranges; boundary=" + boundary, part_headers,
+            trailer, body_length)
+
+
+def get_range_not_satisfiable_response(size, connection=None):
+    """
+    :param size: The size of the requested file
+    :param connection: The value of the Connection header, if any
+    :return: a 416 response telling the client the size of the file
+    """
+    headers = HTTPHeaders.HTTPHeaders()
+    public_response_functions.add_default_headers(headers, include_date=False)
+    headers["Content-Range"] = "bytes */{}".format(size)
+    headers["Content-Length"] = "0"
+    return public_response_functions.build_response_template(
+        416, "Range Not Satisfiable", headers) + \
+        public_response_functions.get_date_header_line(connection)
+
+
+def _if_range_matches(if_range, validators):
+    """
+    If-Range holds either an etag, compared strongly, or a date that must
+    be exactly the file's Last-Modified
+    """
+    if validators is None:
+        return False
+    if if_range.startswith('"') or if_range.startswith("W/"):
+        return not if_range.startswith("W/") and if_range == validators.etag
+    return if_range == validators.last_modified
@@ -4,11 +4,127 @@ Other files may also use these constants e.g public_response_functions.py
 """
 
 
-__all__ = ["SUPPORTED_METHODS", "NOT_FOUND", "RESTRICTED_HTML_PAGE"]
+__all__ = ["SUPPORTED_METHODS", "NOT_FOUND", "RESTRICTED_HTML_PAGE",
+           "DEFAULT_POOL_SIZE", "DEFAULT_QUEUE_SIZE", "RECV_BUFFER_SIZE",
+           "LISTEN_BACKLOG", "ENGINE_BLOCKING", "ENGINE_THREADED",
+           "ENGINE_EVENT_LOOP", "DEFAULT_WORKERS", "MAX_REQUEST_HEAD_SIZE",
+           "FILE_CHUNK_SIZE", "STATIC_CACHE_SIZE", "STATIC_CACHE_MAX_ENTRY_SIZE",
+           "STATIC_CACHE_REVALIDATE_INTERVAL", "ERROR_PAGE_RECHECK_INTERVAL",
+           "GATHER_COPY_THRESHOLD", "INDEX_PAGE", "PATH_CACHE_SIZE",
+           "PATH_CACHE_MAX_AGE", "MANIFEST_POLL_INTERVAL", "DEFAULT_CONTENT_TYPE",
+           "VALIDATOR_CACHE_SIZE", "MAX_RANGES", "COMPRESSION_CACHE_SIZE",
+           "COMPRESSION_MIN_SIZE", "COMPRESSION_MAX_SIZE", "COMPRESSION_LEVEL",
+           "COMPRESSIBLE_TYPES", "HTTP_VERSION", "MAX_KEEP_ALIVE_REQUESTS",
+           "MAX_REQUEST_LINE_SIZE", "MAX_HEADER_LINE_SIZE", "MAX_HEADERS_COUNT",
+           "RESPONSE_CACHE_SIZE", "MAX_CONNECTIONS", "IDLE_TIMEOUT",
+           "KEEP_ALIVE_TIMEOUT", "HEADER_TIMEOUT", "IO_TIMEOUT", "RETRY_AFTER",
+           "TIMEOUT_CHECK_INTERVAL", "LATENCY_BUCKETS", "PROFILE_SAMPLE_EVERY",
+           "PROFILE_DUMP_EVERY", "PROFILE_OUTPUT_PATH", "ACCESS_LOG_PATH",
+           "ACCESS_LOG_BUFFER_SIZE", "ACCESS_LOG_FLUSH_INTERVAL", "ACCESS_LOG_MAX_SIZE",
+           "ACCESS_LOG_BACKUP_COUNT"]
 
 
+# The version of the responses the server sends
+HTTP_VERSION = 1.1
 # The methods the server supports at the moment
 SUPPORTED_METHODS = ["GET"]
 # Not Found HTML file name, must be in root
 NOT_FOUND = "not_found.html"
 RESTRICTED_HTML_PAGE = "restricted.html"
+# The page served for the uri /
+INDEX_PAGE = "index.html"
+# Number of worker threads used by HTTPServer.start_threaded_server
+DEFAULT_POOL_SIZE = 16
+# Number of accepted connections that may wait for a free worker
+DEFAULT_QUEUE_SIZE = 64
+# Maximal amount of bytes read from a client socket at once
+RECV_BUFFER_SIZE = 8192
+# Maximal size of a request line and headers, larger requests are refused
+MAX_REQUEST_HEAD_SIZE = 16384
+# Limits enforced by HTTPParser on every request
+MAX_REQUEST_LINE_SIZE = 8192
+MAX_HEADER_LINE_SIZE = 8192
+MAX_HEADERS_COUNT = 100
+# Number of connections the kernel queues before they're accepted
+LISTEN_BACKLOG = 128
+# The engines a prefork worker may run
+ENGINE_BLOCKING = "blocking"
+ENGINE_THREADED = "threaded"
+ENGINE_EVENT_LOOP = "event_loop"
+# Number of processes forked by HTTPServer.start_prefork_server
+DEFAULT_WORKERS = 4
+# Size of the chunks files are sent in when sendfile isn't available
+FILE_CHUNK_SIZE = 65536
+# Maximal number of bytes of static files kept in memory
+STATIC_CACHE_SIZE = 64 * 1024 * 1024
+# Larger files are always streamed from the disk
+STATIC_CACHE_MAX_ENTRY_SIZE = 1024 * 1024
+# Seconds a cached file is served before its mtime is checked again
+STATIC_CACHE_REVALIDATE_INTERVAL = 1.0
+# Seconds between checks of the files error pages are read from
+ERROR_PAGE_RECHECK_INTERVAL = 1.0
+# Responses up to that size are joined into a single string before being
+# sent, larger ones are sent buffer by buffer
+GATHER_COPY_THRESHOLD = 16384
+# Maximal number of uris whose resolved path is remembered
+PATH_CACHE_SIZE = 4096
+# Seconds a resolved path is trusted before the file system is checked again
+PATH_CACHE_MAX_AGE = 1.0
+# Seconds between two scans of the root by the manifest watcher
+MANIFEST_POLL_INTERVAL = 2.0
+# Content-Type of files whose MIME type can't be guessed
+DEFAULT_CONTENT_TYPE = "application/octet-stream"
+# Maximal number of files whose ETag and Last-Modified are kept in memory
+VALIDATOR_CACHE_SIZE = 4096
+# Requests for more byte ranges than that get the whole file
+MAX_RANGES = 16
+# Maximal number of bytes of compressed variants of static files kept in memory
+COMPRESSION_CACHE_SIZE = 16 * 1024 * 1024
+# Smaller files are never compressed, the headers would outweigh the gain
+COMPRESSION_MIN_SIZE = 1024
+# Larger files are compressed only if a precompressed sibling exists
+COMPRESSION_MAX_SIZE = 1024 * 1024
+# zlib compression level used for gzip
+COMPRESSION_LEVEL = 6
+# Compressible types besides text/*, other types are usually compressed already
+COMPRESSIBLE_TYPES = ["application/javascript", "application/json", "application/xml",
+                      "application/xhtml+xml", "application/rss+xml", "image/svg+xml",
+                      "application/wasm", "font/ttf", "font/otf"]
+# Number of requests served on a connection before it is closed
+MAX_KEEP_ALIVE_REQUESTS = 1000
+# Maximal total size in bytes of the cached responses of server functions
+RESPONSE_CACHE_SIZE = 8 * 1024 * 1024
+# Maximal number of open client connections (per process), further clients
+# get a 503 response
+MAX_CONNECTIONS = 1024
+# Seconds a new connection may wait before it starts sending a request
+IDLE_TIMEOUT = 10.0
+# Seconds a persistent connection may wait for its next request
+KEEP_ALIVE_TIMEOUT = 5.0
+# Seconds a client has to send a whole request line and headers once it started
+HEADER_TIMEOUT = 10.0
+# Seconds a read or a write on a client socket may make no progress
+IO_TIMEOUT = 30.0
+# Seconds a client rejected with 503 is asked to wait (Retry-After)
+RETRY_AFTER = 1
+# Seconds between two checks of the event loop for connections that timed out
+TIMEOUT_CHECK_INTERVAL = 0.5
+# Upper bounds in seconds of the buckets of the latency histograms (Metrics.py)
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25,
+                   0.5, 1.0, 2.5, 5.0, 10.0)
+# One request out of this many is profiled once profiling is enabled
+PROFILE_SAMPLE_EVERY = 100
+# Number of profiled requests between two dumps of the aggregated profile
+PROFILE_DUMP_EVERY = 10
+# The aggregated profile (pstats) file, {pid} is the id of the process
+PROFILE_OUTPUT_PATH = "server-{pid}.pstats"
+# The access log file, {pid} is the id of the process
+ACCESS_LOG_PATH = "access.log"
+# Number of access log records buffered in memory, further records are dropped
+ACCESS_LOG_BUFFER_SIZE = 8192
+# Seconds between two writes of the buffered access log records
+ACCESS_LOG_FLUSH_INTERVAL = 1.0
+# Size in bytes the access log is rotated at
+ACCESS_LOG_MAX_SIZE = 64 * 1024 * 1024
+# Number of rotated access log files kept
+ACCESS_LOG_BACKUP_COUNT = 5
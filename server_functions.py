@@ -6,6 +6,13 @@ All the functions will generate an appropriate HTTPResponse and should also retu
 a flag that will signify to the server if the connection should be closed.
 The server calling code expects a tuple of the following form: (response, flag),
 so keep that in mind when writing functions in this file.
+The data of the response may be a generator (or any iterator) of strings
+instead of a string, e.g for large or slowly produced outputs. The body is then
+sent chunk by chunk as it is produced, with Transfer-Encoding: chunked unless
+the function sets Content-Length. Generators shouldn't block for long, with the
+event loop engine they run on the thread that serves all the clients.
+The responses of an expensive function may be cached for a while with the
+cached decorator (applied below route), see ResponseCache.py.
 Unused/Unknown parameters will be ignored.
 The following example represents a uri that utilizes the function say_hello:
 /say_hello?name=Michael
@@ -14,15 +21,30 @@ all the empty parameters will be ignored as well as the foo parameter since
 the function say_hello doesn't use it. However, in case the user forgot to add the parameter name
 an error response will be returned and the connection will be closed.
 
+A function is exposed with the route decorator, which takes the path and the
+methods it answers to. A path may contain {name} components, their values are
+added to the function's parameters e.g @route("/users/{id}") passes id.
+
 AVAILABLE_FUNCTIONS is a dictionary where the keys are the functions name and
 the values are the functions, again the caller expects that so don't screw up
-the structure. All the functions that should be used by the client are in this dictionary.
+the structure. A function in it that has no route is served at /<name> for GET.
 """
 import HTTPResponse
 import public_response_functions
 import HTTPHeaders
+import Metrics
+import ResponseCache
+import Router
+from server_constants import HTTP_VERSION
+
+
+ROUTER = Router.Router()
+route = ROUTER.route
+RESPONSE_CACHE = ResponseCache.ResponseCache()
+cached = RESPONSE_CACHE.cached
 
 
+@route("/say_hello")
 def say_hello(request_parameters):
     """
     :type request_parameters: dict
@@ -38,7 +60,7 @@ def say_hello(request_parameters):
                                                           " missing".format(name_param)), False
 
     hello_string = "Hello {}".format(request_parameters[name_param])
-    response = HTTPResponse.HTTPResponse(version=1.0, status_code=200, phrase="OK",
+    response = HTTPResponse.HTTPResponse(version=HTTP_VERSION, status_code=200, phrase="OK",
                                          data=hello_string)
     headers = HTTPHeaders.HTTPHeaders()
     public_response_functions.add_default_headers(headers)
@@ -48,4 +70,47 @@ def say_hello(request_parameters):
 
     return response, True
 
-AVAILABLE_FUNCTIONS = {"say_hello": say_hello}
+
+def server_status(request_parameters):
+    """
+    Reports the server's metrics (see Metrics.py) as JSON, or in the
+    Prometheus text format if the parameter format is prometheus
+    e.g /server-status?format=prometheus
+    :type request_parameters: dict
+    :rtype: tuple
+    :return: A tuple of the response and True, the connection may stay open
+    """
+    if request_parameters.get("format") == "prometheus":
+        body = Metrics.REGISTRY.to_prometheus()
+        content_type = Metrics.PROMETHEUS_CONTENT_TYPE
+    else:
+        body = Metrics.REGISTRY.to_json()
+        content_type = "application/json"
+
+    response = HTTPResponse.HTTPResponse(version=HTTP_VERSION, status_code=200, phrase="OK",
+                                         data=body)
+    headers = HTTPHeaders.HTTPHeaders()
+    public_response_functions.add_default_headers(headers)
+    headers["Content-Length"] = str(len(body))
+    headers["Content-Type"] = content_type
+    headers["Cache-Control"] = "no-store"
+    response.set_headers(headers)
+
+    return response, True
+
+AVAILABLE_FUNCTIONS = {"say_hello": say_hello, "server-status": server_status}
+
+
+def get_router():
+    """
+    :rtype: Router.Router
+    :return: ROUTER compiled, including the functions of AVAILABLE_FUNCTIONS
+             that weren't routed with the decorator
+    may raise Router.RouteError
+    """
+    for name, function in AVAILABLE_FUNCTIONS.iteritems():
+        pattern = Router.PATH_SEPARATOR + name
+        if not any(ROUTER.has_route(pattern, method) for method in Router.DEFAULT_METHODS):
+            ROUTER.add_route(pattern, function)
+    ROUTER.compile()
+    return ROUTER